@@ -8,11 +8,22 @@ from langchain_community.document_loaders import PyPDFLoader
 load_dotenv()
 
 from data import samples_to_split as samples
-from src.builder import AudiobookBuilder
-from src.config import FILE_SIZE_MAX, MAX_TEXT_LEN, logger
+from src.config import (
+    FILE_SIZE_MAX,
+    JOB_WORKER_MAX_CONCURRENT_JOBS,
+    JOB_WORKERS_NUM,
+    MAX_TEXT_LEN,
+    logger,
+)
+from src.jobs import JobParams, JobQueue, start_worker_pool
+from src.web.constructor import HTMLGenerator
 from src.web.utils import create_status_html
 from src.web.variables import DESCRIPTION_JS, GRADIO_THEME, STATUS_DISPLAY_HTML, VOICE_UPLOAD_JS
 
+JOB_QUEUE = JobQueue()
+# NOTE: audiobooks are generated by job workers, the app only renders status messages
+HTML_GENERATOR = HTMLGenerator()
+
 
 def get_auth_params():
     user = os.environ["AUTH_USER"]
@@ -50,9 +61,8 @@ async def audiobook_builder(
     generate_effects: bool,
     use_user_voice: bool,
     voice_id: str | None = None,
+    series_id: str | None = None,
 ):
-    builder = AudiobookBuilder()
-
     if uploaded_file is not None:
         try:
             text = load_text_from_file(uploaded_file=uploaded_file)
@@ -60,14 +70,14 @@ async def audiobook_builder(
             logger.exception(e)
             msg = "Failed to load text from the provided document"
             gr.Warning(msg)
-            yield None, str(e), builder.html_generator.generate_error(msg)
+            yield None, str(e), HTML_GENERATOR.generate_error(msg), None
             return
 
     if not text:
         logger.info(f"No text was passed. can't generate an audiobook")
         msg = 'Please provide the text to generate audiobook from'
         gr.Warning(msg)
-        yield None, "", builder.html_generator.generate_error(msg)
+        yield None, "", HTML_GENERATOR.generate_error(msg), None
         return
 
     if (text_len := len(text)) > MAX_TEXT_LEN:
@@ -78,11 +88,27 @@ async def audiobook_builder(
         )
         logger.info(msg)
         gr.Warning(msg)
-        yield None, "", builder.html_generator.generate_error(msg)
+        yield None, "", HTML_GENERATOR.generate_error(msg), None
         return
 
-    async for stage in builder.run(text, generate_effects, use_user_voice, voice_id):
-        yield stage
+    # NOTE: audiobook is generated by a worker process
+    job_id = JOB_QUEUE.submit(
+        JobParams(
+            text=text,
+            generate_effects=generate_effects,
+            use_user_voice=use_user_voice,
+            voice_id=voice_id,
+            series_id=(series_id or '').strip() or None,
+        )
+    )
+    try:
+        async for final_audio_fp, error_text, html, audio_chunk_fp in JOB_QUEUE.iter_events(job_id):
+            # NOTE: audio chunk events don't contain status html, the displayed one is kept
+            yield final_audio_fp, error_text, gr.update() if html is None else html, audio_chunk_fp
+    finally:
+        # NOTE: if the request is cancelled ("Refresh" is clicked or the browser tab is closed),
+        # job is cancelled too, so that it doesn't waste API quota. no-op for finished jobs
+        JOB_QUEUE.cancel(job_id)
 
 
 def refresh():
@@ -129,6 +155,12 @@ with gr.Blocks(js=DESCRIPTION_JS, theme=GRADIO_THEME) as ui:
         info="Select if you want to use your voice for whole or part of the audiobook (Generations may take longer than usual)",
     )
 
+    series_id_input = gr.Textbox(
+        label="Book or series name (optional)",
+        info="Characters keep their voices across all texts generated with the same name",
+        max_lines=1,
+    )
+
     submit_button = gr.Button("Generate the audiobook", variant="primary")
 
     with gr.Row(variant="panel"):
@@ -137,6 +169,11 @@ with gr.Blocks(js=DESCRIPTION_JS, theme=GRADIO_THEME) as ui:
 
     voice_result = gr.Textbox(visible=False, interactive=False, label="Processed Result")
     status_display = gr.HTML(value=STATUS_DISPLAY_HTML, label="Generation Status")
+    audio_preview = gr.Audio(
+        label="Audio preview. Starts playing while the rest of the audiobook is being generated",
+        streaming=True,
+        autoplay=True,
+    )
     audio_output = gr.Audio(
         label='Generated audio. Please wait for the waveform to appear, before hitting "Play"',
         type="filepath",
@@ -145,7 +182,7 @@ with gr.Blocks(js=DESCRIPTION_JS, theme=GRADIO_THEME) as ui:
     # callbacks
 
     add_voice_btn.click(fn=None, inputs=None, outputs=voice_result, js=VOICE_UPLOAD_JS)
-    submit_button.click(
+    submit_event = submit_button.click(
         fn=audiobook_builder,
         inputs=[
             text_input,
@@ -153,16 +190,19 @@ with gr.Blocks(js=DESCRIPTION_JS, theme=GRADIO_THEME) as ui:
             effects_generation_checkbox,
             use_voice_checkbox,
             voice_result,
+            series_id_input,
         ],  # Include the uploaded file as an input
         outputs=[
             audio_output,
             error_output,
             status_display,
-        ],  # Include the audio output and error message output
+            audio_preview,
+        ],  # Include the audio output, error message output and streamed audio preview
     )
     refresh_button.click(
         fn=refresh,
         inputs=[],
+        cancels=[submit_event],
         outputs=[
             audio_output,
             error_output,
@@ -185,4 +225,7 @@ with gr.Blocks(js=DESCRIPTION_JS, theme=GRADIO_THEME) as ui:
         outputs=error_output,
     )
 
-ui.launch(auth=get_auth_params())
+if __name__ == "__main__":
+    # NOTE: workers could also be run separately, see `scripts/run_job_workers.py`
+    start_worker_pool(n_workers=JOB_WORKERS_NUM, max_concurrent_jobs=JOB_WORKER_MAX_CONCURRENT_JOBS)
+    ui.launch(auth=get_auth_params())
@@ -0,0 +1,102 @@
+import logging
+import time
+
+import click
+import numpy as np
+from dotenv import load_dotenv
+from pydub import AudioSegment
+
+load_dotenv()
+
+from src import audio
+from src.audio import AudioBuffer
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s (%(filename)s): %(message)s",
+)
+logger = logging.getLogger("benchmark-concatenation")
+
+
+def make_phrases(n_phrases: int, phrase_sec: float, sample_rate: int) -> list[AudioBuffer]:
+    rng = np.random.default_rng(seed=0)
+    n_frames = int(phrase_sec * sample_rate)
+    return [
+        AudioBuffer(rng.uniform(-0.5, 0.5, n_frames).astype(np.float32), sample_rate)
+        for _ in range(n_phrases)
+    ]
+
+
+def concatenate_pydub(phrases: list[AudioBuffer]) -> AudioSegment:
+    """Previous implementation: each `+=` copies the whole accumulated audio."""
+    segments = [
+        AudioSegment(
+            data=p.to_pcm_bytes(),
+            sample_width=AudioBuffer.SAMPLE_WIDTH,
+            frame_rate=p.sample_rate,
+            channels=p.n_channels,
+        )
+        for p in phrases
+    ]
+    concat = segments[0]
+    for segment in segments[1:]:
+        concat += segment
+    return concat
+
+
+def timeit(f, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    f(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option(
+    "-n", "--n-phrases", multiple=True, type=int, default=[10, 50, 100, 250, 500, 1000, 2000]
+)
+@click.option("--phrase-sec", type=float, default=0.5)
+@click.option("--sample-rate", type=int, default=22050)
+@click.option("--pause-sec", type=float, default=0.2)
+@click.option(
+    "--pydub-max-phrases",
+    type=int,
+    default=500,
+    help="pydub baseline is quadratic, skip it for larger inputs",
+)
+def main(
+    *,
+    n_phrases: list[int],
+    phrase_sec: float,
+    sample_rate: int,
+    pause_sec: float,
+    pydub_max_phrases: int,
+) -> None:
+    rows = []
+    for n in n_phrases:
+        phrases = make_phrases(n_phrases=n, phrase_sec=phrase_sec, sample_rate=sample_rate)
+
+        t_numpy = timeit(audio.concatenate, phrases, pause_sec=pause_sec)
+        t_pydub = timeit(concatenate_pydub, phrases) if n <= pydub_max_phrases else None
+        rows.append((n, t_numpy, t_pydub))
+
+        logger.info(f"{n} phrases: numpy={t_numpy:.4f}s, pydub={t_pydub}")
+
+    header = " | ".join(
+        [f"{'phrases':>8}", f"{'numpy, s':>10}", f"{'ms/phrase':>10}"]
+        + [f"{'pydub, s':>10}", f"{'ms/phrase':>10}"]
+    )
+    lines = [header, "-" * len(header)]
+    for n, t_numpy, t_pydub in rows:
+        pydub_cols = (
+            f"{t_pydub:>10.4f} | {1000 * t_pydub / n:>10.3f}"
+            if t_pydub is not None
+            else f"{'-':>10} | {'-':>10}"
+        )
+        lines.append(f"{n:>8} | {t_numpy:>10.4f} | {1000 * t_numpy / n:>10.3f} | {pydub_cols}")
+
+    # linear scaling shows up as constant time per phrase
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()
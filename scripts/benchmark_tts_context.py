@@ -0,0 +1,97 @@
+import logging
+import random
+import time
+
+import click
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src import tts_context
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s (%(filename)s): %(message)s",
+)
+logger = logging.getLogger("benchmark-tts-context")
+
+WORDS = "the a old man said to her and then quietly walked away from house door night".split()
+
+
+def make_phrases(n_phrases: int, max_words: int) -> list[str]:
+    rng = random.Random(0)
+    return [
+        " ".join(rng.choices(WORDS, k=rng.randint(1, max_words))) + rng.choice([" ", "\n\n"])
+        for _ in range(n_phrases)
+    ]
+
+
+def get_contexts_quadratic(texts: list[str], max_len: int) -> list[tuple[str, str]]:
+    """Previous implementation: rescans neighbours of every phrase, prepending to the string."""
+    contexts = []
+    for i in range(len(texts)):
+        left_text, right_text = "", ""
+        for j in range(i - 1, -1, -1):
+            if len(left_text) + len(texts[j]) < max_len:
+                left_text = texts[j] + left_text
+            else:
+                break
+        for text in texts[i + 1 :]:
+            if len(right_text) + len(text) < max_len:
+                right_text += text
+            else:
+                break
+        contexts.append((left_text, right_text))
+    return contexts
+
+
+def timeit(f, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    f(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option("-n", "--n-phrases", multiple=True, type=int, default=[100, 1000, 10_000])
+@click.option("--max-words", type=int, default=30, help="max number of words in a phrase")
+@click.option("--context-len", type=int, default=500)
+@click.option("--unit", type=click.Choice(["chars", "tokens"]), default="chars")
+def main(*, n_phrases: list[int], max_words: int, context_len: int, unit: str) -> None:
+    rows = []
+    for n in n_phrases:
+        phrases = make_phrases(n_phrases=n, max_words=max_words)
+
+        t_linear = timeit(
+            tts_context.get_left_and_right_contexts, phrases, max_len=context_len, unit=unit
+        )
+        # NOTE: previous implementation supports only character budget
+        t_quadratic = (
+            timeit(get_contexts_quadratic, phrases, max_len=context_len)
+            if unit == "chars"
+            else None
+        )
+        rows.append((n, t_linear, t_quadratic))
+
+        logger.info(f"{n} phrases: linear={t_linear:.4f}s, quadratic={t_quadratic}")
+
+    header = " | ".join(
+        [f"{'phrases':>8}", f"{'linear, s':>10}", f"{'ms/phrase':>10}"]
+        + [f"{'prev, s':>10}", f"{'ms/phrase':>10}"]
+    )
+    lines = [header, "-" * len(header)]
+    for n, t_linear, t_quadratic in rows:
+        quadratic_cols = (
+            f"{t_quadratic:>10.4f} | {1000 * t_quadratic / n:>10.3f}"
+            if t_quadratic is not None
+            else f"{'-':>10} | {'-':>10}"
+        )
+        lines.append(
+            f"{n:>8} | {t_linear:>10.4f} | {1000 * t_linear / n:>10.3f} | {quadratic_cols}"
+        )
+
+    # linear scaling shows up as constant time per phrase
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()
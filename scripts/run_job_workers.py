@@ -0,0 +1,29 @@
+import click
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.config import JOB_WORKER_MAX_CONCURRENT_JOBS, JOBS_DB_FP, logger
+from src.jobs import start_worker_pool
+
+
+@click.command()
+@click.option("-n", "--n-workers", type=int, default=2)
+@click.option("-c", "--max-concurrent-jobs", type=int, default=JOB_WORKER_MAX_CONCURRENT_JOBS)
+@click.option("--db-fp", default=JOBS_DB_FP, help="jobs queue database shared with the web app")
+def main(*, n_workers: int, max_concurrent_jobs: int, db_fp: str) -> None:
+    """
+    Run audiobook generation workers separately from the web app.
+    Start the app with JOB_WORKERS_NUM=0 env variable in this case.
+    NOTE: must be run from the repo root, same as the app, since data paths are relative.
+    """
+    processes = start_worker_pool(
+        n_workers=n_workers, max_concurrent_jobs=max_concurrent_jobs, db_fp=db_fp
+    )
+    for process in processes:
+        process.join()
+        logger.warning(f"worker process {process.name} exited with code {process.exitcode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import bisect
+
+import numpy as np
+
+from src.config import logger
+from src.schemas import TTSTimestampsAlignment
+from src.text_split_chain import CharacterPhrase, CoalescedPhrase
+
+
+class AlignmentIndex:
+    """
+    Maps character offsets in the original text to time in the final audio.
+
+    Each phrase is located in the original text, so characters between phrases
+    (whitespaces, newlines, text omitted by LLM) don't shift offsets of the following phrases.
+    Phrase audio start times are computed from actual durations of phrase audio
+    and pauses between phrases, so they match the concatenated audio exactly.
+    Characters with zero duration are kept, thus offsets are never shifted by filtering.
+
+    Lookups are O(log n) binary searches over phrase start offsets.
+    """
+
+    def __init__(
+        self,
+        phrase_text_starts: list[int],
+        phrase_text_ends: list[int],
+        phrase_char_bases: list[int],
+        phrase_char_limits: list[int],
+        char_starts: np.ndarray,
+        char_ends: np.ndarray,
+    ):
+        # original text offsets of each phrase: [start, end)
+        self._text_starts = phrase_text_starts
+        self._text_ends = phrase_text_ends
+        # index of the first phrase character in characters arrays
+        self._char_bases = phrase_char_bases
+        # end index of the characters of phrase TTS request
+        self._char_limits = phrase_char_limits
+        # absolute time of each voiced character in the final audio
+        self._char_starts = char_starts
+        self._char_ends = char_ends
+
+    @classmethod
+    def build(
+        cls,
+        text: str,
+        phrases: list[CharacterPhrase],
+        tts_phrases: list[CoalescedPhrase],
+        alignments: list[TTSTimestampsAlignment],
+        durations_sec: list[float],
+        pause_sec: float = 0.0,
+    ) -> 'AlignmentIndex':
+        """
+        Build index from raw alignments of TTS requests for `tts_phrases`,
+        and durations of their audio, concatenated with `pause_sec` between phrases.
+        """
+        if not (len(tts_phrases) == len(alignments) == len(durations_sec)):
+            raise ValueError(
+                f'got {len(tts_phrases)} TTS phrases, {len(alignments)} alignments '
+                f'and {len(durations_sec)} audio durations'
+            )
+
+        audio_starts = np.concatenate([[0.0], np.cumsum(np.add(durations_sec, pause_sec))[:-1]])
+        starts_parts, ends_parts = [], []
+        # TTS phrase ix -> index of its first character, and end index of its characters
+        tts_char_bounds = []
+        n_chars = 0
+        for alignment, audio_start, duration in zip(alignments, audio_starts, durations_sec):
+            if len(alignment):
+                starts = alignment.starts.astype(np.float64) + audio_start
+                ends = alignment.ends.astype(np.float64) + audio_start
+            else:
+                # NOTE: phrase without alignment is mapped to its whole audio
+                starts = np.array([audio_start])
+                ends = np.array([audio_start + duration])
+            starts_parts.append(starts)
+            ends_parts.append(ends)
+            tts_char_bounds.append((n_chars, n_chars + len(starts)))
+            n_chars += len(starts)
+
+        text_starts, text_ends, char_bases, char_limits = [], [], [], []
+        cursor = 0
+        n_not_found = 0
+        for tts_phrase, (tts_char_base, tts_char_limit) in zip(tts_phrases, tts_char_bounds):
+            for phrase_ix, offset in zip(tts_phrase.phrase_ixs, tts_phrase.text_offsets):
+                # NOTE: phrase is voiced without surrounding whitespaces, see `coalesce_phrases()`
+                phrase_text = phrases[phrase_ix].text.strip()
+                if not phrase_text:
+                    continue
+                text_start = text.find(phrase_text, cursor)
+                if text_start < 0:
+                    # NOTE: LLM could slightly modify phrase text while splitting.
+                    # assume such phrase immediately follows the previous one
+                    text_start = cursor
+                    n_not_found += 1
+                cursor = text_start + len(phrase_text)
+
+                text_starts.append(text_start)
+                text_ends.append(cursor)
+                char_bases.append(tts_char_base + offset)
+                char_limits.append(tts_char_limit)
+
+        if n_not_found:
+            logger.warning(
+                f'{n_not_found} of {len(text_starts)} phrases are not found in the original text, '
+                'their positions are approximate'
+            )
+
+        return cls(
+            phrase_text_starts=text_starts,
+            phrase_text_ends=text_ends,
+            phrase_char_bases=char_bases,
+            phrase_char_limits=char_limits,
+            char_starts=np.concatenate(starts_parts) if starts_parts else np.empty(0),
+            char_ends=np.concatenate(ends_parts) if ends_parts else np.empty(0),
+        )
+
+    def _get_char_ix(self, phrase_ix: int, local_ix: int) -> int:
+        # NOTE: alignment could be shorter than phrase text, if TTS skipped some characters
+        return min(self._char_bases[phrase_ix] + local_ix, self._char_limits[phrase_ix] - 1)
+
+    def _locate(self, text_ix: int, snap_forward: bool) -> int | None:
+        """
+        Index of character in characters arrays for the original text offset.
+        Offset between phrases is snapped to the start of the next phrase if `snap_forward`,
+        otherwise to the end of the previous one.
+        """
+        if not self._text_starts:
+            return None
+        phrase_ix = bisect.bisect_right(self._text_starts, text_ix) - 1
+        if phrase_ix < 0:
+            return self._get_char_ix(0, 0)
+        text_start, text_end = self._text_starts[phrase_ix], self._text_ends[phrase_ix]
+        if text_ix < text_end:
+            return self._get_char_ix(phrase_ix, text_ix - text_start)
+        if snap_forward and phrase_ix + 1 < len(self._text_starts):
+            return self._get_char_ix(phrase_ix + 1, 0)
+        return self._get_char_ix(phrase_ix, text_end - text_start - 1)
+
+    def get_start_time(self, text_ix: int) -> float:
+        """Time when character at the original text offset starts to sound."""
+        char_ix = self._locate(text_ix, snap_forward=True)
+        return 0.0 if char_ix is None else float(self._char_starts[char_ix])
+
+    def get_end_time(self, text_ix: int) -> float:
+        """Time when character at the original text offset ends to sound."""
+        char_ix = self._locate(text_ix, snap_forward=False)
+        return 0.0 if char_ix is None else float(self._char_ends[char_ix])
+
+    def get_time_range(self, ix_start: int, ix_end: int) -> tuple[float, float]:
+        """Start and end time of the original text span `[ix_start, ix_end)`."""
+        time_start = self.get_start_time(ix_start)
+        time_end = self.get_end_time(max(ix_start, ix_end - 1))
+        return time_start, max(time_start, time_end)
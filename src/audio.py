@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+import io
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pydantic import BaseModel, ConfigDict
+from pydub import AudioSegment
+
+from src.config import AUDIO_PROCESSING_MAX_WORKERS, logger
+
+# process-wide pool for CPU-bound audio processing, used to keep it off the event loop.
+# NOTE: threads are enough, since ffmpeg decoding runs in a subprocess
+# and numpy releases the GIL for heavy operations
+AUDIO_EXECUTOR = ThreadPoolExecutor(
+    max_workers=AUDIO_PROCESSING_MAX_WORKERS, thread_name_prefix='audio'
+)
+
+
+class AudioBuffer:
+    """
+    In-memory PCM audio.
+
+    Samples are stored as float32 numpy array of shape (n_frames, n_channels)
+    with values in [-1, 1] range.
+    Used to process audio without writing intermediate results to files.
+    """
+
+    # NOTE: we always export 16-bit audio, same as pydub does for wav exports
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, samples: np.ndarray, sample_rate: int):
+        if samples.ndim == 1:
+            samples = samples[:, np.newaxis]
+        if samples.ndim != 2:
+            raise ValueError(f'expected samples to have 1 or 2 dimensions, got: {samples.ndim}')
+        self.samples = samples.astype(np.float32, copy=False)
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_pcm_bytes(
+        cls, data: bytes, sample_rate: int, n_channels: int = 1, sample_width: int = 2
+    ) -> AudioBuffer:
+        if sample_width not in (1, 2, 4):
+            raise ValueError(f'unsupported sample width: {sample_width}')
+        if sample_width == 1:
+            # 8-bit pcm is unsigned
+            samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+        else:
+            dtype = np.dtype(f'<i{sample_width}')
+            max_amplitude = float(2 ** (8 * sample_width - 1))
+            samples = np.frombuffer(data, dtype=dtype).astype(np.float32) / max_amplitude
+        return cls(samples=samples.reshape(-1, n_channels), sample_rate=sample_rate)
+
+    @classmethod
+    def from_segment(cls, segment: AudioSegment) -> AudioBuffer:
+        return cls.from_pcm_bytes(
+            data=segment.raw_data,
+            sample_rate=segment.frame_rate,
+            n_channels=segment.channels,
+            sample_width=segment.sample_width,
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes, audio_format: str | None = None) -> AudioBuffer:
+        """
+        Decode audio received from 11labs API.
+
+        `audio_format` is expected to be in 11labs format, e.g. "mp3_44100_192" or "pcm_24000".
+        If format is not passed, it's detected by ffmpeg.
+        """
+        if audio_format is not None and audio_format.startswith("pcm_"):
+            sr = int(audio_format.removeprefix("pcm_"))
+            # 11labs returns raw 16-bit mono pcm
+            return cls.from_pcm_bytes(data=data, sample_rate=sr, n_channels=1, sample_width=2)
+
+        if audio_format is not None:
+            container = audio_format.split("_")[0]
+        elif data[:4] == b"RIFF":
+            # wav files can be decoded without ffmpeg
+            container = "wav"
+        else:
+            container = None
+        segment = AudioSegment.from_file(io.BytesIO(data), format=container)
+        return cls.from_segment(segment)
+
+    @classmethod
+    def from_file(cls, fp: str) -> AudioBuffer:
+        return cls.from_segment(AudioSegment.from_file(fp))
+
+    @classmethod
+    def silence(cls, duration_sec: float, sample_rate: int, n_channels: int = 1) -> AudioBuffer:
+        n_frames = int(round(duration_sec * sample_rate))
+        return cls(np.zeros((n_frames, n_channels), dtype=np.float32), sample_rate=sample_rate)
+
+    @property
+    def n_frames(self) -> int:
+        return self.samples.shape[0]
+
+    @property
+    def n_channels(self) -> int:
+        return self.samples.shape[1]
+
+    @property
+    def duration_sec(self) -> float:
+        return self.n_frames / self.sample_rate
+
+    def __len__(self):
+        """Duration in milliseconds, same as for pydub AudioSegment."""
+        return round(1000 * self.duration_sec)
+
+    @property
+    def dBFS(self) -> float:
+        """Loudness relative to the max possible amplitude. Same definition as in pydub."""
+        if self.samples.size == 0:
+            return -float("inf")
+        rms = float(np.sqrt(np.mean(np.square(self.samples, dtype=np.float64))))
+        if rms == 0:
+            return -float("inf")
+        return 20 * np.log10(rms)
+
+    def apply_gain(self, gain_db: float) -> AudioBuffer:
+        return AudioBuffer(self.samples * np.float32(10 ** (gain_db / 20)), self.sample_rate)
+
+    def normalize(self, target_dBFS: float) -> AudioBuffer:
+        """Normalize audio to the target dBFS level."""
+        cur_dBFS = self.dBFS
+        if np.isinf(cur_dBFS):
+            # silence can't be normalized
+            return self
+        return self.apply_gain(target_dBFS - cur_dBFS)
+
+    def fade_in(self, duration_ms: int) -> AudioBuffer:
+        n = min(self.n_frames, int(self.sample_rate * duration_ms / 1000))
+        samples = self.samples.copy()
+        samples[:n] *= np.linspace(0, 1, n, endpoint=False, dtype=np.float32)[:, np.newaxis]
+        return AudioBuffer(samples, self.sample_rate)
+
+    def fade_out(self, duration_ms: int) -> AudioBuffer:
+        n = min(self.n_frames, int(self.sample_rate * duration_ms / 1000))
+        samples = self.samples.copy()
+        if n > 0:
+            samples[-n:] *= np.linspace(1, 0, n, endpoint=False, dtype=np.float32)[:, np.newaxis]
+        return AudioBuffer(samples, self.sample_rate)
+
+    def trim(self, duration_sec: float) -> AudioBuffer:
+        """Keep at most first `duration_sec` of audio."""
+        n = max(0, int(round(duration_sec * self.sample_rate)))
+        if n >= self.n_frames:
+            return self
+        return AudioBuffer(self.samples[:n], self.sample_rate)
+
+    def set_channels(self, n_channels: int) -> AudioBuffer:
+        if n_channels == self.n_channels:
+            return self
+        if self.n_channels == 1:
+            samples = np.repeat(self.samples, n_channels, axis=1)
+        elif n_channels == 1:
+            samples = self.samples.mean(axis=1, keepdims=True)
+        else:
+            raise ValueError(f"can't convert {self.n_channels} channels to {n_channels}")
+        return AudioBuffer(samples, self.sample_rate)
+
+    def set_sample_rate(self, sample_rate: int) -> AudioBuffer:
+        """Resample audio using linear interpolation."""
+        if sample_rate == self.sample_rate:
+            return self
+        n_frames_new = int(round(self.n_frames * sample_rate / self.sample_rate))
+        t_old = np.arange(self.n_frames) / self.sample_rate
+        t_new = np.arange(n_frames_new) / sample_rate
+        samples = np.stack(
+            [np.interp(t_new, t_old, self.samples[:, ch]) for ch in range(self.n_channels)],
+            axis=1,
+        )
+        return AudioBuffer(samples, sample_rate)
+
+    def conform(self, sample_rate: int, n_channels: int) -> AudioBuffer:
+        return self.set_sample_rate(sample_rate).set_channels(n_channels)
+
+    def to_pcm_bytes(self) -> bytes:
+        max_amplitude = 2 ** (8 * self.SAMPLE_WIDTH - 1)
+        samples = np.clip(self.samples * max_amplitude, -max_amplitude, max_amplitude - 1)
+        return samples.astype('<i2').tobytes()
+
+    def write_wav(self, fp: str, block_sec: float = 60.0):
+        """
+        Write audio to wav file.
+        NOTE: samples are converted to pcm block by block,
+        so that long audio isn't copied in memory as a whole.
+        """
+        logger.info(f'saving to: "{fp}"')
+        block_frames = max(1, int(block_sec * self.sample_rate))
+        with open_wav_writer(fp=fp, sample_rate=self.sample_rate, n_channels=self.n_channels) as f:
+            for start in range(0, self.n_frames, block_frames):
+                block = AudioBuffer(self.samples[start : start + block_frames], self.sample_rate)
+                f.writeframesraw(block.to_pcm_bytes())
+
+
+def open_wav_writer(fp: str, sample_rate: int, n_channels: int) -> wave.Wave_write:
+    f = wave.open(fp, "wb")
+    f.setnchannels(n_channels)
+    f.setsampwidth(AudioBuffer.SAMPLE_WIDTH)
+    f.setframerate(sample_rate)
+    return f
+
+
+def get_common_format(buffers: list[AudioBuffer]) -> tuple[int, int]:
+    """
+    Return (sample_rate, n_channels) all buffers need to be converted to before mixing.
+    Same approach as in pydub: use max sample rate and max number of channels.
+    """
+    sample_rate = max(b.sample_rate for b in buffers)
+    n_channels = max(b.n_channels for b in buffers)
+    return sample_rate, n_channels
+
+
+def concatenate(
+    buffers: list[AudioBuffer], pause_sec: float = 0.0, leading_pause: bool = False
+) -> AudioBuffer:
+    """
+    Concatenate buffers inserting `pause_sec` of silence between them.
+    If `leading_pause` is set, the pause is also inserted before the first buffer.
+
+    Output is preallocated and each buffer is copied into it exactly once,
+    so the cost is linear in the total audio length.
+    """
+    if not buffers:
+        raise ValueError('nothing to concatenate')
+    sample_rate, n_channels = get_common_format(buffers)
+    buffers = [b.conform(sample_rate=sample_rate, n_channels=n_channels) for b in buffers]
+    pause_frames = int(round(pause_sec * sample_rate))
+
+    n_pauses = len(buffers) - 1 + int(leading_pause)
+    n_frames = sum(b.n_frames for b in buffers) + n_pauses * pause_frames
+    samples = np.zeros((n_frames, n_channels), dtype=np.float32)
+
+    pos = pause_frames if leading_pause else 0
+    for b in buffers:
+        samples[pos : pos + b.n_frames] = b.samples
+        pos += b.n_frames + pause_frames
+
+    return AudioBuffer(samples, sample_rate)
+
+
+def write_wav_concatenated(buffers: list[AudioBuffer], fp: str, pause_sec: float = 0.0):
+    """
+    Write concatenation of buffers to wav file, inserting `pause_sec` of silence between them.
+    Frames are streamed to the file buffer by buffer,
+    so the whole concatenated audio is never allocated in memory.
+    """
+    if not buffers:
+        raise ValueError('nothing to concatenate')
+    sample_rate, n_channels = get_common_format(buffers)
+    pause_bytes = AudioBuffer.silence(
+        duration_sec=pause_sec, sample_rate=sample_rate, n_channels=n_channels
+    ).to_pcm_bytes()
+
+    logger.info(f'saving to: "{fp}"')
+    with open_wav_writer(fp=fp, sample_rate=sample_rate, n_channels=n_channels) as f:
+        for ix, b in enumerate(buffers):
+            if ix > 0 and pause_bytes:
+                f.writeframesraw(pause_bytes)
+            b = b.conform(sample_rate=sample_rate, n_channels=n_channels)
+            f.writeframesraw(b.to_pcm_bytes())
+
+
+class MixEvent(BaseModel):
+    """Audio clip to be mixed over the main track."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    clip: AudioBuffer
+    start_sec: float
+    gain_db: float = 0.0
+    fade_in_ms: int = 0
+    fade_out_ms: int = 0
+
+
+def _get_clip_envelope(
+    n_frames: int, sample_rate: int, gain_db: float, fade_in_ms: int, fade_out_ms: int
+) -> np.ndarray:
+    """Per-frame gain of the clip: constant gain multiplied by linear fade in and fade out."""
+    envelope = np.full(n_frames, 10 ** (gain_db / 20), dtype=np.float32)
+    n_fade_in = min(n_frames, int(sample_rate * fade_in_ms / 1000))
+    envelope[:n_fade_in] *= np.linspace(0, 1, n_fade_in, endpoint=False, dtype=np.float32)
+    n_fade_out = min(n_frames, int(sample_rate * fade_out_ms / 1000))
+    if n_fade_out > 0:
+        envelope[-n_fade_out:] *= np.linspace(1, 0, n_fade_out, endpoint=False, dtype=np.float32)
+    return envelope
+
+
+def soft_clip(samples: np.ndarray, threshold: float = 0.9) -> np.ndarray:
+    """
+    Clipping protection applied inplace.
+    Samples with amplitude above `threshold` are smoothly compressed into [threshold, 1) range,
+    samples below the threshold are left intact.
+    """
+    mask = np.abs(samples) > threshold
+    if mask.any():
+        excess = (np.abs(samples[mask]) - threshold) / (1 - threshold)
+        samples[mask] = np.sign(samples[mask]) * (threshold + (1 - threshold) * np.tanh(excess))
+    return samples
+
+
+def mix(
+    main: AudioBuffer, events: list[MixEvent], clip_threshold: float = 0.9, inplace: bool = False
+) -> AudioBuffer:
+    """
+    Mix clips over the main track.
+
+    Main track is copied into a preallocated float buffer once,
+    or is modified inplace if `inplace` is set and it already has the common format.
+    Then each clip is added in place with its gain and fades applied,
+    touching only the frames it overlaps. Thus the cost is O(book length + total clips length),
+    not O(number of clips * book length) as with repeated pydub overlays.
+    Same as in pydub, result has the same duration as the main track.
+    """
+    sample_rate, n_channels = get_common_format([main, *(e.clip for e in events)])
+    conformed = main.conform(sample_rate=sample_rate, n_channels=n_channels)
+    if inplace or conformed is not main:
+        # NOTE: conversion already made a copy
+        samples = conformed.samples
+    else:
+        samples = np.empty_like(main.samples)
+        samples[:] = main.samples
+
+    for event in events:
+        clip = event.clip.conform(sample_rate=sample_rate, n_channels=n_channels)
+        start = max(0, int(event.start_sec * sample_rate))
+        end = min(len(samples), start + clip.n_frames)
+        if end <= start:
+            continue
+        envelope = _get_clip_envelope(
+            n_frames=clip.n_frames,
+            sample_rate=sample_rate,
+            gain_db=event.gain_db,
+            fade_in_ms=event.fade_in_ms,
+            fade_out_ms=event.fade_out_ms,
+        )
+        n = end - start
+        samples[start:end] += clip.samples[:n] * envelope[:n, np.newaxis]
+
+    soft_clip(samples, threshold=clip_threshold)
+    return AudioBuffer(samples, sample_rate)
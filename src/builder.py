@@ -1,23 +1,32 @@
 import asyncio
+import functools
 import os
 from asyncio import TaskGroup
-from pathlib import Path
-from typing import Any, Callable, List
+from contextlib import aclosing
+from typing import Any, Awaitable, Callable, List
 from uuid import uuid4
 
+import numpy as np
 from langchain_community.callbacks import get_openai_callback
-from pydantic import BaseModel
-from pydub import AudioSegment
+from pydantic import BaseModel, ConfigDict
 
-from src import tts, utils
+from src import audio, chunking, tts, tts_context, utils
+from src.alignment_index import AlignmentIndex
+from src.audio import AudioBuffer
+from src.character_registry import CharacterRecord, CharacterRegistry
+from src.checkpoint import CheckpointStore, validate_job_id
 from src.config import (
-    CONTEXT_CHAR_LEN_FOR_TTS,
-    ELEVENLABS_MAX_PARALLEL,
-    OPENAI_MAX_PARALLEL,
+    CHUNK_MAX_LEN,
+    CONTEXT_LEN_FOR_TTS,
+    CONTEXT_LEN_UNIT_FOR_TTS,
+    SOUND_EFFECTS_LIBRARY_ENABLED,
+    TTS_PAUSE_BW_PHRASES_SEC,
+    TTS_PHRASE_MAX_LEN,
     logger,
 )
 from src.lc_callbacks import LCMessageLoggerAsync
 from src.preprocess_tts_emotions_chain import TTSParamProcessor
+from src.rate_limit import current_job
 from src.schemas import SoundEffectsParams, TTSParams, TTSTimestampsAlignment, TTSTimestampsResponse
 from src.select_voice_chain import (
     CharacterPropertiesNullable,
@@ -29,8 +38,15 @@ from src.sound_effects_design import (
     SoundEffectsDesignOutput,
     create_sound_effects_design_chain,
 )
+from src.sound_effects_library import SOUND_EFFECTS_LIBRARY, SoundEffectsLibrary
+from src.stage_graph import StageGraph
 from src.text_modification_chain import modify_text_chain
-from src.text_split_chain import SplitTextOutput, create_split_text_chain
+from src.text_split_chain import (
+    CharacterPhrase,
+    CoalescedPhrase,
+    SplitTextOutput,
+    create_split_text_chain,
+)
 from src.utils import GPTModels, prettify_unknown_character_label
 from src.web.constructor import HTMLGenerator
 from src.web.utils import (
@@ -42,179 +58,420 @@ from src.web.utils import (
 
 
 class TTSPhrasesGenerationOutput(BaseModel):
-    audio_fps: list[str]
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    tts_params_list: list[TTSParams]
+    # normalized audio of each phrase
+    audio: list[AudioBuffer]
     char2time: TTSTimestampsAlignment
+    # maps original text offsets to time in the final audio
+    alignment_index: AlignmentIndex
 
 
 class AudiobookBuilder:
-    def __init__(self, rm_artifacts: bool = False):
+    def __init__(self, rm_artifacts: bool = False, save_audio_artifacts: bool = False):
         self.voice_selector = VoiceSelector()
+        self.character_registry = CharacterRegistry()
         self.params_tts_processor = TTSParamProcessor()
         self.rm_artifacts = rm_artifacts
+        # if set, raw audio received from 11labs is saved to files for debugging.
+        # audio processing itself is done in memory
+        self.save_audio_artifacts = save_audio_artifacts
         self.min_sound_effect_duration_sec = 1
         self.sound_effects_prompt_influence = 0.75  # seems to work nicely
+        self.sound_effects_library: SoundEffectsLibrary | None = (
+            SOUND_EFFECTS_LIBRARY if SOUND_EFFECTS_LIBRARY_ENABLED else None
+        )
+        self.pause_bw_phrases_sec = TTS_PAUSE_BW_PHRASES_SEC
+        self.tts_target_dBFS = -20
+        self.tts_phrase_max_len = TTS_PHRASE_MAX_LEN
         self.html_generator = HTMLGenerator()
         self.name = type(self).__name__
 
     @staticmethod
     async def _prepare_text_for_tts(text: str) -> str:
         chain = modify_text_chain(llm_model=GPTModels.GPT_4o)
-        with get_openai_callback() as cb:
-            result = await chain.ainvoke(
-                {"text": text}, config={"callbacks": [LCMessageLoggerAsync()]}
+
+        async def _process_chunk(chunk_text: str) -> str:
+            with get_openai_callback() as cb:
+                result = await chain.ainvoke(
+                    {"text": chunk_text}, config={"callbacks": [LCMessageLoggerAsync()]}
+                )
+            logger.info(
+                'End of modifying text with caps and symbols(?, !, ...). '
+                f'Openai callback stats: {cb}'
             )
-        logger.info(
-            f'End of modifying text with caps and symbols(?, !, ...). Openai callback stats: {cb}'
+            return result.text_modified
+
+        chunks, results = await chunking.process_in_chunks(text, func=_process_chunk)
+        return ''.join(
+            chunking.replace_chunk_text(chunk_text=chunk.text, new_text=chunk_modified)
+            for chunk, chunk_modified in zip(chunks, results)
         )
-        return result.text_modified
 
     @staticmethod
     async def _split_text(text: str) -> SplitTextOutput:
         chain = create_split_text_chain(llm_model=GPTModels.GPT_4o)
-        with get_openai_callback() as cb:
-            chain_out = await chain.ainvoke(
-                {"text": text}, config={"callbacks": [LCMessageLoggerAsync()]}
-            )
-        logger.info(f'end of splitting text into characters. openai callback stats: {cb}')
-        return chain_out
+
+        async def _process_chunk(chunk_text: str) -> SplitTextOutput:
+            with get_openai_callback() as cb:
+                chain_out = await chain.ainvoke(
+                    {"text": chunk_text}, config={"callbacks": [LCMessageLoggerAsync()]}
+                )
+            logger.info(f'end of splitting text into characters. openai callback stats: {cb}')
+            return chain_out
+
+        _, results = await chunking.process_in_chunks(text, func=_process_chunk)
+        return SplitTextOutput.merge(results)
 
     @staticmethod
     async def _design_sound_effects(text: str) -> SoundEffectsDesignOutput:
         chain = create_sound_effects_design_chain(llm_model=GPTModels.GPT_4o)
-        with get_openai_callback() as cb:
-            res = await chain.ainvoke(
-                {"text": text}, config={"callbacks": [LCMessageLoggerAsync()]}
+
+        async def _process_chunk(chunk_text: str) -> SoundEffectsDesignOutput:
+            with get_openai_callback() as cb:
+                chunk_res = await chain.ainvoke(
+                    {"text": chunk_text}, config={"callbacks": [LCMessageLoggerAsync()]}
+                )
+            logger.info(
+                f'designed {len(chunk_res.sound_effects_descriptions)} sound effects. '
+                f'openai callback stats: {cb}'
             )
-        logger.info(
-            f'designed {len(res.sound_effects_descriptions)} sound effects. '
-            f'openai callback stats: {cb}'
+            return chunk_res
+
+        chunks, results = await chunking.process_in_chunks(text, func=_process_chunk)
+        return SoundEffectsDesignOutput.merge(
+            results, text_offsets=[chunk.ix_start for chunk in chunks]
         )
-        return res
+
+    def _get_known_characters(
+        self, series_id: str | None, characters: list[str]
+    ) -> dict[str, CharacterRecord]:
+        if series_id is None:
+            return {}
+        known = self.character_registry.get(series_id=series_id, characters=characters)
+        # NOTE: voice removed from the catalog is selected again
+        return {
+            character: record
+            for character, record in known.items()
+            if self.voice_selector.catalog.get(record.voice_id) is not None
+        }
 
     async def _map_characters_to_voices(
-        self, text_split: SplitTextOutput
+        self, text_split: SplitTextOutput, series_id: str | None = None
     ) -> SelectVoiceChainOutput:
+        """
+        If `series_id` is passed, characters known from the previous texts of the series
+        keep their properties and voices. LLM is asked only about unseen characters,
+        and they are stored for the next texts.
+        """
+        known = self._get_known_characters(series_id=series_id, characters=text_split.characters)
+        unseen = [character for character in text_split.characters if character not in known]
+        if known:
+            logger.info(
+                f'{len(known)} characters are known from series "{series_id}", '
+                f'{len(unseen)} are unseen'
+            )
+
+        character2props = {character: rec.props for character, rec in known.items()}
+        character2voice = {character: rec.voice_id for character, rec in known.items()}
+        if not unseen:
+            return SelectVoiceChainOutput(
+                character2props=character2props, character2voice=character2voice
+            )
+
         chain = self.voice_selector.create_voice_mapping_chain(llm_model=GPTModels.GPT_4o)
+        text = text_split.text_annotated
+        if len(text) > CHUNK_MAX_LEN:
+            # NOTE: for long texts we pass an excerpt, containing phrases of all characters
+            text = text_split.to_excerpt(max_len=CHUNK_MAX_LEN)
         with get_openai_callback() as cb:
             chain_out = await chain.ainvoke(
                 {
-                    "text": text_split.text_annotated,
-                    "characters": text_split.characters,
+                    "text": text,
+                    "characters": unseen,
+                    "reserved_voice_ids": list(character2voice.values()),
                 },
                 config={"callbacks": [LCMessageLoggerAsync()]},
             )
         logger.info(f'end of mapping characters to voices. openai callback stats: {cb}')
-        return chain_out
-
-    async def _prepare_params_for_tts(self, text_split: SplitTextOutput) -> list[TTSParams]:
-        semaphore = asyncio.Semaphore(OPENAI_MAX_PARALLEL)
-
-        async def run_task_with_semaphore(func, **params):
-            async with semaphore:
-                outputs = await func(**params)
-                return outputs
-
-        tasks = []
 
-        for character_phrase in text_split.phrases:
-            tasks.append(
-                run_task_with_semaphore(
-                    func=self.params_tts_processor.run,
-                    text=character_phrase.text,
-                )
+        # NOTE: LLM could return known characters too. they keep their registered voices
+        unseen_set = set(unseen)
+        character2props.update(
+            (character, props)
+            for character, props in chain_out.character2props.items()
+            if character in unseen_set
+        )
+        character2voice.update(
+            (character, voice_id)
+            for character, voice_id in chain_out.character2voice.items()
+            if character in unseen_set
+        )
+        if series_id is not None:
+            self.character_registry.save(
+                series_id=series_id,
+                character2record={
+                    character: CharacterRecord(
+                        props=character2props[character], voice_id=character2voice[character]
+                    )
+                    for character in unseen
+                    if character in character2props and character in character2voice
+                },
             )
+            # NOTE: concurrent job of the same series could store some characters first
+            for character, rec in self.character_registry.get(series_id, unseen).items():
+                character2props[character] = rec.props
+                character2voice[character] = rec.voice_id
 
-        tts_tasks_results = await asyncio.gather(*tasks)
-
-        return tts_tasks_results
+        return SelectVoiceChainOutput(
+            character2props=character2props, character2voice=character2voice
+        )
 
-    @staticmethod
-    def _add_voice_ids_to_tts_params(
+    async def _select_voices(
+        self,
         text_split: SplitTextOutput,
-        tts_params_list: list[TTSParams],
-        character2voice: dict[str, str],
-    ) -> list[TTSParams]:
-        for character_phrase, params in zip(text_split.phrases, tts_params_list):
-            params.voice_id = character2voice[character_phrase.character]
-        return tts_params_list
+        use_user_voice: bool,
+        voice_id: str | None,
+        series_id: str | None = None,
+    ) -> SelectVoiceChainOutput:
+        if not use_user_voice:
+            return await self._map_characters_to_voices(text_split=text_split, series_id=series_id)
+
+        if voice_id is None:
+            raise ValueError(f'voice_id is None')
+        return SelectVoiceChainOutput(
+            character2props={
+                char: CharacterPropertiesNullable(gender=None, age_group=None)
+                for char in text_split.characters
+            },
+            character2voice={char: voice_id for char in text_split.characters},
+        )
 
     @staticmethod
     def _get_left_and_right_contexts_for_each_phrase(
-        phrases, context_length=CONTEXT_CHAR_LEN_FOR_TTS
-    ):
+        phrases: list[CharacterPhrase],
+        context_length: int = CONTEXT_LEN_FOR_TTS,
+        unit: tts_context.ContextLengthUnit = CONTEXT_LEN_UNIT_FOR_TTS,
+    ) -> list[tuple[str, str]]:
         """
-        Return phrases from left and right sides which don't exceed `context_length`.
-        Approx. number of words/tokens based on `context_length` can be calculated by dividing it by 5.
+        Return texts from left and right sides of each phrase which don't exceed `context_length`
+        characters or tokens. Neighbour phrases are trimmed at word boundaries to fit.
         """
-        # TODO: split first context phrase if it exceeds `context_length`, currently it's not added.
-        # TODO: optimize algorithm to linear time using sliding window on top of cumulative length sums.
-        left_right_contexts = []
-        for i in range(len(phrases)):
-            left_text, right_text = '', ''
-            for j in range(i - 1, -1, -1):
-                if len(left_text) + len(phrases[j].text) < context_length:
-                    left_text = phrases[j].text + left_text
-                else:
-                    break
-            for phrase in phrases[i + 1 :]:
-                if len(right_text) + len(phrase.text) < context_length:
-                    right_text += phrase.text
-                else:
-                    break
-            left_right_contexts.append((left_text, right_text))
-        return left_right_contexts
-
-    def _add_previous_and_next_context_to_tts_params(
-        self,
-        text_split: SplitTextOutput,
-        tts_params_list: list[TTSParams],
-    ) -> list[TTSParams]:
-        left_right_contexts = self._get_left_and_right_contexts_for_each_phrase(text_split.phrases)
-        for cur_contexts, params in zip(left_right_contexts, tts_params_list):
-            left_context, right_context = cur_contexts
-            params.previous_text = left_context
-            params.next_text = right_context
-        return tts_params_list
+        return tts_context.get_left_and_right_contexts(
+            [phrase.text for phrase in phrases], max_len=context_length, unit=unit
+        )
+
+    def _get_tts_phrases(self, text_split: SplitTextOutput) -> list[CoalescedPhrase]:
+        """Phrases voiced by separate TTS requests."""
+        return text_split.coalesce_phrases(max_len=self.tts_phrase_max_len)
 
     @staticmethod
+    def _get_phrase_alignment(
+        phrase: CoalescedPhrase, response: TTSTimestampsResponse
+    ) -> TTSTimestampsAlignment:
+        """
+        Alignment of the coalesced phrase without separators added between merged phrases,
+        so that it matches concatenated stripped texts of the original phrases.
+        """
+        alignment = response.alignment
+        separator_ixs = phrase.get_separator_char_ixs()
+        if not separator_ixs:
+            return alignment
+        if len(alignment) != len(phrase.text):
+            logger.warning(
+                f'alignment of {len(alignment)} characters '
+                f'doesn\'t match phrase text of {len(phrase.text)} characters, keeping it as is'
+            )
+            return alignment
+        return alignment.drop_chars(separator_ixs)
+
     async def _generate_tts_audio(
-        tts_params_list: list[TTSParams],
-        out_dp: str,
+        self,
+        text_split: SplitTextOutput,
+        get_voice_mapping: Callable[[], Awaitable[SelectVoiceChainOutput]],
+        out_dp: str | None = None,
+        ready_queue: asyncio.Queue | None = None,
+        checkpoints: CheckpointStore | None = None,
     ) -> TTSPhrasesGenerationOutput:
-        semaphore = asyncio.Semaphore(ELEVENLABS_MAX_PARALLEL)
+        """
+        Generate TTS audio for all phrases in a streaming manner.
+
+        Adjacent phrases of the same character are coalesced and voiced by a single request
+        (see `SplitTextOutput.coalesce_phrases()`). Audio, TTS params and phrase indices below
+        refer to coalesced phrases.
+        TTS params are inferred by LLM in batches of consecutive phrases.
+        Each phrase is sent to TTS as soon as its params batch, voice id and context are ready.
+        Thus phrase doesn't wait for LLM calls preparing TTS params for other batches.
+
+        Audio of each phrase is decoded and normalized in the audio thread pool
+        as soon as its TTS response arrives, while other phrases are still being generated.
+
+        If `out_dp` is passed, raw TTS audio is saved there as debug artifacts.
+        If `ready_queue` is passed, `(phrase_ix, audio)` tuple is put to the queue
+        once audio for the phrase is normalized. `None` is put to the queue when generation ends.
+        If `checkpoints` are passed, TTS params and audio of phrases are restored from there,
+        and newly generated ones are saved.
+        """
+        if out_dp is not None:
+            os.makedirs(out_dp, exist_ok=True)
+
+        tts_phrases = self._get_tts_phrases(text_split)
+        logger.info(
+            f'{len(text_split.phrases)} phrases are coalesced into {len(tts_phrases)} TTS phrases'
+        )
+        left_right_contexts = self._get_left_and_right_contexts_for_each_phrase(tts_phrases)
+
+        # phrase ix -> (params, response) restored from checkpoint
+        phrase_input_hashes = [
+            CheckpointStore.make_hash(
+                dict(character=phrase.character, text=phrase.text, contexts=contexts)
+            )
+            for phrase, contexts in zip(tts_phrases, left_right_contexts)
+        ]
+        restored: dict[int, tuple[TTSParams, TTSTimestampsResponse]] = {}
+        if checkpoints is not None:
+            for ix, input_hash in enumerate(phrase_input_hashes):
+                found, value = checkpoints.load(f'tts_phrase_{ix}', input_hash=input_hash)
+                if found:
+                    restored[ix] = value
+            logger.info(f'restored {len(restored)} TTS phrases from checkpoints')
+
+        async def _process_params_batch(batch_ixs: list[int]) -> list[TTSParams]:
+            return await self.params_tts_processor.run_batch(
+                texts=[tts_phrases[ix].text for ix in batch_ixs]
+            )
+
+        phrase_ixs_to_infer = [ix for ix in range(len(tts_phrases)) if ix not in restored]
+        params_batches = [
+            [phrase_ixs_to_infer[pos] for pos in batch]
+            for batch in self.params_tts_processor.split_into_batches(
+                [tts_phrases[ix].text for ix in phrase_ixs_to_infer]
+            )
+        ]
+        logger.info(
+            f'TTS params for {len(phrase_ixs_to_infer)} phrases '
+            f'will be inferred in {len(params_batches)} batches'
+        )
+        params_batch_tasks = [
+            asyncio.create_task(_process_params_batch(batch_ixs)) for batch_ixs in params_batches
+        ]
+        # phrase ix -> (batch ix, position in batch)
+        phrase2batch = {
+            phrase_ix: (batch_ix, pos)
+            for batch_ix, batch_ixs in enumerate(params_batches)
+            for pos, phrase_ix in enumerate(batch_ixs)
+        }
+
+        async def _process_phrase(
+            ix: int, character_phrase: CoalescedPhrase, contexts: tuple[str, str]
+        ) -> tuple[TTSParams, TTSTimestampsResponse, AudioBuffer]:
+            response = None
+            if ix in restored:
+                params, response = restored[ix]
+            else:
+                batch_ix, pos = phrase2batch[ix]
+                params = (await params_batch_tasks[batch_ix])[pos]
+
+            voice_mapping = await get_voice_mapping()
+            voice_id = voice_mapping.character2voice[character_phrase.character]
+
+            # NOTE: restored TTS params stay valid even if voice has changed,
+            # only audio needs to be generated again
+            if response is None or params.voice_id != voice_id:
+                params.voice_id = voice_id
+                params.previous_text, params.next_text = contexts
 
-        async def _tts_with_semaphore(params: TTSParams) -> TTSTimestampsResponse:
-            async with semaphore:
-                return await tts.tts_w_timestamps(params=params)
+                response = await tts.tts_w_timestamps(params=params)
 
-        tasks = [_tts_with_semaphore(params=params) for params in tts_params_list]
-        tts_responses: list[TTSTimestampsResponse] = await asyncio.gather(*tasks)
+                if checkpoints is not None:
+                    checkpoints.save(
+                        f'tts_phrase_{ix}',
+                        input_hash=phrase_input_hashes[ix],
+                        value=(params, response),
+                    )
 
-        tts_audio_fps = []
-        for ix, (params, res) in enumerate(zip(tts_params_list, tts_responses), start=1):
-            out_fp_no_ext = os.path.join(out_dp, f'tts_output_{ix}')
-            out_fp = res.write_audio_to_file(
-                filepath_no_ext=out_fp_no_ext, audio_format=params.output_format
+            debug_fp_no_ext = None
+            if out_dp is not None:
+                debug_fp_no_ext = os.path.join(out_dp, f'tts_output_{ix + 1}')
+            # NOTE: CPU-bound processing doesn't block the event loop,
+            # so it overlaps with requests for other phrases
+            phrase_audio = await asyncio.get_running_loop().run_in_executor(
+                audio.AUDIO_EXECUTOR,
+                functools.partial(
+                    self._postprocess_phrase_audio,
+                    response=response,
+                    audio_format=params.output_format,
+                    target_dBFS=self.tts_target_dBFS,
+                    debug_fp_no_ext=debug_fp_no_ext,
+                ),
+            )
+            if ready_queue is not None:
+                ready_queue.put_nowait((ix, phrase_audio))
+            return params, response, phrase_audio
+
+        tasks = [
+            _process_phrase(ix=ix, character_phrase=character_phrase, contexts=contexts)
+            for ix, (character_phrase, contexts) in enumerate(
+                zip(tts_phrases, left_right_contexts), start=0
             )
-            tts_audio_fps.append(out_fp)
+        ]
+        try:
+            # NOTE: if some phrase fails, the rest are still completed and checkpointed,
+            # so that resumed job doesn't generate them again
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for res in results:
+                if isinstance(res, BaseException):
+                    raise res
+        finally:
+            for task in params_batch_tasks:
+                task.cancel()
+            if ready_queue is not None:
+                ready_queue.put_nowait(None)
+
+        tts_params_list = [params for params, _, _ in results]
+        tts_responses = [response for _, response, _ in results]
+        tts_audio = [phrase_audio for _, _, phrase_audio in results]
 
         # combine alignments
-        alignments = [response.alignment for response in tts_responses]
-        char2time = TTSTimestampsAlignment.combine_alignments(alignments=alignments)
+        alignments = [
+            self._get_phrase_alignment(phrase=phrase, response=response)
+            for phrase, response in zip(tts_phrases, tts_responses)
+        ]
+        # NOTE: pauses between phrases are marked with placeholders
+        char2time = TTSTimestampsAlignment.combine_alignments(
+            alignments=alignments,
+            add_placeholders=self.pause_bw_phrases_sec > 0,
+            pause_bw_chunks_s=self.pause_bw_phrases_sec,
+        )
         # filter alignments
         char2time = char2time.filter_chars_without_duration()
 
-        return TTSPhrasesGenerationOutput(audio_fps=tts_audio_fps, char2time=char2time)
+        alignment_index = AlignmentIndex.build(
+            text=text_split.text_raw,
+            phrases=text_split.phrases,
+            tts_phrases=tts_phrases,
+            alignments=[response.alignment for response in tts_responses],
+            durations_sec=[phrase_audio.duration_sec for phrase_audio in tts_audio],
+            pause_sec=self.pause_bw_phrases_sec,
+        )
+
+        return TTSPhrasesGenerationOutput(
+            tts_params_list=tts_params_list,
+            audio=tts_audio,
+            char2time=char2time,
+            alignment_index=alignment_index,
+        )
 
     def _update_sound_effects_descriptions_with_durations(
         self,
         sound_effects_descriptions: list[SoundEffectDescription],
-        char2time: TTSTimestampsAlignment,
+        alignment_index: AlignmentIndex,
     ) -> list[SoundEffectDescription]:
         for sed in sound_effects_descriptions:
-            ix_start, ix_end = sed.ix_start_orig_text, sed.ix_end_orig_text
-            time_start = char2time.get_start_time_by_char_ix(ix_start, safe=True)
-            time_end = char2time.get_end_time_by_char_ix(ix_end, safe=True)
+            time_start, time_end = alignment_index.get_time_range(
+                sed.ix_start_orig_text, sed.ix_end_orig_text
+            )
             duration = time_end - time_start
             # apply min effect duration
             duration = max(self.min_sound_effect_duration_sec, duration)
@@ -256,27 +513,116 @@ class AudiobookBuilder:
         ]
         return params
 
-    @staticmethod
+    async def _generate_sound_effect(self, params: SoundEffectsParams) -> tuple[bytes, AudioBuffer]:
+        """
+        Reuse similar clip from the library if possible, otherwise generate a new one.
+        Return raw audio bytes and decoded audio.
+        """
+        audio_bytes = None
+        if self.sound_effects_library is not None:
+            # NOTE: library reads and writes whole clips, so it's accessed in a thread
+            clip = await asyncio.to_thread(self.sound_effects_library.find, params)
+            if clip is not None:
+                audio_bytes = clip.audio_bytes
+
+        is_generated = audio_bytes is None
+        if is_generated:
+            audio_bytes = b''.join(await tts.sound_generation_consumed(params=params))
+
+        # NOTE: audio format is detected by ffmpeg
+        effect_audio = await asyncio.get_running_loop().run_in_executor(
+            audio.AUDIO_EXECUTOR, AudioBuffer.from_bytes, audio_bytes
+        )
+        if is_generated and self.sound_effects_library is not None:
+            await asyncio.to_thread(
+                self.sound_effects_library.add,
+                params,
+                duration_sec=effect_audio.duration_sec,
+                audio_bytes=audio_bytes,
+            )
+        return audio_bytes, effect_audio
+
     async def _generate_sound_effects(
+        self,
         sound_effects_params: list[SoundEffectsParams],
-        out_dp: str,
-    ) -> list[str]:
-        semaphore = asyncio.Semaphore(ELEVENLABS_MAX_PARALLEL)
+        out_dp: str | None = None,
+    ) -> list[AudioBuffer]:
+        # NOTE: similar effects of the same text share a single clip,
+        # since they would miss the library when requested concurrently
+        if self.sound_effects_library is not None:
+            leader_ixs = self.sound_effects_library.group_similar(sound_effects_params)
+        else:
+            leader_ixs = list(range(len(sound_effects_params)))
+        unique_ixs = sorted(set(leader_ixs))
+        if len(unique_ixs) < len(sound_effects_params):
+            logger.info(
+                f'{len(sound_effects_params)} sound effects are grouped '
+                f'into {len(unique_ixs)} clips by prompts similarity'
+            )
 
-        async def _se_gen_with_semaphore(params: SoundEffectsParams) -> list[bytes]:
-            async with semaphore:
-                return await tts.sound_generation_consumed(params=params)
+        # NOTE: number of concurrent requests is limited by the process-wide rate limiter
+        tasks = [self._generate_sound_effect(sound_effects_params[ix]) for ix in unique_ixs]
+        results = dict(zip(unique_ixs, await asyncio.gather(*tasks)))
 
-        tasks = [_se_gen_with_semaphore(params=params) for params in sound_effects_params]
-        results = await asyncio.gather(*tasks)
+        se_audio = []
+        for ix, (params, leader_ix) in enumerate(zip(sound_effects_params, leader_ixs), start=1):
+            audio_bytes, effect_audio = results[leader_ix]
+            if out_dp is not None:
+                out_fp = os.path.join(out_dp, f'sound_effect_{ix}.mp3')
+                utils.write_chunked_bytes(data=[audio_bytes], fp=out_fp)
+            if params.duration_seconds is not None:
+                # reused clip could be longer than requested
+                effect_audio = effect_audio.trim(params.duration_seconds)
+            se_audio.append(effect_audio)
 
-        se_fps = []
-        for ix, task_res in enumerate(results, start=1):
-            out_fp = os.path.join(out_dp, f'sound_effect_{ix}.wav')
-            utils.write_chunked_bytes(data=task_res, fp=out_fp)
-            se_fps.append(out_fp)
+        return se_audio
 
-        return se_fps
+    async def _synthesize_sound_effects(
+        self,
+        se_design_output: SoundEffectsDesignOutput,
+        tts_out: TTSPhrasesGenerationOutput,
+        out_dp: str | None = None,
+        checkpoints: CheckpointStore | None = None,
+    ) -> list[AudioBuffer]:
+        # NOTE: sound effects descriptions are updated inplace
+        se_descriptions = self._update_sound_effects_descriptions_with_durations(
+            sound_effects_descriptions=se_design_output.sound_effects_descriptions,
+            alignment_index=tts_out.alignment_index,
+        )
+
+        # no need in filtering, since we ensure the min duration above
+        # se_descriptions = self._filter_short_sound_effects(
+        #     sound_effects_descriptions=se_descriptions
+        # )
+
+        se_params = self._sound_effects_description_2_generation_params(
+            sound_effects_descriptions=se_descriptions
+        )
+
+        if len(se_descriptions) != len(se_params):
+            raise ValueError(
+                f'expected {len(se_descriptions)} sound effects params, got: {len(se_params)}'
+            )
+
+        if out_dp is not None:
+            os.makedirs(out_dp, exist_ok=True)
+
+        async def _generate() -> list[AudioBuffer]:
+            return await self._generate_sound_effects(sound_effects_params=se_params, out_dp=out_dp)
+
+        if checkpoints is None:
+            se_audio = await _generate()
+        else:
+            se_audio = await checkpoints.run(
+                'se_audio', inputs=[params.model_dump() for params in se_params], func=_generate
+            )
+
+        if len(se_descriptions) != len(se_audio):
+            raise ValueError(
+                f'expected {len(se_descriptions)} generated sound effects, got: {len(se_audio)}'
+            )
+
+        return se_audio
 
     @staticmethod
     def _save_text_split_debug_data(
@@ -290,13 +636,12 @@ class AudiobookBuilder:
 
     @staticmethod
     def _save_tts_debug_data(
-        tts_params_list: list[TTSParams],
         tts_out: TTSPhrasesGenerationOutput,
         out_dp: str,
     ):
         out_fp = os.path.join(out_dp, 'tts.json')
         # NOTE: use `to_dict()` for correct conversion
-        data = [param.to_dict() for param in tts_params_list]
+        data = [param.to_dict() for param in tts_out.tts_params_list]
         utils.write_json(data, fp=out_fp)
 
         out_dp = os.path.join(out_dp, 'tts_char2time.csv')
@@ -317,45 +662,124 @@ class AudiobookBuilder:
         utils.write_json(data, fp=out_fp)
 
     @staticmethod
-    def _postprocess_tts_audio(audio_fps: list[str], out_dp: str, target_dBFS: float) -> list[str]:
-        fps = []
-        for in_fp in audio_fps:
-            audio_segment = AudioSegment.from_file(in_fp)
-            normalized_audio = utils.normalize_audio(audio_segment, target_dBFS)
-
-            out_fp = os.path.join(out_dp, f"{Path(in_fp).stem}.normalized.wav")
-            normalized_audio.export(out_fp, format="wav")
-            fps.append(out_fp)
+    def _postprocess_phrase_audio(
+        response: TTSTimestampsResponse,
+        audio_format: str,
+        target_dBFS: float,
+        debug_fp_no_ext: str | None = None,
+    ) -> AudioBuffer:
+        """Decode and normalize audio of a single phrase. Runs in the audio thread pool."""
+        if debug_fp_no_ext is not None:
+            response.write_audio_to_file(filepath_no_ext=debug_fp_no_ext, audio_format=audio_format)
+        phrase_audio = AudioBuffer.from_bytes(response.audio_bytes, audio_format=audio_format)
+        return phrase_audio.normalize(target_dBFS)
+
+    def _write_stream_chunk(self, phrases_audio: list[AudioBuffer], fp: str, leading_pause: bool):
+        chunk = audio.concatenate(
+            phrases_audio, pause_sec=self.pause_bw_phrases_sec, leading_pause=leading_pause
+        )
+        chunk.write_wav(fp)
 
-        return fps
+    def _write_final_audio(
+        self,
+        tts_norm_audio: list[AudioBuffer],
+        se_audio: list[AudioBuffer] | None,
+        se_descriptions: list[SoundEffectDescription] | None,
+        out_dp: str,
+        now_str: str,
+    ) -> str:
+        """Write audiobook to wav file and return its path. Runs in the audio thread pool."""
+        if se_audio is None:
+            # NOTE: stream phrases directly to file, no need to keep whole audiobook in memory
+            final_audio_fp = os.path.join(out_dp, f'audiobook_{now_str}.wav')
+            audio.write_wav_concatenated(
+                tts_norm_audio, fp=final_audio_fp, pause_sec=self.pause_bw_phrases_sec
+            )
+            return final_audio_fp
+
+        tts_concat = audio.concatenate(tts_norm_audio, pause_sec=self.pause_bw_phrases_sec)
+        if self.save_audio_artifacts:
+            tts_concat.write_wav(os.path.join(out_dp, f'audiobook_{now_str}.wav'))
+        se_mix_events = self._get_sound_effects_mix_events(
+            se_audio=se_audio,
+            se_descriptions=se_descriptions,
+            target_dBFS=-27,
+            fade_ms=500,
+        )
+        # NOTE: concatenated narration isn't used afterwards, so effects are mixed into it inplace
+        final_audio = audio.mix(main=tts_concat, events=se_mix_events, inplace=True)
+        final_audio_fp = os.path.join(out_dp, f'audiobook_with_effects_{now_str}.wav')
+        final_audio.write_wav(final_audio_fp)
+        return final_audio_fp
 
     @staticmethod
-    def _postprocess_sound_effects(
-        audio_fps: list[str], out_dp: str, target_dBFS: float, fade_ms: int
-    ) -> list[str]:
-        fps = []
-        for in_fp in audio_fps:
-            audio_segment = AudioSegment.from_file(in_fp)
-
-            processed = utils.normalize_audio(audio_segment, target_dBFS)
-
-            processed = processed.fade_in(duration=fade_ms)
-            processed = processed.fade_out(duration=fade_ms)
-
-            out_fp = os.path.join(out_dp, f"{Path(in_fp).stem}.postprocessed.wav")
-            processed.export(out_fp, format="wav")
-            fps.append(out_fp)
+    def _get_sound_effects_mix_events(
+        se_audio: list[AudioBuffer],
+        se_descriptions: list[SoundEffectDescription],
+        target_dBFS: float,
+        fade_ms: int,
+    ) -> list[audio.MixEvent]:
+        """
+        Describe how to mix each sound effect over the narration.
+        Normalization and fades are applied by the mixer in a single pass.
+        """
+        events = []
+        for effect_audio, sed in zip(se_audio, se_descriptions):
+            cur_dBFS = effect_audio.dBFS
+            # NOTE: silent effect can't be normalized
+            gain_db = target_dBFS - cur_dBFS if np.isfinite(cur_dBFS) else 0.0
+            events.append(
+                audio.MixEvent(
+                    clip=effect_audio,
+                    start_sec=sed.start_sec,
+                    gain_db=gain_db,
+                    fade_in_ms=fade_ms,
+                    fade_out_ms=fade_ms,
+                )
+            )
+        return events
 
-        return fps
+    async def _stream_leading_phrases(
+        self,
+        ready_queue: asyncio.Queue,
+        n_phrases: int,
+        out_dp: str,
+    ):
+        """
+        Async generator yielding audio chunks for contiguous leading phrases once they are ready.
 
-    @staticmethod
-    def _concatenate_audiofiles(audio_fps: list[str], out_wav_fp: str):
-        concat = AudioSegment.from_file(audio_fps[0])
-        for filename in audio_fps[1:]:
-            next_audio = AudioSegment.from_file(filename)
-            concat += next_audio
-        logger.info(f'saving concatenated audiobook to: "{out_wav_fp}"')
-        concat.export(out_wav_fp, format="wav")
+        Phrases are generated out of order. Once the contiguous prefix of ready phrases grows,
+        newly added phrases are concatenated into a single wav chunk and its path is yielded.
+        """
+        ready = {}
+        next_ix = 0
+        chunk_ix = 0
+
+        while next_ix < n_phrases:
+            item = await ready_queue.get()
+            if item is None:
+                # generation finished or failed. error is raised by the caller
+                return
+            phrase_ix, phrase_audio = item
+            ready[phrase_ix] = phrase_audio
+
+            new_phrases_audio = []
+            while next_ix in ready:
+                new_phrases_audio.append(ready.pop(next_ix))
+                next_ix += 1
+            if not new_phrases_audio:
+                continue
+
+            chunk_ix += 1
+            chunk_fp = os.path.join(out_dp, f'stream_chunk_{chunk_ix}.wav')
+            await asyncio.get_running_loop().run_in_executor(
+                audio.AUDIO_EXECUTOR,
+                self._write_stream_chunk,
+                new_phrases_audio,
+                chunk_fp,
+                chunk_ix > 1,
+            )
+            yield chunk_fp
 
     def _get_text_split_html(
         self,
@@ -391,9 +815,12 @@ class AudiobookBuilder:
     STAGE_2 = 'Voices Selection'
     STAGE_3 = 'Audio Generation'
 
+    # NOTE: yielded data is a tuple of (final_audio_fp, error_text, html, audio_chunk_fp).
+    # `audio_chunk_fp` is used to progressively stream the audiobook while it's being generated.
+
     def _get_yield_data_stage_0(self):
         status = self.html_generator.generate_status("Starting", [("Analyzing Text...", False)])
-        return None, "", status
+        return None, "", status, None
 
     def _get_yield_data_stage_1(self, text_split_html: str):
         status_html = create_status_html(
@@ -401,7 +828,7 @@ class AudiobookBuilder:
             [(self.STAGE_1, True), ("Selecting Voices...", False)],
         )
         html = status_html + text_split_html
-        return None, "", html
+        return None, "", html, None
 
     def _get_yield_data_stage_2(self, text_split_html: str, voice_mapping_html: str):
         status_html = create_status_html(
@@ -409,7 +836,12 @@ class AudiobookBuilder:
             [(self.STAGE_1, True), (self.STAGE_2, True), ("Generating Audio...", False)],
         )
         html = status_html + text_split_html + voice_mapping_html + '</div>'
-        return None, "", html
+        return None, "", html, None
+
+    def _get_yield_data_audio_chunk(self, audio_chunk_fp: str):
+        # NOTE: status html doesn't change while audio is generated, so it's not sent again.
+        # otherwise the whole text split and voice mapping html is stored with every chunk event
+        return None, "", None, audio_chunk_fp
 
     def _get_yield_data_stage_3(
         self, final_audio_fp: str, text_split_html: str, voice_mapping_html: str
@@ -425,7 +857,12 @@ class AudiobookBuilder:
             + self.html_generator.generate_final_message()
             + '</div>'
         )
-        return final_audio_fp, "", third_stage_result_html
+        return final_audio_fp, "", third_stage_result_html, None
+
+    @staticmethod
+    def get_job_dp(job_id: str) -> str:
+        """Directory with artifacts and checkpoints of the job."""
+        return os.path.join('data', 'audiobooks', job_id)
 
     async def run(
         self,
@@ -433,157 +870,241 @@ class AudiobookBuilder:
         generate_effects: bool,
         use_user_voice: bool = False,
         voice_id: str | None = None,
+        stream_audio: bool = False,
+        job_id: str | None = None,
+        priority: float = 1.0,
+        series_id: str | None = None,
     ):
+        """
+        Async generator producing data to be displayed in UI on each stage.
+
+        If `stream_audio` is set, audio chunks for contiguous leading phrases
+        are yielded as soon as they are ready, before the whole audiobook is generated.
+
+        Results of completed stages are checkpointed in the job directory.
+        Run with the id of existing job resumes it: stages and TTS phrases
+        with unchanged inputs are restored from checkpoints instead of being generated again.
+
+        API requests of the run are fairly scheduled against other runs in the process,
+        getting request slots proportionally to `priority`.
+
+        Texts of the same book or series should be run with the same `series_id`,
+        so that characters keep their voices across them.
+        """
         now_str = utils.get_utc_now_str()
-        uuid_trimmed = str(uuid4()).split('-')[0]
-        dir_name = f'{now_str}-{uuid_trimmed}'
-        out_dp_root = os.path.join('data', 'audiobooks', dir_name)
-        os.makedirs(out_dp_root, exist_ok=False)
+        if job_id is None:
+            uuid_trimmed = str(uuid4()).split('-')[0]
+            job_id = f'{now_str}-{uuid_trimmed}'
+        else:
+            validate_job_id(job_id)
+        logger.info(f'{self.name}: running job "{job_id}"')
+        out_dp_root = self.get_job_dp(job_id)
+        os.makedirs(out_dp_root, exist_ok=True)
+
+        stages = self._run(
+            text=text,
+            generate_effects=generate_effects,
+            use_user_voice=use_user_voice,
+            voice_id=voice_id,
+            stream_audio=stream_audio,
+            job_id=job_id,
+            priority=priority,
+            series_id=series_id,
+            out_dp_root=out_dp_root,
+            now_str=now_str,
+        )
+        # NOTE: `aclosing` ensures inner generator (and its running stages)
+        # is finalized right away, not when garbage collected.
+        # artifacts of interrupted run are kept, so that it could be resumed from checkpoints
+        async with aclosing(stages):
+            async for stage in stages:
+                yield stage
 
-        debug_dp = os.path.join(out_dp_root, 'debug')
-        os.makedirs(debug_dp)
+        logger.info(f'end of {self.name}.run()')
 
-        # TODO: currently, we are constantly writing and reading audio segments from files.
-        # I think it will be more efficient to keep all audio in memory.
+    async def _run(
+        self,
+        text: str,
+        generate_effects: bool,
+        use_user_voice: bool,
+        voice_id: str | None,
+        stream_audio: bool,
+        job_id: str,
+        priority: float,
+        series_id: str | None,
+        out_dp_root: str,
+        now_str: str,
+    ):
+        """Stages of `run()`, producing data to be displayed in UI."""
+        debug_dp = os.path.join(out_dp_root, 'debug')
+        os.makedirs(debug_dp, exist_ok=True)
 
         # zero stage
         if use_user_voice and not voice_id:
-            yield None, "", self.html_generator.generate_message_without_voice_id()
+            yield None, "", self.html_generator.generate_message_without_voice_id(), None
 
         else:
             yield self._get_yield_data_stage_0()
 
-            text_for_tts = await self._prepare_text_for_tts(text=text)
+            # NOTE: all audio processing is done in memory.
+            # raw audio files are saved only if `save_audio_artifacts` is set
+            tts_dp, effects_dp = None, None
+            if self.save_audio_artifacts:
+                tts_dp = os.path.join(out_dp_root, 'tts')
+                effects_dp = os.path.join(out_dp_root, 'sound_effects')
 
-            # TODO: call sound effects chain in parallel with text split chain
-            text_split = await self._split_text(text=text_for_tts)
-            self._save_text_split_debug_data(text_split=text_split, out_dp=debug_dp)
-            # yield stage 1
-            text_split_html = self._get_text_split_html(
-                text_split=text_split, sound_effects_descriptions=None
+            # NOTE: independent stages (e.g. text split and sound effects design,
+            # voice mapping and tts params selection) run concurrently.
+            checkpoints = CheckpointStore(os.path.join(out_dp_root, 'checkpoints'))
+
+            graph = StageGraph(name=f'{self.name}-{job_id}')
+            graph.add_stage(
+                'text_for_tts',
+                lambda: checkpoints.run(
+                    'text_for_tts',
+                    inputs=dict(text=text),
+                    func=lambda: self._prepare_text_for_tts(text=text),
+                ),
+            )
+            graph.add_stage(
+                'text_split',
+                lambda text_for_tts: checkpoints.run(
+                    'text_split',
+                    inputs=dict(text=text_for_tts),
+                    func=lambda: self._split_text(text=text_for_tts),
+                ),
+                deps=['text_for_tts'],
             )
-            yield self._get_yield_data_stage_1(text_split_html=text_split_html)
-
             if generate_effects:
-                se_design_output = await self._design_sound_effects(text=text_for_tts)
-                se_descriptions = se_design_output.sound_effects_descriptions
-                text_split_html = self._get_text_split_html(
-                    text_split=text_split, sound_effects_descriptions=se_descriptions
+                graph.add_stage(
+                    'se_design',
+                    lambda text_for_tts: checkpoints.run(
+                        'se_design',
+                        inputs=dict(text=text_for_tts),
+                        func=lambda: self._design_sound_effects(text=text_for_tts),
+                    ),
+                    deps=['text_for_tts'],
                 )
-
-            # TODO: run voice mapping and tts params selection in parallel
-            if not use_user_voice:
-                select_voice_chain_out = await self._map_characters_to_voices(text_split=text_split)
-            else:
-                if voice_id is None:
-                    raise ValueError(f'voice_id is None')
-                select_voice_chain_out = SelectVoiceChainOutput(
-                    character2props={
-                        char: CharacterPropertiesNullable(gender=None, age_group=None)
-                        for char in text_split.characters
-                    },
-                    character2voice={char: voice_id for char in text_split.characters},
-                )
-            tts_params_list = await self._prepare_params_for_tts(text_split=text_split)
-
-            # yield stage 2
-            voice_mapping_html = self._get_voice_mapping_html(
-                use_user_voice=use_user_voice, select_voice_chain_out=select_voice_chain_out
-            )
-            yield self._get_yield_data_stage_2(
-                text_split_html=text_split_html, voice_mapping_html=voice_mapping_html
-            )
-
-            tts_params_list = self._add_voice_ids_to_tts_params(
-                text_split=text_split,
-                tts_params_list=tts_params_list,
-                character2voice=select_voice_chain_out.character2voice,
+            graph.add_stage(
+                'voice_mapping',
+                lambda text_split: checkpoints.run(
+                    'voice_mapping',
+                    inputs=dict(
+                        text_annotated=text_split.text_annotated,
+                        use_user_voice=use_user_voice,
+                        voice_id=voice_id,
+                        series_id=series_id,
+                    ),
+                    func=lambda: self._select_voices(
+                        text_split=text_split,
+                        use_user_voice=use_user_voice,
+                        voice_id=voice_id,
+                        series_id=series_id,
+                    ),
+                ),
+                deps=['text_split'],
             )
-
-            tts_params_list = self._add_previous_and_next_context_to_tts_params(
-                text_split=text_split,
-                tts_params_list=tts_params_list,
-            )
-
-            tts_dp = os.path.join(out_dp_root, 'tts')
-            os.makedirs(tts_dp)
-            tts_out = await self._generate_tts_audio(tts_params_list=tts_params_list, out_dp=tts_dp)
-
-            self._save_tts_debug_data(
-                tts_params_list=tts_params_list, tts_out=tts_out, out_dp=debug_dp
+            # NOTE: tts audio stage waits for voice mapping per phrase,
+            # only after the phrase tts params are ready
+            tts_ready_queue = asyncio.Queue() if stream_audio else None
+            graph.add_stage(
+                'tts_audio',
+                lambda text_split: self._generate_tts_audio(
+                    text_split=text_split,
+                    get_voice_mapping=lambda: graph.result('voice_mapping'),
+                    out_dp=tts_dp,
+                    ready_queue=tts_ready_queue,
+                    checkpoints=checkpoints,
+                ),
+                deps=['text_split'],
             )
-
             if generate_effects:
-                se_descriptions = self._update_sound_effects_descriptions_with_durations(
-                    sound_effects_descriptions=se_descriptions, char2time=tts_out.char2time
+                graph.add_stage(
+                    'se_audio',
+                    lambda se_design, tts_audio: self._synthesize_sound_effects(
+                        se_design_output=se_design,
+                        tts_out=tts_audio,
+                        out_dp=effects_dp,
+                        checkpoints=checkpoints,
+                    ),
+                    deps=['se_design', 'tts_audio'],
                 )
 
-                # no need in filtering, since we ensure the min duration above
-                # se_descriptions = self._filter_short_sound_effects(
-                #     sound_effects_descriptions=se_descriptions
-                # )
+            try:
+                # NOTE: stage tasks inherit the job context on creation
+                with current_job(job_id=job_id, priority=priority):
+                    graph.start()
 
-                se_params = self._sound_effects_description_2_generation_params(
-                    sound_effects_descriptions=se_descriptions
+                text_split = await graph.result('text_split')
+                self._save_text_split_debug_data(text_split=text_split, out_dp=debug_dp)
+                # yield stage 1
+                text_split_html = self._get_text_split_html(
+                    text_split=text_split, sound_effects_descriptions=None
                 )
+                yield self._get_yield_data_stage_1(text_split_html=text_split_html)
 
-                if len(se_descriptions) != len(se_params):
-                    raise ValueError(
-                        f'expected {len(se_descriptions)} sound effects params, got: {len(se_params)}'
+                if generate_effects:
+                    se_design_output = await graph.result('se_design')
+                    se_descriptions = se_design_output.sound_effects_descriptions
+                    text_split_html = self._get_text_split_html(
+                        text_split=text_split, sound_effects_descriptions=se_descriptions
                     )
 
-                effects_dp = os.path.join(out_dp_root, 'sound_effects')
-                os.makedirs(effects_dp)
-                se_fps = await self._generate_sound_effects(
-                    sound_effects_params=se_params, out_dp=effects_dp
-                )
+                select_voice_chain_out = await graph.result('voice_mapping')
 
-                if len(se_descriptions) != len(se_fps):
-                    raise ValueError(
-                        f'expected {len(se_descriptions)} generated sound effects, got: {len(se_fps)}'
-                    )
-
-                self._save_sound_effects_debug_data(
-                    sound_effect_design_output=se_design_output,
-                    sound_effect_descriptions=se_descriptions,
-                    out_dp=debug_dp,
+                # yield stage 2
+                voice_mapping_html = self._get_voice_mapping_html(
+                    use_user_voice=use_user_voice, select_voice_chain_out=select_voice_chain_out
                 )
-
-            tts_normalized_dp = os.path.join(out_dp_root, 'tts_normalized')
-            os.makedirs(tts_normalized_dp)
-            tts_norm_fps = self._postprocess_tts_audio(
-                audio_fps=tts_out.audio_fps,
-                out_dp=tts_normalized_dp,
-                target_dBFS=-20,
-            )
-
-            if generate_effects:
-                se_normalized_dp = os.path.join(out_dp_root, 'sound_effects_postprocessed')
-                os.makedirs(se_normalized_dp)
-                se_norm_fps = self._postprocess_sound_effects(
-                    audio_fps=se_fps,
-                    out_dp=se_normalized_dp,
-                    target_dBFS=-27,
-                    fade_ms=500,
+                yield self._get_yield_data_stage_2(
+                    text_split_html=text_split_html, voice_mapping_html=voice_mapping_html
                 )
 
-            tts_concat_fp = os.path.join(out_dp_root, f'audiobook_{now_str}.wav')
-            self._concatenate_audiofiles(audio_fps=tts_norm_fps, out_wav_fp=tts_concat_fp)
-
-            if not generate_effects:
-                final_audio_fp = tts_concat_fp
-            else:
-                tts_concat_with_effects_fp = os.path.join(
-                    out_dp_root, f'audiobook_with_effects_{now_str}.wav'
-                )
-                se_starts_sec = [sed.start_sec for sed in se_descriptions]
-                utils.overlay_multiple_audio(
-                    main_audio_fp=tts_concat_fp,
-                    audios_to_overlay_fps=se_norm_fps,
-                    starts_sec=se_starts_sec,
-                    out_fp=tts_concat_with_effects_fp,
-                )
-                final_audio_fp = tts_concat_with_effects_fp
+                if stream_audio:
+                    stream_dp = os.path.join(out_dp_root, 'stream')
+                    os.makedirs(stream_dp, exist_ok=True)
+                    n_phrases = len(self._get_tts_phrases(text_split))
+                    async for chunk_fp in self._stream_leading_phrases(
+                        ready_queue=tts_ready_queue,
+                        n_phrases=n_phrases,
+                        out_dp=stream_dp,
+                    ):
+                        yield self._get_yield_data_audio_chunk(audio_chunk_fp=chunk_fp)
+
+                tts_out = await graph.result('tts_audio')
+                self._save_tts_debug_data(tts_out=tts_out, out_dp=debug_dp)
+
+                if generate_effects:
+                    se_audio = await graph.result('se_audio')
+                    self._save_sound_effects_debug_data(
+                        sound_effect_design_output=se_design_output,
+                        sound_effect_descriptions=se_descriptions,
+                        out_dp=debug_dp,
+                    )
+            finally:
+                graph.cancel()
+
+            graph.log_timings()
+            tts.TTS_CACHE.log_stats()
+            if generate_effects and self.sound_effects_library is not None:
+                self.sound_effects_library.log_stats()
+
+            # NOTE: phrases audio is already normalized while it was generated
+            tts_norm_audio = tts_out.audio
+
+            # NOTE: final audio is assembled in the audio thread pool,
+            # so that the event loop keeps serving other jobs and sending heartbeats
+            final_audio_fp = await asyncio.get_running_loop().run_in_executor(
+                audio.AUDIO_EXECUTOR,
+                functools.partial(
+                    self._write_final_audio,
+                    tts_norm_audio=tts_norm_audio,
+                    se_audio=se_audio if generate_effects else None,
+                    se_descriptions=se_descriptions if generate_effects else None,
+                    out_dp=out_dp_root,
+                    now_str=now_str,
+                ),
+            )
 
             utils.rm_dir_conditional(dp=out_dp_root, to_remove=self.rm_artifacts)
 
@@ -593,5 +1114,3 @@ class AudiobookBuilder:
                 text_split_html=text_split_html,
                 voice_mapping_html=voice_mapping_html,
             )
-
-        logger.info(f'end of {self.name}.run()')
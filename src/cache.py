@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import typing as t
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from src.config import logger
+
+
+def track_total_size(conn: sqlite3.Connection, table: str):
+    """
+    Maintain total of the `size` column of `table` in the `total_sizes` table, using triggers.
+    So that eviction reads the total size without scanning the table,
+    which reads overflow pages of all the stored blobs.
+
+    NOTE: rows must be replaced with an upsert, since `INSERT OR REPLACE`
+    doesn't fire delete triggers for the replaced row.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS total_sizes (tbl TEXT PRIMARY KEY, size INTEGER NOT NULL)'
+        )
+        # NOTE: table is scanned only once, when tracking is set up for an existing database
+        conn.execute(
+            f'INSERT OR IGNORE INTO total_sizes (tbl, size) '
+            f'SELECT ?, COALESCE(SUM(size), 0) FROM {table}',
+            (table,),
+        )
+        conn.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {table}_size_insert AFTER INSERT ON {table} BEGIN '
+            f"UPDATE total_sizes SET size = size + NEW.size WHERE tbl = '{table}'; END"
+        )
+        conn.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {table}_size_delete AFTER DELETE ON {table} BEGIN '
+            f"UPDATE total_sizes SET size = size - OLD.size WHERE tbl = '{table}'; END"
+        )
+        conn.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {table}_size_update AFTER UPDATE OF size ON {table} '
+            f'BEGIN UPDATE total_sizes SET size = size + NEW.size - OLD.size '
+            f"WHERE tbl = '{table}'; END"
+        )
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def get_total_size(conn: sqlite3.Connection, table: str) -> int:
+    """Total size of `table` rows, tracked by `track_total_size`."""
+    return conn.execute('SELECT size FROM total_sizes WHERE tbl = ?', (table,)).fetchone()[0]
+
+
+class DiskCache:
+    """
+    Persistent key-value cache backed by SQLite.
+
+    Values are raw bytes. Once total size of stored values exceeds `max_size_bytes`,
+    least recently used entries are evicted.
+    If `ttl_sec` is set, entries older than it are treated as missing and removed.
+    Database is opened lazily on the first access.
+    """
+
+    def __init__(
+        self, db_fp: str, max_size_bytes: int, name: str = 'cache', ttl_sec: float | None = None
+    ):
+        self.db_fp = db_fp
+        self.max_size_bytes = max_size_bytes
+        self.ttl_sec = ttl_sec
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(data) -> str:
+        """Stable hash of json-serializable data."""
+        data_str = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data_str.encode('utf-8')).hexdigest()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            logger.info(f'{self.name}: opening cache db: "{self.db_fp}"')
+            os.makedirs(os.path.dirname(self.db_fp) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_fp, timeout=30, check_same_thread=False)
+            # NOTE: WAL mode allows concurrent readers while a writer is active
+            conn.execute('PRAGMA journal_mode=WAL')
+            # NOTE: value is the last column, so that reading other columns
+            # doesn't read overflow pages of the value
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, size INTEGER NOT NULL, created_at REAL NOT NULL, '
+                'accessed_at REAL NOT NULL, value BLOB NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_created_at ON entries (created_at)')
+            conn.commit()
+            track_total_size(conn, table='entries')
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            conn = self._get_conn()
+            row = conn.execute(
+                'SELECT value, created_at FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            now = time.time()
+            if row is not None and self._is_expired(created_at=row[1], now=now):
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_sec is not None and now - created_at > self.ttl_sec
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            conn = self._get_conn()
+            now = time.time()
+            conn.execute(
+                'INSERT INTO entries (key, value, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+                'size = excluded.size, created_at = excluded.created_at, '
+                'accessed_at = excluded.accessed_at',
+                (key, value, len(value), now, now),
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute('DELETE FROM entries')
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        if self.ttl_sec is not None:
+            expired_before = time.time() - self.ttl_sec
+            conn.execute('DELETE FROM entries WHERE created_at < ?', (expired_before,))
+
+        total_size = get_total_size(conn, table='entries')
+        if total_size <= self.max_size_bytes:
+            return
+
+        keys_to_remove = []
+        rows = conn.execute('SELECT key, size FROM entries ORDER BY accessed_at ASC')
+        for key, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            keys_to_remove.append((key,))
+            total_size -= size
+
+        conn.executemany('DELETE FROM entries WHERE key = ?', keys_to_remove)
+        logger.info(f'{self.name}: evicted {len(keys_to_remove)} least recently used entries')
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        logger.info(
+            f'{self.name}: {self.hits} hits, {self.misses} misses, hit rate: {hit_rate:.1%}'
+        )
+
+
+class LLMDiskCache(BaseCache):
+    """
+    LangChain LLM cache stored in `DiskCache`.
+    Key is built from the serialized prompt messages and the llm string,
+    which contains model name and all generation params (temperature, etc.).
+    """
+
+    def __init__(self, disk_cache: DiskCache):
+        self.disk_cache = disk_cache
+
+    def _make_key(self, prompt: str, llm_string: str) -> str:
+        return self.disk_cache.make_key([prompt, llm_string])
+
+    @staticmethod
+    def _generation_to_dict(gen: Generation) -> dict:
+        if isinstance(gen, ChatGeneration):
+            return dict(message=message_to_dict(gen.message), generation_info=gen.generation_info)
+        return dict(text=gen.text, generation_info=gen.generation_info)
+
+    @staticmethod
+    def _generation_from_dict(data: dict) -> Generation:
+        if 'message' in data:
+            message = messages_from_dict([data['message']])[0]
+            return ChatGeneration(message=message, generation_info=data['generation_info'])
+        return Generation(text=data['text'], generation_info=data['generation_info'])
+
+    def lookup(self, prompt: str, llm_string: str) -> t.Optional[RETURN_VAL_TYPE]:
+        cached = self.disk_cache.get(self._make_key(prompt=prompt, llm_string=llm_string))
+        if cached is None:
+            return None
+        try:
+            return [self._generation_from_dict(x) for x in json.loads(cached)]
+        except Exception:
+            logger.exception(f'{self.disk_cache.name}: failed to load cached generations')
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        data = json.dumps([self._generation_to_dict(gen) for gen in return_val])
+        self.disk_cache.set(
+            self._make_key(prompt=prompt, llm_string=llm_string), data.encode('utf-8')
+        )
+
+    def clear(self, **kwargs: t.Any) -> None:
+        self.disk_cache.clear()
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+import time
+
+from pydantic import BaseModel
+
+from src.config import CHARACTER_REGISTRY_DB_FP, logger
+from src.select_voice_chain import CharacterPropertiesNullable
+from src.text_split_chain import UNKNOWN_CHARACTER_LABEL_PATTERN
+
+
+class CharacterRecord(BaseModel):
+    props: CharacterPropertiesNullable
+    voice_id: str
+
+
+class CharacterRegistry:
+    """
+    Persistent memory of characters of a book or a book series, backed by SQLite.
+
+    Stores properties inferred by LLM and the voice selected for each character,
+    so that the character keeps its voice in the next chapters,
+    and its properties are not inferred again.
+
+    NOTE: unknown characters ("c1", "c2", etc.) are enumerated independently in each text,
+    so they are never stored.
+    """
+
+    def __init__(self, db_fp: str = CHARACTER_REGISTRY_DB_FP):
+        self.db_fp = db_fp
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_fp) or '.', exist_ok=True)
+            conn = sqlite3.connect(
+                self.db_fp, timeout=30, check_same_thread=False, isolation_level=None
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS characters ('
+                'series_id TEXT NOT NULL, character TEXT NOT NULL, '
+                'gender TEXT, age_group TEXT, voice_id TEXT NOT NULL, created_at REAL NOT NULL, '
+                'PRIMARY KEY (series_id, character))'
+            )
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def is_persistent_character(character: str) -> bool:
+        return not UNKNOWN_CHARACTER_LABEL_PATTERN.fullmatch(character)
+
+    def get(self, series_id: str, characters: list[str]) -> dict[str, CharacterRecord]:
+        """Return records of given characters which are already stored for the series."""
+        characters = [c for c in characters if self.is_persistent_character(c)]
+        if not characters:
+            return {}
+        placeholders = ', '.join('?' * len(characters))
+        with self._lock:
+            rows = (
+                self._get_conn()
+                .execute(
+                    'SELECT character, gender, age_group, voice_id FROM characters '
+                    f'WHERE series_id = ? AND character IN ({placeholders})',
+                    (series_id, *characters),
+                )
+                .fetchall()
+            )
+        return {
+            character: CharacterRecord(
+                props=CharacterPropertiesNullable(gender=gender, age_group=age_group),
+                voice_id=voice_id,
+            )
+            for character, gender, age_group, voice_id in rows
+        }
+
+    def save(self, series_id: str, character2record: dict[str, CharacterRecord]):
+        """
+        Store new characters of the series.
+        NOTE: already stored characters are kept as is. if concurrent jobs of the same series
+        store the same character, the first one wins.
+        """
+        rows = [
+            (series_id, character, rec.props.gender, rec.props.age_group, rec.voice_id, time.time())
+            for character, rec in character2record.items()
+            if self.is_persistent_character(character)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._get_conn().executemany(
+                'INSERT INTO characters '
+                '(series_id, character, gender, age_group, voice_id, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (series_id, character) DO NOTHING',
+                rows,
+            )
+        logger.info(f'stored {len(rows)} characters of series "{series_id}"')
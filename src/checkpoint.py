@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+import time
+import typing as t
+
+from src.config import logger
+
+JOB_ID_PATTERN = re.compile(r'[\w.-]+')
+
+
+def validate_job_id(job_id: str) -> str:
+    # NOTE: job id is used as a directory name
+    if not JOB_ID_PATTERN.fullmatch(job_id) or job_id in ('.', '..'):
+        raise ValueError(f'invalid job id: "{job_id}"')
+    return job_id
+
+
+class CheckpointStore:
+    """
+    Stores results of completed pipeline stages of a single job on disk.
+
+    Each checkpoint is saved together with a hash of the stage inputs.
+    Checkpoint is valid only if the stage is run again with the same inputs,
+    so changed inputs (e.g. different text) invalidate it.
+
+    Manifest is an append-only jsonl file: a line per saved checkpoint,
+    the latest line for a stage wins. This keeps saving a checkpoint O(1),
+    even with thousands of per-phrase checkpoints.
+
+    NOTE: checkpoint values are pickled, so only checkpoints written by the app itself
+    must be loaded.
+    """
+
+    MANIFEST_FN = 'manifest.jsonl'
+
+    def __init__(self, dp: str):
+        self.dp = dp
+        os.makedirs(self.dp, exist_ok=True)
+        self.manifest_fp = os.path.join(self.dp, self.MANIFEST_FN)
+        # stage -> manifest entry
+        self._manifest: dict[str, dict] = self._load_manifest()
+
+    def _load_manifest(self) -> dict[str, dict]:
+        manifest = {}
+        if not os.path.exists(self.manifest_fp):
+            return manifest
+        with open(self.manifest_fp, encoding='utf-8') as fin:
+            for line in fin:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # NOTE: last line could be partially written if the process was killed
+                    logger.warning(f'skipping corrupted checkpoint manifest line: "{line}"')
+                    continue
+                manifest[entry['stage']] = entry
+        logger.info(f'loaded {len(manifest)} checkpoints from "{self.dp}"')
+        return manifest
+
+    @staticmethod
+    def make_hash(inputs) -> str:
+        """Stable hash of json-serializable stage inputs."""
+        data_str = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data_str.encode('utf-8')).hexdigest()
+
+    def _get_fp(self, stage: str) -> str:
+        return os.path.join(self.dp, f'{stage}.pkl')
+
+    def load(self, stage: str, input_hash: str) -> tuple[bool, t.Any]:
+        """Return `(found, value)`. Checkpoint is found only if it's valid for given inputs."""
+        entry = self._manifest.get(stage)
+        if entry is None or entry['input_hash'] != input_hash:
+            return False, None
+        fp = self._get_fp(stage)
+        try:
+            with open(fp, 'rb') as fin:
+                saved_input_hash, value = pickle.load(fin)
+        except Exception:
+            logger.exception(f'failed to load checkpoint for stage "{stage}" from "{fp}"')
+            return False, None
+        # NOTE: file could be overwritten by a save interrupted before manifest was updated
+        if saved_input_hash != input_hash:
+            return False, None
+        return True, value
+
+    def save(self, stage: str, input_hash: str, value: t.Any):
+        fp = self._get_fp(stage)
+        # NOTE: write to temp file first, so interrupted write doesn't corrupt checkpoint
+        fp_tmp = f'{fp}.tmp'
+        with open(fp_tmp, 'wb') as fout:
+            pickle.dump((input_hash, value), fout)
+        os.replace(fp_tmp, fp)
+
+        entry = dict(stage=stage, input_hash=input_hash, created_at=time.time())
+        with open(self.manifest_fp, 'a', encoding='utf-8') as fout:
+            fout.write(json.dumps(entry) + '\n')
+        self._manifest[stage] = entry
+
+    async def run(self, stage: str, inputs, func: t.Callable[[], t.Awaitable[t.Any]]):
+        """Return checkpointed stage result if valid for given inputs, otherwise run the stage."""
+        input_hash = self.make_hash(inputs)
+        found, value = self.load(stage, input_hash=input_hash)
+        if found:
+            logger.info(f'stage "{stage}" restored from checkpoint')
+            return value
+        value = await func()
+        self.save(stage, input_hash=input_hash, value=value)
+        return value
@@ -0,0 +1,125 @@
+import asyncio
+import re
+import typing as t
+
+from pydantic import BaseModel
+
+from src.config import CHUNK_MAX_LEN, logger
+
+T = t.TypeVar('T')
+
+# paragraphs are separated by one or more empty lines
+PARAGRAPH_SEP_PATTERN = re.compile(r'\n[ \t]*\n\s*')
+# lines like "***", "* * *", "---", "#" commonly mark scene breaks in books
+SCENE_BREAK_PATTERN = re.compile(r'^\s*(?:[*#~-]\s*)+$')
+SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?…])["”’)\]]*\s+')
+
+
+class TextChunk(BaseModel):
+    text: str
+    # index of the first chunk character in the full text
+    ix_start: int
+
+
+def _split_keep_separators(text: str, pattern: re.Pattern) -> list[str]:
+    """Split text after each separator match. Concatenation of parts gives the original text."""
+    parts = []
+    prev_end = 0
+    for m in pattern.finditer(text):
+        parts.append(text[prev_end : m.end()])
+        prev_end = m.end()
+    if prev_end < len(text):
+        parts.append(text[prev_end:])
+    return parts
+
+
+def _split_long_paragraph(paragraph: str, max_len: int) -> list[str]:
+    """Split paragraph exceeding `max_len` by sentences. Too long sentences are cut as is."""
+    parts = []
+    for sentence in _split_keep_separators(paragraph, SENTENCE_END_PATTERN):
+        while len(sentence) > max_len:
+            parts.append(sentence[:max_len])
+            sentence = sentence[max_len:]
+        if sentence:
+            parts.append(sentence)
+    return parts
+
+
+def split_text_into_chunks(text: str, max_len: int = CHUNK_MAX_LEN) -> list[TextChunk]:
+    """
+    Split text into chunks not longer than `max_len` characters,
+    so that each chunk can be processed by LLM in a separate request.
+
+    Chunks consist of whole paragraphs, when possible.
+    Paragraphs longer than `max_len` are split by sentences.
+    Chunk is closed early on a scene break, if it's already at least half of `max_len`.
+
+    NOTE: chunk texts include separating whitespaces,
+    thus concatenation of all chunk texts gives the original text.
+    """
+    segments = []
+    for paragraph in _split_keep_separators(text, PARAGRAPH_SEP_PATTERN):
+        if len(paragraph) > max_len:
+            segments.extend(_split_long_paragraph(paragraph, max_len=max_len))
+        else:
+            segments.append(paragraph)
+
+    chunks = []
+    cur_segments = []
+    cur_len = 0
+    ix_start = 0
+
+    def _close_chunk():
+        nonlocal cur_segments, cur_len, ix_start
+        chunk_text = ''.join(cur_segments)
+        chunks.append(TextChunk(text=chunk_text, ix_start=ix_start))
+        ix_start += len(chunk_text)
+        cur_segments = []
+        cur_len = 0
+
+    for segment in segments:
+        if cur_segments and cur_len + len(segment) > max_len:
+            _close_chunk()
+        if SCENE_BREAK_PATTERN.match(segment) and cur_len >= max_len // 2:
+            # scene break is kept at the end of the closed chunk
+            cur_segments.append(segment)
+            cur_len += len(segment)
+            _close_chunk()
+            continue
+        cur_segments.append(segment)
+        cur_len += len(segment)
+
+    if cur_segments:
+        _close_chunk()
+
+    return chunks
+
+
+def replace_chunk_text(chunk_text: str, new_text: str) -> str:
+    """
+    Replace chunk text with its modified version, keeping leading and trailing whitespaces
+    of the original chunk. LLMs tend to strip them, but they separate chunks in the full text.
+    """
+    if not chunk_text.strip():
+        return chunk_text
+    leading = chunk_text[: len(chunk_text) - len(chunk_text.lstrip())]
+    trailing = chunk_text[len(chunk_text.rstrip()) :]
+    return f'{leading}{new_text.strip()}{trailing}'
+
+
+async def process_in_chunks(
+    text: str,
+    func: t.Callable[[str], t.Awaitable[T]],
+    max_len: int = CHUNK_MAX_LEN,
+) -> tuple[list[TextChunk], list[T]]:
+    """
+    Split text into chunks and process them concurrently, each as a single LLM request.
+    Results are in chunks order.
+    NOTE: requests are rate limited by the LLM itself, see `utils.RateLimitedChatOpenAI`.
+    """
+    chunks = split_text_into_chunks(text, max_len=max_len)
+    if len(chunks) > 1:
+        logger.info(f'text of {len(text)} characters is split into {len(chunks)} chunks')
+
+    results = await asyncio.gather(*(func(chunk.text) for chunk in chunks))
+    return chunks, list(results)
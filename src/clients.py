@@ -0,0 +1,121 @@
+import asyncio
+import functools
+import importlib.util
+import threading
+import typing as t
+
+import httpx
+import openai
+from elevenlabs.client import AsyncElevenLabs
+
+from src.config import (
+    ELEVENLABS_API_KEY,
+    ELEVENLABS_MAX_PARALLEL,
+    HTTP_KEEPALIVE_EXPIRY_SEC,
+    OPENAI_API_KEY,
+    OPENAI_MAX_PARALLEL,
+    logger,
+)
+
+T = t.TypeVar('T')
+
+# NOTE: HTTP/2 support in httpx requires optional "h2" package
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+def _make_http_client(max_connections: int, timeout: httpx.Timeout) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SEC,
+        ),
+        timeout=timeout,
+    )
+
+
+class _Clients:
+    """API clients and chains bound to a single event loop."""
+
+    def __init__(self):
+        # NOTE: concurrency is limited by rate limiters, so pools are sized to their caps.
+        # pool timeout is disabled, since requests wait for a slot in the limiter instead
+        self.openai_http = _make_http_client(
+            max_connections=OPENAI_MAX_PARALLEL, timeout=httpx.Timeout(60, connect=4, pool=None)
+        )
+        self.elevenlabs_http = _make_http_client(
+            max_connections=ELEVENLABS_MAX_PARALLEL,
+            timeout=httpx.Timeout(240, connect=4, pool=None),
+        )
+        self.openai = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=self.openai_http)
+        self.elevenlabs = AsyncElevenLabs(
+            api_key=ELEVENLABS_API_KEY, httpx_client=self.elevenlabs_http
+        )
+        self.chains: dict[t.Hashable, t.Any] = {}
+
+
+class ClientRegistry:
+    """
+    Long-lived API clients with keep-alive connection pools, shared by all runs in a process.
+    Also caches LangChain chains, so that they are built once instead of on every call.
+
+    NOTE: connections are bound to the event loop they were opened in,
+    so clients are created per event loop. Both the app and job workers run a single loop
+    for the whole process lifetime, thus it's effectively a single set of clients per process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: dict[asyncio.AbstractEventLoop | None, _Clients] = {}
+        if not HTTP2_AVAILABLE:
+            logger.warning('"h2" package is not installed, API clients fall back to HTTP/1.1')
+
+    def _get(self) -> _Clients:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # clients created outside of event loop, e.g. chains built in sync code
+            loop = None
+        with self._lock:
+            if loop not in self._clients:
+                # drop clients of closed loops. their connections can't be reused anyway
+                for closed_loop in [x for x in self._clients if x is not None and x.is_closed()]:
+                    del self._clients[closed_loop]
+                self._clients[loop] = _Clients()
+            return self._clients[loop]
+
+    @property
+    def openai_http(self) -> httpx.AsyncClient:
+        return self._get().openai_http
+
+    @property
+    def openai(self) -> openai.AsyncOpenAI:
+        return self._get().openai
+
+    @property
+    def elevenlabs(self) -> AsyncElevenLabs:
+        return self._get().elevenlabs
+
+    def get_chain(self, key: t.Hashable, factory: t.Callable[[], T]) -> T:
+        chains = self._get().chains
+        if key not in chains:
+            chains[key] = factory()
+        return chains[key]
+
+
+CLIENTS = ClientRegistry()
+
+
+def cached_chain(func: t.Callable[..., T]) -> t.Callable[..., T]:
+    """
+    Build chain once per event loop for each set of (hashable) factory arguments.
+    NOTE: not intended for methods, since the cache would keep the instance alive.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs) -> T:
+        key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+        return CLIENTS.get_chain(key, lambda: func(*args, **kwargs))
+
+    return wrapper
@@ -18,10 +18,32 @@ OPENAI_MAX_PARALLEL = 10  # empirically set
 # see: https://elevenlabs.io/docs/api-reference/text-to-speech#generation-and-concurrency-limits
 ELEVENLABS_MAX_PARALLEL = 15
 
+# idle keep-alive connections to API providers are closed after this time
+HTTP_KEEPALIVE_EXPIRY_SEC = 60
+
+# NOTE: rate limits below are shared by all runs within a process (e.g. a job worker).
+# set them according to the account usage tier. None means no limit
+OPENAI_REQUESTS_PER_MIN = 5000
+OPENAI_TOKENS_PER_MIN = 450_000
+ELEVENLABS_REQUESTS_PER_MIN = None
+ELEVENLABS_CHARS_PER_MIN = None
+
 # VOICES_CSV_FP = "data/11labs_available_tts_voices.csv"
 VOICES_CSV_FP = "data/11labs_available_tts_voices.reviewed.csv"
+# voices with these manual quality reviews are not selected for characters
+VOICES_EXCLUDED_QUALITY_REVIEWS = ("very bad", "bad")
+# voices csv is reloaded if changed. modification is checked at most once in this interval
+VOICE_CATALOG_RELOAD_CHECK_INTERVAL_SEC = 5
+# voices for characters are selected deterministically for a given seed
+VOICE_ALLOCATION_SEED = 0
+# characters and their voices, stored per book or book series
+CHARACTER_REGISTRY_DB_FP = "data/characters.sqlite"
 
-MAX_TEXT_LEN = 5000
+# NOTE: long texts are split into chunks processed by LLM in separate requests.
+# max text length is limited by memory: audio of the whole book is kept in memory
+# as float32 samples (~0.6 GB per hour of 44.1 kHz mono audio). 50k chars is about an hour
+MAX_TEXT_LEN = 50_000
+CHUNK_MAX_LEN = 5000
 
 DESCRIPTION = """\
 # AI Audiobooks Generator
@@ -43,4 +65,61 @@ DEFAULT_TTS_STABILITY_ACCEPTABLE_RANGE = (0.3, 0.8)
 DEFAULT_TTS_SIMILARITY_BOOST = 0.5
 DEFAULT_TTS_STYLE = 0.0
 
-CONTEXT_CHAR_LEN_FOR_TTS = 500
+# max length of previous and next text passed to TTS as a context of each phrase.
+# measured in "chars" or "tokens"
+CONTEXT_LEN_FOR_TTS = 500
+CONTEXT_LEN_UNIT_FOR_TTS = "chars"
+
+# TTS params for multiple phrases are inferred in a single LLM request.
+# batches are limited by the estimated number of input tokens and by the number of phrases
+TTS_PARAMS_BATCH_MAX_TOKENS = 2000
+TTS_PARAMS_BATCH_MAX_SIZE = 50
+
+# adjacent phrases of the same character are voiced by a single TTS request,
+# while their total length doesn't exceed this limit
+TTS_PHRASE_MAX_LEN = 1000
+
+# pause inserted between audio of consecutive phrases
+TTS_PAUSE_BW_PHRASES_SEC = 0.0
+
+# audio of each phrase is decoded and normalized in a thread pool as soon as it's received,
+# overlapping with TTS requests for other phrases
+AUDIO_PROCESSING_MAX_WORKERS = int(
+    os.environ.get("AUDIO_PROCESSING_MAX_WORKERS", min(8, os.cpu_count() or 1))
+)
+
+# persistent cache of TTS responses. least recently used entries are evicted above max size
+CACHE_DP = "data/cache"
+TTS_CACHE_DB_FP = os.path.join(CACHE_DP, "tts.sqlite")
+TTS_CACHE_MAX_SIZE_MB = 2048
+
+# persistent cache of LLM responses, shared by all langchain chains.
+# set LLM_CACHE_ENABLED=0 env var to always call the LLM
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_DB_FP = os.path.join(CACHE_DP, "llm.sqlite")
+LLM_CACHE_MAX_SIZE_MB = 512
+LLM_CACHE_TTL_SEC = 30 * 24 * 60 * 60
+
+# library of generated sound effects. clip with a similar prompt and long enough duration
+# is reused (trimmed if needed) instead of generating a new one.
+# set SOUND_EFFECTS_LIBRARY_ENABLED=0 env var to always generate new clips
+SOUND_EFFECTS_LIBRARY_ENABLED = os.environ.get("SOUND_EFFECTS_LIBRARY_ENABLED", "1") == "1"
+SOUND_EFFECTS_LIBRARY_DB_FP = os.path.join(CACHE_DP, "sound_effects.sqlite")
+SOUND_EFFECTS_LIBRARY_MAX_SIZE_MB = 1024
+# min similarity of normalized prompts in [0, 1] range
+SOUND_EFFECTS_REUSE_MIN_SIMILARITY = 0.75
+# clip can be at most this times longer than requested, so that trimming keeps most of it
+SOUND_EFFECTS_REUSE_MAX_TRIM_RATIO = 2.0
+# clip can be slightly shorter than requested
+SOUND_EFFECTS_REUSE_DURATION_TOLERANCE_SEC = 0.25
+
+# audiobooks are generated by worker processes, taking jobs from the persistent queue.
+# number of workers started together with the web app. set to 0 to run workers separately
+JOBS_DB_FP = "data/jobs.sqlite"
+JOB_WORKERS_NUM = int(os.environ.get("JOB_WORKERS_NUM", 1))
+JOB_WORKER_MAX_CONCURRENT_JOBS = int(os.environ.get("JOB_WORKER_MAX_CONCURRENT_JOBS", 4))
+JOB_POLL_INTERVAL_SEC = 0.5
+# running job without heartbeats for this long is considered abandoned and is resumed
+JOB_HEARTBEAT_INTERVAL_SEC = 5
+JOB_STALE_AFTER_SEC = 60
+JOB_MAX_ATTEMPTS = 3
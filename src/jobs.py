@@ -0,0 +1,359 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import typing as t
+from enum import StrEnum
+from uuid import uuid4
+
+from pydantic import BaseModel
+
+from src import utils
+from src.builder import AudiobookBuilder
+from src.config import (
+    JOB_HEARTBEAT_INTERVAL_SEC,
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL_SEC,
+    JOB_STALE_AFTER_SEC,
+    JOBS_DB_FP,
+    logger,
+)
+
+
+class JobStatus(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED_JOB_STATUSES = (JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class JobParams(BaseModel):
+    """Arguments of `AudiobookBuilder.run()`."""
+
+    text: str
+    generate_effects: bool
+    use_user_voice: bool = False
+    voice_id: str | None = None
+    priority: float = 1.0
+    # characters keep their voices across texts of the same book or series
+    series_id: str | None = None
+
+
+class Job(BaseModel):
+    id: str
+    status: JobStatus
+    params: JobParams
+    attempts: int
+    worker_id: str | None
+    error: str | None
+
+
+class JobQueue:
+    """
+    Persistent job queue backed by SQLite, shared by the web app and worker processes.
+
+    Workers claim queued jobs and publish UI data produced by the builder as job events.
+    Web app polls events of submitted job by its id.
+    Running jobs send heartbeats. Job whose worker died is claimed again by another worker,
+    and is resumed from its checkpoints.
+    Cancelled job is stopped by its worker on the next poll.
+    """
+
+    def __init__(self, db_fp: str = JOBS_DB_FP):
+        self.db_fp = db_fp
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_fp) or '.', exist_ok=True)
+            # NOTE: transactions are managed explicitly
+            conn = sqlite3.connect(
+                self.db_fp, timeout=30, check_same_thread=False, isolation_level=None
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, worker_id TEXT, error TEXT, '
+                'created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat_at REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS job_events ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, '
+                'data TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS job_events_job_id ON job_events (job_id, id)')
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row_to_job(row) -> Job:
+        job_id, status, params, attempts, worker_id, error = row
+        return Job(
+            id=job_id,
+            status=status,
+            params=JobParams.model_validate_json(params),
+            attempts=attempts,
+            worker_id=worker_id,
+            error=error,
+        )
+
+    def submit(self, params: JobParams) -> str:
+        now_str = utils.get_utc_now_str()
+        uuid_trimmed = str(uuid4()).split('-')[0]
+        job_id = f'{now_str}-{uuid_trimmed}'
+        with self._lock:
+            self._get_conn().execute(
+                'INSERT INTO jobs (id, status, params, created_at) VALUES (?, ?, ?, ?)',
+                (job_id, JobStatus.QUEUED, params.model_dump_json(), time.time()),
+            )
+        logger.info(f'submitted job "{job_id}"')
+        return job_id
+
+    def get_job(self, job_id: str) -> Job | None:
+        with self._lock:
+            row = (
+                self._get_conn()
+                .execute(
+                    'SELECT id, status, params, attempts, worker_id, error FROM jobs WHERE id = ?',
+                    (job_id,),
+                )
+                .fetchone()
+            )
+        return self._row_to_job(row) if row is not None else None
+
+    def claim(self, worker_id: str) -> Job | None:
+        """
+        Atomically take the oldest queued job, or a running job without recent heartbeats.
+        Jobs which have run out of attempts are marked as failed.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            # NOTE: "IMMEDIATE" takes the write lock right away, so workers can't claim same job
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(
+                    'UPDATE jobs SET status = ?, error = ?, finished_at = ? '
+                    'WHERE status = ? AND heartbeat_at < ? AND attempts >= ?',
+                    (
+                        JobStatus.FAILED,
+                        'worker stopped responding',
+                        now,
+                        JobStatus.RUNNING,
+                        now - JOB_STALE_AFTER_SEC,
+                        JOB_MAX_ATTEMPTS,
+                    ),
+                )
+                row = conn.execute(
+                    'SELECT id, status, params, attempts, worker_id, error FROM jobs '
+                    'WHERE status = ? OR (status = ? AND heartbeat_at < ?) '
+                    'ORDER BY created_at LIMIT 1',
+                    (JobStatus.QUEUED, JobStatus.RUNNING, now - JOB_STALE_AFTER_SEC),
+                ).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None
+                conn.execute(
+                    'UPDATE jobs SET status = ?, worker_id = ?, attempts = attempts + 1, '
+                    'started_at = ?, heartbeat_at = ? WHERE id = ?',
+                    (JobStatus.RUNNING, worker_id, now, now, row[0]),
+                )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+        job = self._row_to_job(row)
+        if job.status == JobStatus.RUNNING:
+            logger.warning(f'job "{job.id}" of worker "{job.worker_id}" is stale, resuming it')
+        job.status = JobStatus.RUNNING
+        job.worker_id = worker_id
+        job.attempts += 1
+        return job
+
+    def heartbeat(self, job_ids: list[str]):
+        with self._lock:
+            self._get_conn().executemany(
+                'UPDATE jobs SET heartbeat_at = ? WHERE id = ?',
+                [(time.time(), job_id) for job_id in job_ids],
+            )
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel queued or running job. Return False if job is already finished."""
+        with self._lock:
+            cursor = self._get_conn().execute(
+                'UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)',
+                (JobStatus.CANCELLED, time.time(), job_id, JobStatus.QUEUED, JobStatus.RUNNING),
+            )
+        cancelled = cursor.rowcount > 0
+        if cancelled:
+            logger.info(f'job "{job_id}" is cancelled')
+        return cancelled
+
+    def get_cancelled(self, job_ids: list[str]) -> list[str]:
+        if not job_ids:
+            return []
+        placeholders = ', '.join('?' * len(job_ids))
+        with self._lock:
+            rows = (
+                self._get_conn()
+                .execute(
+                    f'SELECT id FROM jobs WHERE status = ? AND id IN ({placeholders})',
+                    (JobStatus.CANCELLED, *job_ids),
+                )
+                .fetchall()
+            )
+        return [row[0] for row in rows]
+
+    def finish(self, job_id: str, status: JobStatus, error: str | None = None):
+        with self._lock:
+            self._get_conn().execute(
+                'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?',
+                (status, error, time.time(), job_id),
+            )
+        logger.info(f'job "{job_id}" finished with status "{status}"')
+
+    def add_event(self, job_id: str, data: t.Sequence):
+        with self._lock:
+            self._get_conn().execute(
+                'INSERT INTO job_events (job_id, data, created_at) VALUES (?, ?, ?)',
+                (job_id, json.dumps(list(data), ensure_ascii=False), time.time()),
+            )
+
+    def get_events(self, job_id: str, after_id: int = 0) -> list[tuple[int, tuple]]:
+        with self._lock:
+            rows = (
+                self._get_conn()
+                .execute(
+                    'SELECT id, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id',
+                    (job_id, after_id),
+                )
+                .fetchall()
+            )
+        return [(event_id, tuple(json.loads(data))) for event_id, data in rows]
+
+    async def iter_events(
+        self, job_id: str, poll_interval_sec: float = JOB_POLL_INTERVAL_SEC
+    ) -> t.AsyncIterator[tuple]:
+        """Yield job events as they appear, until the job is finished."""
+        last_event_id = 0
+        while True:
+            # NOTE: status is read before events, so events published before finish aren't lost
+            job = self.get_job(job_id)
+            if job is None:
+                raise KeyError(f'job "{job_id}" not found')
+            for event_id, data in self.get_events(job_id, after_id=last_event_id):
+                last_event_id = event_id
+                yield data
+            if job.status in FINISHED_JOB_STATUSES:
+                return
+            await asyncio.sleep(poll_interval_sec)
+
+
+class JobWorker:
+    """Claims jobs from the queue and runs up to `max_concurrent_jobs` of them concurrently."""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        max_concurrent_jobs: int,
+        worker_id: str | None = None,
+        poll_interval_sec: float = JOB_POLL_INTERVAL_SEC,
+    ):
+        self.queue = queue
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.worker_id = worker_id or f'worker-{os.getpid()}-{str(uuid4()).split("-")[0]}'
+        self.poll_interval_sec = poll_interval_sec
+        self._running: dict[str, asyncio.Task] = {}
+        # NOTE: builder is stateless between runs, so it's shared by all jobs of the worker
+        self.builder = AudiobookBuilder()
+
+    async def _run_job(self, job: Job):
+        logger.info(f'{self.worker_id}: starting job "{job.id}", attempt {job.attempts}')
+        try:
+            async for stage in self.builder.run(
+                **job.params.model_dump(), stream_audio=True, job_id=job.id
+            ):
+                self.queue.add_event(job.id, stage)
+        except asyncio.CancelledError:
+            # NOTE: job status isn't updated here. if the job was cancelled, status is already set.
+            # if the worker is shutting down, job becomes stale and is resumed by other worker,
+            # so its checkpoints must be kept
+            cur_job = self.queue.get_job(job.id)
+            if cur_job is not None and cur_job.status == JobStatus.CANCELLED:
+                logger.info(f'{self.worker_id}: job "{job.id}" cancelled, removing its artifacts')
+                utils.rm_dir_conditional(dp=AudiobookBuilder.get_job_dp(job.id))
+            else:
+                logger.info(f'{self.worker_id}: job "{job.id}" stopped')
+            raise
+        except Exception as e:
+            logger.exception(f'{self.worker_id}: job "{job.id}" failed')
+            msg = 'Failed to generate the audiobook. Please try again later'
+            try:
+                self.queue.add_event(
+                    job.id, (None, str(e), self.builder.html_generator.generate_error(msg), None)
+                )
+            finally:
+                # NOTE: job must be finished even if error event isn't published,
+                # otherwise it becomes stale and is retried
+                self.queue.finish(job.id, status=JobStatus.FAILED, error=str(e))
+        else:
+            self.queue.finish(job.id, status=JobStatus.DONE)
+
+    async def run(self):
+        logger.info(f'{self.worker_id}: started, max concurrent jobs: {self.max_concurrent_jobs}')
+        last_heartbeat = 0.0
+        while True:
+            for job_id in self.queue.get_cancelled(list(self._running)):
+                logger.info(f'{self.worker_id}: cancelling job "{job_id}"')
+                self._running[job_id].cancel()
+
+            now = time.time()
+            if self._running and now - last_heartbeat > JOB_HEARTBEAT_INTERVAL_SEC:
+                self.queue.heartbeat(list(self._running))
+                last_heartbeat = now
+
+            if len(self._running) < self.max_concurrent_jobs:
+                job = self.queue.claim(worker_id=self.worker_id)
+                if job is not None:
+                    task = asyncio.create_task(self._run_job(job), name=f'job:{job.id}')
+                    self._running[job.id] = task
+                    task.add_done_callback(lambda _, job_id=job.id: self._running.pop(job_id))
+                    continue
+
+            await asyncio.sleep(self.poll_interval_sec)
+
+
+def _worker_process_main(db_fp: str, max_concurrent_jobs: int):
+    worker = JobWorker(queue=JobQueue(db_fp=db_fp), max_concurrent_jobs=max_concurrent_jobs)
+    asyncio.run(worker.run())
+
+
+def start_worker_pool(
+    n_workers: int, max_concurrent_jobs: int, db_fp: str = JOBS_DB_FP
+) -> list[multiprocessing.Process]:
+    """Start worker processes, each running up to `max_concurrent_jobs` jobs concurrently."""
+    # NOTE: "spawn" doesn't copy parent process state, e.g. running threads or event loops
+    ctx = multiprocessing.get_context('spawn')
+    processes = []
+    for ix in range(n_workers):
+        process = ctx.Process(
+            target=_worker_process_main,
+            args=(db_fp, max_concurrent_jobs),
+            name=f'job-worker-{ix}',
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+    logger.info(f'started {n_workers} job worker processes')
+    return processes
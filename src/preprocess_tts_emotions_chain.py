@@ -1,17 +1,20 @@
+import asyncio
 import json
 
-import openai
 from elevenlabs import VoiceSettings
 
+from src.clients import CLIENTS
 from src.config import (
     DEFAULT_TTS_SIMILARITY_BOOST,
     DEFAULT_TTS_STABILITY,
     DEFAULT_TTS_STABILITY_ACCEPTABLE_RANGE,
     DEFAULT_TTS_STYLE,
-    OPENAI_API_KEY,
+    TTS_PARAMS_BATCH_MAX_SIZE,
+    TTS_PARAMS_BATCH_MAX_TOKENS,
     logger,
 )
-from src.prompts import EMOTION_STABILITY_MODIFICATION
+from src.prompts import EMOTION_STABILITY_MODIFICATION, EMOTION_STABILITY_MODIFICATION_BATCH
+from src.rate_limit import OPENAI_LIMITER
 from src.schemas import TTSParams
 from src.utils import GPTModels, auto_retry
 
@@ -20,8 +23,10 @@ class TTSParamProcessor:
 
     # TODO: refactor to langchain function (?)
 
-    def __init__(self):
-        self.client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+    @property
+    def client(self):
+        # NOTE: shared client, reusing connections across all processors
+        return CLIENTS.openai
 
     @staticmethod
     def _wrap_results(data: dict, default_text: str) -> TTSParams:
@@ -50,14 +55,16 @@ class TTSParamProcessor:
     async def run(self, text: str) -> TTSParams:
         text_prepared = text.strip()
 
-        completion = await self.client.chat.completions.create(
-            model=GPTModels.GPT_4o,
-            messages=[
-                {"role": "system", "content": EMOTION_STABILITY_MODIFICATION},
-                {"role": "user", "content": text_prepared},
-            ],
-            response_format={"type": "json_object"},
-        )
+        n_tokens = self._estimate_n_tokens(EMOTION_STABILITY_MODIFICATION + text_prepared)
+        async with OPENAI_LIMITER.limit(units=n_tokens):
+            completion = await self.client.chat.completions.create(
+                model=GPTModels.GPT_4o,
+                messages=[
+                    {"role": "system", "content": EMOTION_STABILITY_MODIFICATION},
+                    {"role": "user", "content": text_prepared},
+                ],
+                response_format={"type": "json_object"},
+            )
         chatgpt_output = completion.choices[0].message.content
         if chatgpt_output is None:
             raise ValueError(f'received None as openai response content')
@@ -71,3 +78,104 @@ class TTSParamProcessor:
 
         output_wrapped = self._wrap_results(output_dict, default_text=text_prepared)
         return output_wrapped
+
+    @staticmethod
+    def _estimate_n_tokens(text: str) -> int:
+        # NOTE: rough estimate, ~4 chars per token for english text.
+        # a few extra tokens account for chunk id and json formatting
+        return len(text) // 4 + 8
+
+    def split_into_batches(
+        self,
+        texts: list[str],
+        max_batch_tokens: int = TTS_PARAMS_BATCH_MAX_TOKENS,
+        max_batch_size: int = TTS_PARAMS_BATCH_MAX_SIZE,
+    ) -> list[list[int]]:
+        """
+        Greedily split texts into consecutive batches, limited by the estimated number of tokens
+        and by the number of texts. Returns batches of text indices.
+        NOTE: text exceeding the tokens limit on its own forms a separate batch.
+        """
+        batches = []
+        cur_batch = []
+        cur_n_tokens = 0
+        for ix, text in enumerate(texts):
+            n_tokens = self._estimate_n_tokens(text)
+            if cur_batch and (
+                cur_n_tokens + n_tokens > max_batch_tokens or len(cur_batch) >= max_batch_size
+            ):
+                batches.append(cur_batch)
+                cur_batch = []
+                cur_n_tokens = 0
+            cur_batch.append(ix)
+            cur_n_tokens += n_tokens
+        if cur_batch:
+            batches.append(cur_batch)
+        return batches
+
+    @auto_retry
+    async def _request_batch(self, texts: dict[str, str]) -> str:
+        texts_json = json.dumps(texts, ensure_ascii=False)
+        n_tokens = self._estimate_n_tokens(EMOTION_STABILITY_MODIFICATION_BATCH + texts_json)
+        async with OPENAI_LIMITER.limit(units=n_tokens):
+            completion = await self.client.chat.completions.create(
+                model=GPTModels.GPT_4o,
+                messages=[
+                    {"role": "system", "content": EMOTION_STABILITY_MODIFICATION_BATCH},
+                    {"role": "user", "content": texts_json},
+                ],
+                response_format={"type": "json_object"},
+            )
+        chatgpt_output = completion.choices[0].message.content
+        if chatgpt_output is None:
+            raise ValueError('received None as openai response content')
+        return chatgpt_output
+
+    async def run_batch(self, texts: list[str]) -> list[TTSParams]:
+        """
+        Select TTS params for multiple texts in a single LLM request.
+
+        If the whole response can't be parsed, batch is split in halves, processed separately.
+        Texts missing from the parsed response, or having invalid values,
+        are processed one by one with `run()`.
+        """
+        texts_prepared = [text.strip() for text in texts]
+        texts_keyed = {str(ix): text for ix, text in enumerate(texts_prepared)}
+
+        chatgpt_output = await self._request_batch(texts=texts_keyed)
+        try:
+            output_dict = json.loads(chatgpt_output)
+            if not isinstance(output_dict, dict):
+                raise ValueError(f'expected json object, got: {type(output_dict)}')
+        except (json.JSONDecodeError, ValueError):
+            logger.exception(f"Error in parsing batched LLM output: '{chatgpt_output}'")
+            if len(texts) == 1:
+                return [await self.run(text=texts[0])]
+            half = len(texts) // 2
+            batch_results = await asyncio.gather(
+                self.run_batch(texts[:half]), self.run_batch(texts[half:])
+            )
+            return batch_results[0] + batch_results[1]
+
+        results: list[TTSParams | None] = [None] * len(texts)
+        failed_ixs = []
+        for ix, text in enumerate(texts_prepared):
+            stability = output_dict.get(str(ix))
+            if isinstance(stability, (int, float)) and not isinstance(stability, bool):
+                results[ix] = self._wrap_results({'stability': stability}, default_text=text)
+            else:
+                failed_ixs.append(ix)
+
+        if failed_ixs:
+            logger.warning(
+                f'TTS batch processing: {len(failed_ixs)} of {len(texts)} texts are missing '
+                'in LLM output or have invalid values. processing them one by one'
+            )
+            fallback_results = await asyncio.gather(
+                *(self.run(text=texts_prepared[ix]) for ix in failed_ixs)
+            )
+            for ix, params in zip(failed_ixs, fallback_results):
+                results[ix] = params
+
+        logger.info(f'TTS batch processing succeeded for {len(texts)} texts: {output_dict}')
+        return results  # type: ignore
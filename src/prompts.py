@@ -247,6 +247,31 @@ Input: "I CAN'T believe this is happening... Who would expect it??"
 Expected output: {"stability": 0.4}
 """
 
+EMOTION_STABILITY_MODIFICATION_BATCH = """
+You should help me to make an audiobook with exaggerated emotion-based voice using Text-to-Speech.
+Your single task it to select "stability" TTS parameter value for each of the provided text chunks,
+based on the emotional intensity level in the chunk.
+
+Provided text was previously modified by uppercasing some words and adding "!", "?", "..." symbols.
+The more there are uppercase words or "!", "?", "..." symbols, the higher emotional intensity level is.
+Higher emotional intensity must be associated with lower values of "stability" parameter,
+and lower emotional intensity must be associated with higher "stability" values.
+Low "stability" makes TTS to generate more expressive, less stable speech - better suited to convey emotional range.
+
+Available range for "stability" values is [0.3; 0.8].
+
+Text chunks are provided as a JSON object, mapping chunk id to chunk text.
+Select "stability" value for each chunk independently of other chunks.
+
+You MUST answer with the JSON object, mapping EACH chunk id to the selected "stability" value:
+{"<chunk id>": float}
+DO NOT INCLUDE ANYTHING ELSE in your response.
+
+Example:
+Input: {"0": "I CAN'T believe this is happening... Who would expect it??", "1": "He closed the door."}
+Expected output: {"0": 0.4, "1": 0.75}
+"""
+
 # TODO: this prompt is not used
 TEXT_MODIFICATION_WITH_SSML = """
 You should help me to make an audiobook with overabundant emotion-based voice using TTS.
@@ -0,0 +1,305 @@
+import asyncio
+import re
+import time
+import typing as t
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from pydantic import BaseModel
+
+from src.config import (
+    ELEVENLABS_CHARS_PER_MIN,
+    ELEVENLABS_MAX_PARALLEL,
+    ELEVENLABS_REQUESTS_PER_MIN,
+    OPENAI_MAX_PARALLEL,
+    OPENAI_REQUESTS_PER_MIN,
+    OPENAI_TOKENS_PER_MIN,
+    logger,
+)
+
+# durations in openai rate limit headers look like "1s", "6m0s", "20ms"
+DURATION_PART_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNIT_SEC = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+RESET_HEADERS = ('retry-after', 'x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens')
+
+# requests made outside of any job are scheduled as a separate job
+DEFAULT_JOB_ID = '__default__'
+
+
+class JobSchedulingInfo(BaseModel):
+    job_id: str
+    # job with priority 2 gets twice as many request slots as job with priority 1
+    priority: float = 1.0
+
+
+CURRENT_JOB: ContextVar[JobSchedulingInfo | None] = ContextVar('current_job', default=None)
+
+
+@contextmanager
+def current_job(job_id: str, priority: float = 1.0):
+    """
+    Attribute requests to the job for fair scheduling.
+    NOTE: asyncio tasks copy context on creation,
+    so tasks created inside the context keep the job after it's exited.
+    """
+    if priority <= 0:
+        raise ValueError(f'job priority must be positive, got: {priority}')
+    token = CURRENT_JOB.set(JobSchedulingInfo(job_id=job_id, priority=priority))
+    try:
+        yield
+    finally:
+        CURRENT_JOB.reset(token)
+
+
+def _parse_duration_sec(value: str) -> float | None:
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(num) * DURATION_UNIT_SEC[unit] for num, unit in parts)
+
+
+def get_rate_limit_retry_after(exc: BaseException) -> tuple[bool, float | None]:
+    """
+    Check if exception is a rate limit (429) error of 11labs or openai client.
+    Return `(is_rate_limited, seconds to wait before retry if known)`.
+    """
+    response = getattr(exc, 'response', None)
+    status_code = getattr(exc, 'status_code', None) or getattr(response, 'status_code', None)
+    if status_code != 429:
+        return False, None
+
+    headers = getattr(exc, 'headers', None) or getattr(response, 'headers', None) or {}
+    waits = []
+    for header in RESET_HEADERS:
+        value = headers.get(header)
+        if value is not None and (wait := _parse_duration_sec(str(value))) is not None:
+            waits.append(wait)
+    return True, max(waits) if waits else None
+
+
+class TokenBucket:
+    """Allows to spend up to `per_min` units per minute, with bursts up to `per_min` units."""
+
+    def __init__(self, per_min: float):
+        self.capacity = per_min
+        self.refill_rate = per_min / 60
+        self._tokens = per_min
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        refill = (now - self._updated_at) * self.refill_rate
+        self._tokens = min(self.capacity, self._tokens + refill)
+        self._updated_at = now
+
+    async def acquire(self, amount: float):
+        # NOTE: request larger than the bucket capacity waits for the full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return
+            await asyncio.sleep((amount - self._tokens) / self.refill_rate)
+
+
+class AdaptiveRateLimiter:
+    """
+    Process-wide limiter of requests to a single API provider, shared by all concurrent runs.
+
+    Limits number of concurrent requests, requests per minute and units
+    (characters or tokens) per minute.
+    Concurrency limit adapts to the provider: it's halved on rate limit (429) errors
+    and slowly grows back on successful requests (AIMD).
+    If rate limit error specifies when to retry, all new requests wait until then.
+
+    Waiting requests are fairly shared between jobs (see `current_job()`),
+    using weighted fair queueing: each job has a virtual time, advanced by `1 / priority`
+    on each granted request, and the next slot goes to the job with the smallest virtual time.
+    Thus a big job can't starve small jobs submitted later, but uses all idle capacity.
+    Requests of the same job are served in FIFO order.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        requests_per_min: float | None = None,
+        units_per_min: float | None = None,
+        min_concurrency: int = 1,
+        decrease_cooldown_sec: float = 1.0,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.requests_per_min = requests_per_min
+        self.units_per_min = units_per_min
+        self.decrease_cooldown_sec = decrease_cooldown_sec
+        self._concurrency = float(max_concurrency)
+        self._paused_until = 0.0
+        self._last_decrease_at = 0.0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._reset_state()
+
+    def _reset_state(self):
+        self._in_flight = 0
+        # job id -> waiting requests
+        self._waiters: dict[str, deque[asyncio.Future]] = {}
+        # job id -> (virtual time, priority), for jobs with waiting requests
+        self._jobs: dict[str, tuple[float, float]] = {}
+        # virtual time of the last granted request
+        self._vtime = 0.0
+        self._requests_bucket = (
+            TokenBucket(self.requests_per_min) if self.requests_per_min else None
+        )
+        self._units_bucket = TokenBucket(self.units_per_min) if self.units_per_min else None
+
+    def _check_loop(self):
+        # NOTE: asyncio primitives are bound to event loop.
+        # state is reset if limiter is used from a new loop, e.g. after `asyncio.run()`
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._reset_state()
+
+    @property
+    def concurrency_limit(self) -> int:
+        return int(self._concurrency)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting for a free slot."""
+        return sum(self.queue_depth_by_job.values())
+
+    @property
+    def queue_depth_by_job(self) -> dict[str, int]:
+        return {
+            job_id: n_waiting
+            for job_id, waiters in self._waiters.items()
+            if (n_waiting := sum(not fut.done() for fut in waiters))
+        }
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _pop_next_waiter(self) -> asyncio.Future | None:
+        # NOTE: number of jobs with waiting requests is small, so linear scan is fine
+        while self._waiters:
+            job_id = min(self._waiters, key=lambda x: self._jobs[x][0])
+            waiters = self._waiters[job_id]
+            fut = waiters.popleft()
+            if not waiters:
+                del self._waiters[job_id]
+            if fut.done():
+                # cancelled waiter
+                if job_id not in self._waiters:
+                    del self._jobs[job_id]
+                continue
+
+            vtime, priority = self._jobs.pop(job_id)
+            self._vtime = vtime
+            if job_id in self._waiters:
+                self._jobs[job_id] = (vtime + 1 / priority, priority)
+            return fut
+        return None
+
+    def _wake_waiters(self):
+        while self._in_flight < self.concurrency_limit:
+            fut = self._pop_next_waiter()
+            if fut is None:
+                return
+            self._in_flight += 1
+            fut.set_result(None)
+
+    async def _acquire_slot(self):
+        if not self._waiters and self._in_flight < self.concurrency_limit:
+            self._in_flight += 1
+            return
+
+        job = CURRENT_JOB.get()
+        job_id, priority = (job.job_id, job.priority) if job else (DEFAULT_JOB_ID, 1.0)
+        if job_id not in self._waiters:
+            # NOTE: job becoming active starts at the current virtual time,
+            # so it's not compensated for the time it was idle
+            self._waiters[job_id] = deque()
+            self._jobs[job_id] = (self._vtime, priority)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[job_id].append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # NOTE: slot could be granted right before cancellation
+            if fut.done() and not fut.cancelled():
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        self._in_flight -= 1
+        self._wake_waiters()
+
+    def _on_success(self):
+        # additive increase: +1 slot after a full window of successful requests
+        if self._concurrency < self.max_concurrency:
+            self._concurrency = min(
+                self.max_concurrency, self._concurrency + 1 / self.concurrency_limit
+            )
+            self._wake_waiters()
+
+    def _on_rate_limited(self, retry_after_sec: float | None):
+        now = time.monotonic()
+        # NOTE: burst of concurrent 429 errors decreases concurrency only once
+        if now - self._last_decrease_at > self.decrease_cooldown_sec:
+            self._concurrency = max(self.min_concurrency, self._concurrency / 2)
+            self._last_decrease_at = now
+        if retry_after_sec is not None:
+            self._paused_until = max(self._paused_until, now + retry_after_sec)
+        logger.warning(
+            f'{self.name} rate limiter: got rate limit error, retry after: {retry_after_sec}s. '
+            f'concurrency limit: {self.concurrency_limit}, in flight: {self.in_flight}, '
+            f'queue depth: {self.queue_depth}'
+        )
+
+    @asynccontextmanager
+    async def limit(self, units: float = 0) -> t.AsyncIterator[None]:
+        """Wait for a free slot and rate limits, then run the request inside the context."""
+        self._check_loop()
+        await self._acquire_slot()
+        try:
+            while (delay := self._paused_until - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            if self._requests_bucket is not None:
+                await self._requests_bucket.acquire(1)
+            if self._units_bucket is not None and units > 0:
+                await self._units_bucket.acquire(units)
+
+            try:
+                yield
+            except Exception as e:
+                is_rate_limited, retry_after_sec = get_rate_limit_retry_after(e)
+                if is_rate_limited:
+                    self._on_rate_limited(retry_after_sec)
+                raise
+            self._on_success()
+        finally:
+            self._release_slot()
+
+
+OPENAI_LIMITER = AdaptiveRateLimiter(
+    name='openai',
+    max_concurrency=OPENAI_MAX_PARALLEL,
+    requests_per_min=OPENAI_REQUESTS_PER_MIN,
+    units_per_min=OPENAI_TOKENS_PER_MIN,
+)
+ELEVENLABS_LIMITER = AdaptiveRateLimiter(
+    name='11labs',
+    max_concurrency=ELEVENLABS_MAX_PARALLEL,
+    requests_per_min=ELEVENLABS_REQUESTS_PER_MIN,
+    units_per_min=ELEVENLABS_CHARS_PER_MIN,
+)
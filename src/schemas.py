@@ -4,9 +4,17 @@ import base64
 import typing as t
 from enum import StrEnum
 
+import numpy as np
 import pandas as pd
 from elevenlabs import VoiceSettings
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    field_validator,
+    model_serializer,
+    model_validator,
+)
 
 from src import utils
 
@@ -91,27 +99,99 @@ class TTSParams(ExtraForbidModel):
 
 
 class TTSTimestampsAlignment(ExtraForbidModel):
-    characters: list[str]
-    character_start_times_seconds: list[float]
-    character_end_times_seconds: list[float]
-    _text_joined: str
+    """
+    Start and end time of each character of voiced text.
 
-    def __init__(self, **data):
-        super().__init__(**data)
-        self._text_joined = "".join(self.characters)
+    Stored in a columnar form: characters joined in a single string
+    and float32 arrays of start and end times.
+    Validated from and serialized to the 11labs json format:
+    `characters`, `character_start_times_seconds` and `character_end_times_seconds` lists.
+
+    NOTE: instances are immutable. Slicing returns views of the same arrays.
+    """
+
+    model_config = ConfigDict(extra="forbid", frozen=True, arbitrary_types_allowed=True)
+
+    text: str
+    starts: np.ndarray
+    ends: np.ndarray
+
+    @model_validator(mode="before")
+    @classmethod
+    def _from_lists(cls, data):
+        if isinstance(data, dict) and "characters" in data:
+            data = dict(data)
+            # NOTE: 11labs returns single characters. if it doesn't,
+            # keep the first one to preserve mapping between characters and times
+            data["text"] = "".join(char[:1] or " " for char in data.pop("characters"))
+            data["starts"] = data.pop("character_start_times_seconds", None)
+            data["ends"] = data.pop("character_end_times_seconds", None)
+        return data
+
+    @field_validator("starts", "ends", mode="before")
+    @classmethod
+    def _to_float32_array(cls, value):
+        if value is None:
+            raise ValueError("character times are required")
+        arr = np.asarray(value, dtype=np.float32)
+        if arr.ndim != 1:
+            raise ValueError(f"character times must be 1-dimensional, got shape: {arr.shape}")
+        return arr
+
+    @model_validator(mode="after")
+    def _check_lengths(self):
+        if not (len(self.text) == len(self.starts) == len(self.ends)):
+            raise ValueError(
+                f"alignment lengths mismatch: {len(self.text)} characters, "
+                f"{len(self.starts)} start times, {len(self.ends)} end times"
+            )
+        return self
+
+    @model_serializer
+    def _to_lists(self) -> dict:
+        return {
+            "characters": list(self.text),
+            "character_start_times_seconds": self.starts.tolist(),
+            "character_end_times_seconds": self.ends.tolist(),
+        }
+
+    @classmethod
+    def _from_arrays(
+        cls, text: str, starts: np.ndarray, ends: np.ndarray
+    ) -> TTSTimestampsAlignment:
+        # NOTE: skip validation for arrays created internally
+        return cls.model_construct(
+            text=text,
+            starts=starts.astype(np.float32, copy=False),
+            ends=ends.astype(np.float32, copy=False),
+        )
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def __getitem__(self, ixs: slice) -> TTSTimestampsAlignment:
+        if not isinstance(ixs, slice):
+            raise TypeError(f"alignment can only be sliced, got: {type(ixs)}")
+        return self._from_arrays(text=self.text[ixs], starts=self.starts[ixs], ends=self.ends[ixs])
+
+    @property
+    def text_joined(self) -> str:
+        return self.text
 
     @property
-    def text_joined(self):
-        return self._text_joined
+    def characters(self) -> list[str]:
+        return list(self.text)
+
+    @property
+    def character_start_times_seconds(self) -> list[float]:
+        return self.starts.tolist()
+
+    @property
+    def character_end_times_seconds(self) -> list[float]:
+        return self.ends.tolist()
 
     def to_dataframe(self):
-        return pd.DataFrame(
-            {
-                "char": self.characters,
-                "start": self.character_start_times_seconds,
-                "end": self.character_end_times_seconds,
-            }
-        )
+        return pd.DataFrame({"char": self.characters, "start": self.starts, "end": self.ends})
 
     @classmethod
     def combine_alignments(
@@ -133,67 +213,60 @@ class TTSTimestampsAlignment(ExtraForbidModel):
         NOTE: The quality of such approximation seems appropriate,
         considering the amount of time required to implement more accurate mapping.
         """
-
-        chars = []
-        starts = []
-        ends = []
-        prev_chunk_end_time = 0.0
-        n_alignments = len(alignments)
-
-        for ix, a in enumerate(alignments):
-            cur_starts_absolute = [prev_chunk_end_time + s for s in a.character_start_times_seconds]
-            cur_ends_absolute = [prev_chunk_end_time + e for e in a.character_end_times_seconds]
-
-            chars.extend(a.characters)
-            starts.extend(cur_starts_absolute)
-            ends.extend(cur_ends_absolute)
-
-            if ix < n_alignments - 1 and add_placeholders:
-                chars.append('#')
-                placeholder_start = cur_ends_absolute[-1]
-                starts.append(placeholder_start)
-                ends.append(placeholder_start + pause_bw_chunks_s)
-
-            prev_chunk_end_time = ends[-1]
-
-        return cls(
-            characters=chars,
-            character_start_times_seconds=starts,
-            character_end_times_seconds=ends,
-        )
+        if not alignments:
+            return cls._from_arrays(text="", starts=np.empty(0), ends=np.empty(0))
+
+        lengths = np.array([len(a) for a in alignments])
+        # NOTE: offsets are accumulated in float64 to avoid precision loss on long texts
+        durations = np.array([a.ends[-1] if len(a) else 0.0 for a in alignments], dtype=np.float64)
+        if add_placeholders:
+            durations[:-1] += pause_bw_chunks_s
+        offsets = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+
+        offsets_per_char = np.repeat(offsets, lengths)
+        starts = np.concatenate([a.starts for a in alignments]) + offsets_per_char
+        ends = np.concatenate([a.ends for a in alignments]) + offsets_per_char
+
+        if not add_placeholders:
+            text = "".join(a.text for a in alignments)
+            return cls._from_arrays(text=text, starts=starts, ends=ends)
+
+        # placeholder after each chunk except the last one
+        text = "#".join(a.text for a in alignments)
+        placeholder_ixs = np.cumsum(lengths)[:-1]
+        placeholder_starts = offsets[1:] - pause_bw_chunks_s
+        starts = np.insert(starts, placeholder_ixs, placeholder_starts)
+        ends = np.insert(ends, placeholder_ixs, offsets[1:])
+        return cls._from_arrays(text=text, starts=starts, ends=ends)
+
+    def _select(self, mask: np.ndarray) -> TTSTimestampsAlignment:
+        # NOTE: numpy unicode array shares layout with utf-32 encoded string
+        chars = np.frombuffer(self.text.encode("utf-32-le"), dtype="<U1")
+        text = chars[mask].tobytes().decode("utf-32-le")
+        return self._from_arrays(text=text, starts=self.starts[mask], ends=self.ends[mask])
 
     def filter_chars_without_duration(self):
         """
         Create new class instance with characters with 0 duration removed.
         Needed to provide correct alignment when overlaying sound effects.
         """
-        df = self.to_dataframe()
-        mask = (df['start'] - df['end']).abs() > 1e-5
-        df = df[mask]
-
-        res = TTSTimestampsAlignment(
-            characters=df['char'].to_list(),
-            character_start_times_seconds=df['start'].to_list(),
-            character_end_times_seconds=df['end'].to_list(),
-        )
+        return self._select(np.abs(self.starts - self.ends) > 1e-5)
 
-        return res
+    def drop_chars(self, char_ixs: list[int]) -> TTSTimestampsAlignment:
+        """Create new class instance without characters at given indices."""
+        mask = np.ones(len(self), dtype=bool)
+        mask[char_ixs] = False
+        return self._select(mask)
 
     def get_start_time_by_char_ix(self, char_ix: int, safe=True):
         if safe:
-            char_ix = utils.get_collection_safe_index(
-                ix=char_ix,
-                collection=self.character_start_times_seconds,
-            )
-        return self.character_start_times_seconds[char_ix]
+            char_ix = utils.get_collection_safe_index(ix=char_ix, collection=self.starts)
+        return float(self.starts[char_ix])
 
     def get_end_time_by_char_ix(self, char_ix: int, safe=True):
         if safe:
-            char_ix = utils.get_collection_safe_index(
-                ix=char_ix,
-                collection=self.character_end_times_seconds,
-            )
-        return self.character_end_times_seconds[char_ix]
+            char_ix = utils.get_collection_safe_index(ix=char_ix, collection=self.ends)
+        return float(self.ends[char_ix])
 
 
 class TTSTimestampsResponse(ExtraForbidModel):
@@ -1,6 +1,7 @@
+import hashlib
+import typing as t
 from enum import StrEnum
 
-import pandas as pd
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import (
     ChatPromptTemplate,
@@ -10,9 +11,11 @@ from langchain_core.prompts import (
 from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel
 
-from src.config import VOICES_CSV_FP, logger
+from src.clients import CLIENTS
+from src.config import VOICE_ALLOCATION_SEED, logger
 from src.prompts import CharacterVoicePropertiesPrompt
 from src.utils import GPTModels, get_chat_llm
+from src.voice_catalog import VOICE_CATALOG, VoiceCatalog
 
 
 class Property(StrEnum):
@@ -54,71 +57,109 @@ class VoiceSelector:
         Property.gender: {"male", "female"},
         Property.age_group: {"young", "middle_aged", "old"},
     }
+    # used to find the nearest age group if there're no voices left for the requested one
+    AGE_GROUPS_ORDER = ("young", "middle_aged", "old")
 
-    def __init__(self):
-        self.df = self.read_data_table(csv_table_fp=VOICES_CSV_FP)
-
-    def read_data_table(self, csv_table_fp: str):
-        logger.info(f'reading voice data from: "{csv_table_fp}"')
-        df = pd.read_csv(csv_table_fp)
-        logger.info(f"{df.shape=}")
-        df["age"] = df["age"].str.replace(" ", "_").str.replace("-", "_")
-
-        if "manual_quality_review" in df.columns:
-            logger.info('filtering df by "manual_quality_review" column')
-
-            # TODO: may need to use clever sampling, since we limit number of voices available.
-            # some property groups have small number of voices left.
-            # ix_to_drop = df[df["manual_quality_review"].isin(["very bad"])].index
-            ix_to_drop = df[df["manual_quality_review"].isin(["very bad", "bad"])].index
-
-            df.drop(index=ix_to_drop, inplace=True)
-            logger.info(f"df.shape after filtering voices: {df.shape}")
-
-        return df
+    def __init__(self, catalog: VoiceCatalog = VOICE_CATALOG, seed: int = VOICE_ALLOCATION_SEED):
+        self.catalog = catalog
+        # NOTE: changing seed changes voices selected for characters
+        self.seed = seed
+        # llm model -> (openai http client the chain was built with, chain)
+        self._voice_mapping_chains: dict[GPTModels, tuple[t.Any, t.Any]] = {}
 
     def get_available_properties_str(self, prop: Property):
         vals = self.PROPERTY_VALUES[prop]
         res = ", ".join(f'"{v}"' for v in vals)
         return res
 
-    def _get_voices_single_props(
-        self, character_props: CharacterPropertiesNullable, n_characters: int
-    ):
-        if n_characters <= 0:
-            raise ValueError(n_characters)
-
-        df_filtered = self.df
-        if val := character_props.gender:
-            df_filtered = df_filtered[df_filtered["gender"] == val]
-        if val := character_props.age_group:
-            df_filtered = df_filtered[df_filtered["age"] == val]
-
-        voice_ids = df_filtered.sample(n_characters)["voice_id"].to_list()
-        return voice_ids
+    def _get_fallback_buckets(
+        self, character_props: CharacterPropertiesNullable
+    ) -> list[tuple[str | None, str | None]]:
+        """
+        (gender, age group) buckets to pick voice from, starting from the requested one.
+        Other buckets are ordered by distance: same gender with the nearest age group first,
+        then the other gender. Missing property matches any value.
+        """
+        gender, age_group = character_props.gender, character_props.age_group
+        age_ix = {age: ix for ix, age in enumerate(self.AGE_GROUPS_ORDER)}
+
+        def _distance(bucket: tuple[str, str]) -> tuple[int, int]:
+            bucket_gender, bucket_age_group = bucket
+            gender_dist = int(gender is not None and bucket_gender != gender)
+            age_dist = (
+                abs(age_ix[bucket_age_group] - age_ix[age_group]) if age_group in age_ix else 0
+            )
+            return gender_dist, age_dist
+
+        buckets = sorted(
+            (
+                (bucket_gender, bucket_age_group)
+                for bucket_gender in sorted(self.PROPERTY_VALUES[Property.gender])
+                for bucket_age_group in self.AGE_GROUPS_ORDER
+            ),
+            key=_distance,
+        )
+        # NOTE: any available voice is the last resort
+        return [(gender, age_group)] + buckets + [(None, None)]
+
+    def _get_voice_score(self, character: str, voice_id: str) -> int:
+        """Rendezvous hashing score: character gets the voice with the highest score."""
+        key = f'{self.seed}:{character}:{voice_id}'.encode('utf-8')
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+
+    def _allocate_voices(
+        self,
+        character2props: dict[str, CharacterPropertiesNullable],
+        reserved_voice_ids: t.Iterable[str] = (),
+    ) -> dict[str, str]:
+        """
+        Map characters to voices, not reusing voices across characters.
+
+        Voice for each character is selected with rendezvous hashing among voices of its
+        (gender, age group) bucket. Thus selection is deterministic for a given `seed`:
+        characters keep their voices across reruns, and mostly keep them
+        if other characters are added or removed.
+        If the bucket runs out of unused voices, the nearest bucket is used.
+        Voices are reused only if all available voices are already taken.
+        `reserved_voice_ids` are treated as taken, e.g. voices of characters known from before.
+        """
+        character2voice = {}
+        used_voice_ids = set(reserved_voice_ids)
+        # NOTE: characters are processed in a fixed order, so results don't depend on dict order
+        for character in sorted(character2props):
+            props = character2props[character]
+            voice_id = None
+            for bucket_gender, bucket_age_group in self._get_fallback_buckets(props):
+                candidates = [
+                    voice.voice_id
+                    for voice in self.catalog.find(gender=bucket_gender, age_group=bucket_age_group)
+                    if voice.voice_id not in used_voice_ids
+                ]
+                if candidates:
+                    voice_id = max(candidates, key=lambda x: self._get_voice_score(character, x))
+                    break
+            if voice_id is None:
+                logger.warning(f'all voices are taken, reusing voice for character "{character}"')
+                voice_id = max(
+                    (voice.voice_id for voice in self.catalog.voices),
+                    key=lambda x: self._get_voice_score(character, x),
+                )
+            elif (bucket_gender, bucket_age_group) != (props.gender, props.age_group):
+                logger.info(
+                    f'no unused voices with {props} for character "{character}", '
+                    f'selected voice with gender={bucket_gender}, age_group={bucket_age_group}'
+                )
+            used_voice_ids.add(voice_id)
+            character2voice[character] = voice_id
+        return character2voice
 
     def get_voices(self, inputs: dict) -> dict:
         character_props: AllCharactersPropertiesNullable = inputs["charater_props"]
-
-        # check for Nones.
-        # TODO: for simplicity we raise error if LLM failed to select valid property value.
-        # else, we would need to implement clever mapping to avoid overlapping between voices.
-        for char, props in character_props.character2props.items():
-            if props.age_group is None or props.gender is None:
-                raise ValueError(props)
-
-        prop2character = {}
-        for character, props in character_props.character2props.items():
-            prop2character.setdefault(props, set()).add(character)
-
-        character2voice = {}
-        for props, characters in prop2character.items():
-            voice_ids = self._get_voices_single_props(
-                character_props=props, n_characters=len(characters)
-            )
-            character2voice.update(zip(characters, voice_ids))
-
-        return character2voice
+        # NOTE: properties LLM failed to select are None and match voices with any value
+        return self._allocate_voices(
+            character2props=character_props.character2props,
+            reserved_voice_ids=inputs.get("reserved_voice_ids", ()),
+        )
 
     def _remove_hallucinations_single_character(self, character_props: CharacterProperties):
         def _process_prop(prop: Property, value: str):
@@ -154,7 +195,21 @@ class VoiceSelector:
         )
 
     def create_voice_mapping_chain(self, llm_model: GPTModels):
-        llm = get_chat_llm(llm_model=llm_model, temperature=0.0)
+        """
+        Chain is built once per selector and LLM model, since it's bound to the selector.
+        NOTE: API clients are bound to the event loop, so chain is rebuilt
+        if it's used with other clients, i.e. in another event loop.
+        """
+        http_client = CLIENTS.openai_http
+        cached = self._voice_mapping_chains.get(llm_model)
+        if cached is None or cached[0] is not http_client:
+            cached = (http_client, self._build_voice_mapping_chain(llm_model))
+            self._voice_mapping_chains[llm_model] = cached
+        return cached[1]
+
+    def _build_voice_mapping_chain(self, llm_model: GPTModels):
+        # NOTE: output is a short json with properties of characters
+        llm = get_chat_llm(llm_model=llm_model, temperature=0.0, output_tokens_ratio=0.0)
         llm = llm.with_structured_output(AllCharactersProperties, method="json_mode")
 
         output_parser = PydanticOutputParser(pydantic_object=AllCharactersProperties)
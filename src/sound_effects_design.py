@@ -10,6 +10,7 @@ from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel
 
 from src import prompts
+from src.clients import cached_chain
 from src.utils import GPTModels, get_chat_llm
 
 
@@ -80,7 +81,43 @@ class SoundEffectsDesignOutput(BaseModel):
     def sound_effects_descriptions(self) -> list[SoundEffectDescription]:
         return self._sound_effects_descriptions
 
+    @classmethod
+    def merge(
+        cls, outputs: list['SoundEffectsDesignOutput'], text_offsets: list[int]
+    ) -> 'SoundEffectsDesignOutput':
+        """
+        Merge outputs obtained for consecutive chunks of the same text.
+        `text_offsets` are indices of chunks starts in the full text.
+        Effect indices are shifted to be relative to the full text and merged LLM responses.
+        """
+        res = cls(
+            text_raw=''.join(out.text_raw for out in outputs),
+            text_annotated=''.join(out.text_annotated for out in outputs),
+        )
+
+        descriptions = []
+        llm_response_offset = 0
+        for out, text_offset in zip(outputs, text_offsets):
+            for sed in out.sound_effects_descriptions:
+                descriptions.append(
+                    sed.model_copy(
+                        update=dict(
+                            ix_start_llm_response=sed.ix_start_llm_response + llm_response_offset,
+                            ix_end_llm_response=sed.ix_end_llm_response + llm_response_offset,
+                            ix_start_orig_text=sed.ix_start_orig_text + text_offset,
+                            ix_end_orig_text=sed.ix_end_orig_text + text_offset,
+                        )
+                    )
+                )
+            llm_response_offset += len(out.text_annotated)
+
+        # NOTE: indices parsed from merged LLM response are relative to the merged response.
+        # they drift if LLM didn't preserve chunk text, so we use per-chunk indices instead
+        res._sound_effects_descriptions = descriptions
+        return res
+
 
+@cached_chain
 def create_sound_effects_design_chain(llm_model: GPTModels):
     llm = get_chat_llm(llm_model=llm_model, temperature=0.0)
 
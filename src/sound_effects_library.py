@@ -0,0 +1,329 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from pydantic import BaseModel
+
+from src.cache import get_total_size, track_total_size
+from src.config import (
+    SOUND_EFFECTS_LIBRARY_DB_FP,
+    SOUND_EFFECTS_LIBRARY_MAX_SIZE_MB,
+    SOUND_EFFECTS_REUSE_DURATION_TOLERANCE_SEC,
+    SOUND_EFFECTS_REUSE_MAX_TRIM_RATIO,
+    SOUND_EFFECTS_REUSE_MIN_SIMILARITY,
+    logger,
+)
+from src.schemas import SoundEffectsParams
+
+_WORD_PATTERN = re.compile(r'[a-z0-9]+')
+_STOP_WORDS = frozenset(
+    'a an the of in on at to into onto from by with and or as is are be being its it '
+    'some sound sounds noise'.split()
+)
+
+
+def _stem(word: str) -> str:
+    """Crude suffix stripping, so that "creaks", "creaking" and "creaked" match."""
+    for suffix in ('ing', 'ed', 'ly'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[: -len(suffix)]
+            # "running" -> "runn" -> "run"
+            if word[-1] == word[-2] and word[-1] not in 'lsz':
+                word = word[:-1]
+            return word
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        word = word[:-1]
+    if word.endswith('e') and len(word) > 3:
+        word = word[:-1]
+    return word
+
+
+def normalize_prompt(prompt: str) -> frozenset[str]:
+    """Set of stemmed words of the prompt, without stop words. Word order is ignored."""
+    words = _WORD_PATTERN.findall(prompt.lower())
+    return frozenset(_stem(word) for word in words if word not in _STOP_WORDS)
+
+
+def get_prompts_similarity(tokens_a: frozenset[str], tokens_b: frozenset[str]) -> float:
+    """Jaccard similarity of normalized prompts."""
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+class SoundEffectClip(BaseModel):
+    clip_id: int
+    prompt: str
+    duration_sec: float
+    similarity: float
+    audio_bytes: bytes
+
+
+class _ClipEntry(BaseModel):
+    tokens: frozenset[str]
+    prompt_influence: float | None
+    duration_sec: float
+
+
+class SoundEffectsLibrary:
+    """
+    Persistent library of generated sound effects, backed by SQLite.
+
+    Clips are looked up by similarity of normalized prompts, so that
+    "door creaks open" reuses the clip generated for "a creaking door opens".
+    Clip is reused only if it's long enough for the requested duration
+    and not much longer, since it's trimmed to the requested duration.
+
+    Prompts of all clips are kept in memory in an inverted index (word -> clips),
+    so lookup compares the query only with clips sharing at least one word.
+    Audio is read from the database only for the matched clip.
+    Once total size of clips exceeds `max_size_bytes`, least recently used clips are evicted.
+
+    NOTE: library is shared by worker processes. Clips added by other processes
+    are picked up from the database on the next lookup.
+    NOTE: methods do blocking disk I/O, so async code should call them in a thread.
+    """
+
+    def __init__(
+        self,
+        db_fp: str = SOUND_EFFECTS_LIBRARY_DB_FP,
+        max_size_bytes: int = SOUND_EFFECTS_LIBRARY_MAX_SIZE_MB * 1024 * 1024,
+        min_similarity: float = SOUND_EFFECTS_REUSE_MIN_SIMILARITY,
+        max_trim_ratio: float = SOUND_EFFECTS_REUSE_MAX_TRIM_RATIO,
+        duration_tolerance_sec: float = SOUND_EFFECTS_REUSE_DURATION_TOLERANCE_SEC,
+    ):
+        self.db_fp = db_fp
+        self.max_size_bytes = max_size_bytes
+        self.min_similarity = min_similarity
+        self.max_trim_ratio = max_trim_ratio
+        self.duration_tolerance_sec = duration_tolerance_sec
+        self.hits = 0
+        self.misses = 0
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._entries: dict[int, _ClipEntry] = {}
+        self._token2ids: dict[str, set[int]] = {}
+        # max id of clips loaded into the index
+        self._max_id = 0
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            logger.info(f'opening sound effects library: "{self.db_fp}"')
+            os.makedirs(os.path.dirname(self.db_fp) or '.', exist_ok=True)
+            conn = sqlite3.connect(
+                self.db_fp, timeout=30, check_same_thread=False, isolation_level=None
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            # NOTE: audio is the last column, so that reading other columns
+            # doesn't read overflow pages of the audio
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS clips ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, prompt TEXT NOT NULL, '
+                'prompt_norm TEXT NOT NULL, prompt_influence REAL, duration_sec REAL NOT NULL, '
+                'size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL, '
+                'audio BLOB NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS clips_accessed_at ON clips (accessed_at)')
+            track_total_size(conn, table='clips')
+            self._conn = conn
+        return self._conn
+
+    def _sync_index(self, conn: sqlite3.Connection):
+        """Load clips added since the last sync, including ones added by other processes."""
+        rows = conn.execute(
+            'SELECT id, prompt_norm, prompt_influence, duration_sec FROM clips WHERE id > ?',
+            (self._max_id,),
+        ).fetchall()
+        for clip_id, prompt_norm, prompt_influence, duration_sec in rows:
+            entry = _ClipEntry(
+                tokens=frozenset(prompt_norm.split()),
+                prompt_influence=prompt_influence,
+                duration_sec=duration_sec,
+            )
+            self._entries[clip_id] = entry
+            for token in entry.tokens:
+                self._token2ids.setdefault(token, set()).add(clip_id)
+            self._max_id = max(self._max_id, clip_id)
+
+    def _remove_from_index(self, clip_id: int):
+        entry = self._entries.pop(clip_id, None)
+        if entry is None:
+            return
+        for token in entry.tokens:
+            ids = self._token2ids.get(token)
+            if ids is not None:
+                ids.discard(clip_id)
+                if not ids:
+                    del self._token2ids[token]
+
+    def is_reusable(self, clip_duration_sec: float, duration_sec: float | None) -> bool:
+        """Whether clip of given duration can be trimmed to the requested duration."""
+        if duration_sec is None:
+            # duration is chosen by the model
+            return True
+        return (
+            duration_sec - self.duration_tolerance_sec
+            <= clip_duration_sec
+            <= duration_sec * self.max_trim_ratio
+        )
+
+    def _get_reuse_similarity(
+        self,
+        tokens: frozenset[str],
+        params: SoundEffectsParams,
+        clip_tokens: frozenset[str],
+        clip_prompt_influence: float | None,
+        clip_duration_sec: float,
+    ) -> float | None:
+        """Similarity of the clip to the request, or None if the clip can't be reused for it."""
+        if clip_prompt_influence != params.prompt_influence:
+            return None
+        if not self.is_reusable(clip_duration_sec, params.duration_seconds):
+            return None
+        similarity = get_prompts_similarity(tokens, clip_tokens)
+        return similarity if similarity >= self.min_similarity else None
+
+    def find(self, params: SoundEffectsParams) -> SoundEffectClip | None:
+        """Most similar stored clip which can be reused for the request."""
+        tokens = normalize_prompt(params.text)
+        if not tokens:
+            return None
+
+        with self._lock:
+            conn = self._get_conn()
+            self._sync_index(conn)
+
+            candidates = []
+            candidate_ids = set().union(*(self._token2ids.get(token, ()) for token in tokens))
+            for clip_id in candidate_ids:
+                entry = self._entries[clip_id]
+                similarity = self._get_reuse_similarity(
+                    tokens=tokens,
+                    params=params,
+                    clip_tokens=entry.tokens,
+                    clip_prompt_influence=entry.prompt_influence,
+                    clip_duration_sec=entry.duration_sec,
+                )
+                if similarity is None:
+                    continue
+                # prefer more similar prompts, then clips requiring less trimming
+                duration_diff = abs(entry.duration_sec - (params.duration_seconds or 0.0))
+                candidates.append((-similarity, duration_diff, clip_id))
+
+            for neg_similarity, _, clip_id in sorted(candidates):
+                row = conn.execute(
+                    'SELECT prompt, duration_sec, audio FROM clips WHERE id = ?', (clip_id,)
+                ).fetchone()
+                if row is None:
+                    # evicted by another process
+                    self._remove_from_index(clip_id)
+                    continue
+                conn.execute(
+                    'UPDATE clips SET accessed_at = ? WHERE id = ?', (time.time(), clip_id)
+                )
+                self.hits += 1
+                prompt, duration_sec, audio_bytes = row
+                logger.info(
+                    f'reusing sound effect "{prompt}" ({duration_sec:.1f}s) '
+                    f'for "{params.text}" ({params.duration_seconds}s), '
+                    f'similarity: {-neg_similarity:.2f}'
+                )
+                return SoundEffectClip(
+                    clip_id=clip_id,
+                    prompt=prompt,
+                    duration_sec=duration_sec,
+                    similarity=-neg_similarity,
+                    audio_bytes=audio_bytes,
+                )
+
+            self.misses += 1
+            return None
+
+    def add(self, params: SoundEffectsParams, duration_sec: float, audio_bytes: bytes):
+        """Store generated clip. `duration_sec` is the actual duration of the clip audio."""
+        tokens = normalize_prompt(params.text)
+        if not tokens:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                'INSERT INTO clips (prompt, prompt_norm, prompt_influence, duration_sec, '
+                'audio, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    params.text,
+                    ' '.join(sorted(tokens)),
+                    params.prompt_influence,
+                    duration_sec,
+                    audio_bytes,
+                    len(audio_bytes),
+                    now,
+                    now,
+                ),
+            )
+            self._evict(conn)
+            self._sync_index(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        total_size = get_total_size(conn, table='clips')
+        if total_size <= self.max_size_bytes:
+            return
+
+        ids_to_remove = []
+        rows = conn.execute('SELECT id, size FROM clips ORDER BY accessed_at ASC')
+        for clip_id, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            ids_to_remove.append(clip_id)
+            total_size -= size
+
+        conn.executemany('DELETE FROM clips WHERE id = ?', [(x,) for x in ids_to_remove])
+        for clip_id in ids_to_remove:
+            self._remove_from_index(clip_id)
+        logger.info(
+            f'sound effects library: evicted {len(ids_to_remove)} least recently used clips'
+        )
+
+    def group_similar(self, params_list: list[SoundEffectsParams]) -> list[int]:
+        """
+        Group similar requests of a single run, so that only one clip is generated per group.
+        Return index of the group leader for each request.
+        Longer requests become leaders, since their clips can be trimmed for shorter ones.
+        """
+        tokens_list = [normalize_prompt(params.text) for params in params_list]
+        order = sorted(
+            range(len(params_list)),
+            key=lambda ix: -(params_list[ix].duration_seconds or float('inf')),
+        )
+        leaders: list[int] = []
+        leader_ixs = list(range(len(params_list)))
+        for ix in order:
+            params = params_list[ix]
+            for leader_ix in leaders:
+                leader_params = params_list[leader_ix]
+                similarity = self._get_reuse_similarity(
+                    tokens=tokens_list[ix],
+                    params=params,
+                    clip_tokens=tokens_list[leader_ix],
+                    clip_prompt_influence=leader_params.prompt_influence,
+                    clip_duration_sec=leader_params.duration_seconds or float('inf'),
+                )
+                if similarity is not None:
+                    leader_ixs[ix] = leader_ix
+                    break
+            else:
+                leaders.append(ix)
+        return leader_ixs
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        logger.info(
+            f'sound effects library: {self.hits} reused, {self.misses} generated, '
+            f'reuse rate: {hit_rate:.1%}'
+        )
+
+
+SOUND_EFFECTS_LIBRARY = SoundEffectsLibrary()
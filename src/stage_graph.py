@@ -0,0 +1,96 @@
+import asyncio
+import time
+import typing as t
+
+from src.config import logger
+
+
+class StageGraph:
+    """
+    Run async pipeline stages as a dependency graph.
+
+    Each stage is started as soon as all stages it depends on are finished.
+    Results of dependencies are passed to the stage function as keyword arguments,
+    named after the dependency stages.
+
+    NOTE: stages must be added in topological order,
+    i.e. all dependencies of a stage must be added before the stage itself.
+    This guarantees the graph has no cycles.
+    """
+
+    def __init__(self, name: str = 'pipeline'):
+        self.name = name
+        self._funcs: dict[str, t.Callable[..., t.Awaitable[t.Any]]] = {}
+        self._deps: dict[str, list[str]] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._t0: float | None = None
+        # stage name -> (start, end) times in seconds, relative to the graph start
+        self._timings: dict[str, tuple[float, float]] = {}
+
+    def add_stage(
+        self,
+        name: str,
+        func: t.Callable[..., t.Awaitable[t.Any]],
+        deps: list[str] | None = None,
+    ):
+        if self._tasks:
+            raise RuntimeError(f'can\'t add stage "{name}": graph "{self.name}" already started')
+        if name in self._funcs:
+            raise ValueError(f'stage "{name}" already exists')
+        deps = deps or []
+        for dep in deps:
+            if dep not in self._funcs:
+                raise ValueError(f'unknown dependency "{dep}" for stage "{name}"')
+        self._funcs[name] = func
+        self._deps[name] = deps
+
+    @property
+    def stages(self) -> list[str]:
+        return list(self._funcs)
+
+    def start(self):
+        if self._tasks:
+            raise RuntimeError(f'graph "{self.name}" already started')
+        self._t0 = time.perf_counter()
+        # NOTE: stages are stored in topological order,
+        # so dependency tasks always exist when dependent stage task is created
+        for name in self._funcs:
+            self._tasks[name] = asyncio.create_task(
+                self._run_stage(name), name=f'{self.name}:{name}'
+            )
+
+    async def _run_stage(self, name: str):
+        deps_results = {dep: await self._tasks[dep] for dep in self._deps[name]}
+
+        start = time.perf_counter() - self._t0
+        logger.info(f'{self.name}: stage "{name}" started at {start:.2f}s')
+        res = await self._funcs[name](**deps_results)
+        end = time.perf_counter() - self._t0
+        logger.info(f'{self.name}: stage "{name}" finished in {end - start:.2f}s')
+
+        self._timings[name] = (start, end)
+        return res
+
+    async def result(self, name: str):
+        """Wait for the stage to finish and return its result."""
+        if name not in self._tasks:
+            raise KeyError(f'stage "{name}" is not running in graph "{self.name}"')
+        return await self._tasks[name]
+
+    def cancel(self):
+        """Cancel all unfinished stages."""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+
+    @property
+    def timings(self) -> dict[str, tuple[float, float]]:
+        return dict(self._timings)
+
+    def log_timings(self):
+        lines = [
+            f'{name}: start={start:.2f}s, end={end:.2f}s, duration={end - start:.2f}s'
+            for name, (start, end) in sorted(self._timings.items(), key=lambda x: x[1])
+        ]
+        total = max((end for _, end in self._timings.values()), default=0.0)
+        logger.info(f'{self.name}: stage timings (total {total:.2f}s):\n' + '\n'.join(lines))
@@ -7,6 +7,7 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel
 
+from src.clients import cached_chain
 from src.prompts import ModifyTextPrompt
 from src.utils import GPTModels, get_chat_llm
 
@@ -16,6 +17,7 @@ class ModifiedTextOutput(BaseModel):
     text_modified: str
 
 
+@cached_chain
 def modify_text_chain(llm_model: GPTModels):
     llm = get_chat_llm(llm_model=llm_model, temperature=0.0)
 
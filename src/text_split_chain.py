@@ -9,15 +9,39 @@ from langchain_core.prompts import (
 from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel
 
+from src.clients import cached_chain
 from src.prompts import SplitTextPrompt
 from src.utils import GPTModels, get_chat_llm
 
+# labels of characters whose names couldn't be identified by LLM: "c1", "c2", etc.
+UNKNOWN_CHARACTER_LABEL_PATTERN = re.compile(r'c(\d+)')
+
 
 class CharacterPhrase(BaseModel):
     character: str
     text: str
 
 
+class CoalescedPhrase(CharacterPhrase):
+    """Adjacent phrases of the same character, voiced by a single TTS request."""
+
+    # indices of merged phrases in `SplitTextOutput.phrases`
+    phrase_ixs: list[int]
+    # index of the first character of each merged phrase in `text`
+    text_offsets: list[int]
+    # length of each merged phrase in `text`, i.e. of its stripped text
+    text_lengths: list[int]
+
+    def get_separator_char_ixs(self) -> list[int]:
+        """Indices of characters in `text` added between merged phrases."""
+        ixs = []
+        for offset, length, next_offset in zip(
+            self.text_offsets, self.text_lengths, self.text_offsets[1:] + [len(self.text)]
+        ):
+            ixs.extend(range(offset + length, next_offset))
+        return ixs
+
+
 class SplitTextOutput(BaseModel):
     text_raw: str
     text_annotated: str
@@ -39,7 +63,6 @@ class SplitTextOutput(BaseModel):
         super().__init__(**data)
         self._phrases = self._parse_phrases_from_xml_tags(self.text_annotated)
         self._characters = list(set(phrase.character for phrase in self.phrases))
-        # TODO: can apply post-processing to merge same adjacent xml tags
 
     @property
     def phrases(self) -> list[CharacterPhrase]:
@@ -49,6 +72,102 @@ class SplitTextOutput(BaseModel):
     def characters(self) -> list[str]:
         return self._characters
 
+    def coalesce_phrases(self, max_len: int) -> list[CoalescedPhrase]:
+        """
+        Merge adjacent phrases of the same character, while merged text fits into `max_len`.
+        Same character is voiced with the same voice, so merged phrases can be voiced
+        by a single TTS request instead of several smaller ones.
+        Phrases longer than `max_len` are kept as is.
+
+        NOTE: phrase texts are stripped, same as texts sent to TTS,
+        so that alignment of TTS response matches the coalesced text.
+        Merged phrases are separated with a space.
+        """
+        coalesced: list[CoalescedPhrase] = []
+        for ix, phrase in enumerate(self.phrases):
+            text = phrase.text.strip()
+            prev = coalesced[-1] if coalesced else None
+            if prev is not None and prev.character == phrase.character:
+                sep = ' ' if prev.text and text else ''
+                if len(prev.text) + len(sep) + len(text) <= max_len:
+                    prev.text_offsets.append(len(prev.text) + len(sep))
+                    prev.text_lengths.append(len(text))
+                    prev.text += sep + text
+                    prev.phrase_ixs.append(ix)
+                    continue
+            coalesced.append(
+                CoalescedPhrase(
+                    character=phrase.character,
+                    text=text,
+                    phrase_ixs=[ix],
+                    text_offsets=[0],
+                    text_lengths=[len(text)],
+                )
+            )
+        return coalesced
+
+    @classmethod
+    def merge(cls, outputs: list['SplitTextOutput']) -> 'SplitTextOutput':
+        """
+        Merge outputs obtained for consecutive chunks of the same text.
+
+        Named characters are matched across chunks by their names.
+        Unknown characters ("c1", "c2", etc.) are enumerated by LLM independently in each chunk,
+        so they are relabeled to be unique in the merged output.
+        """
+        annotated_parts = []
+        n_unknown = 0
+        for out in outputs:
+            unknown_labels = sorted(
+                (c for c in out.characters if UNKNOWN_CHARACTER_LABEL_PATTERN.fullmatch(c)),
+                key=lambda c: int(c[1:]),
+            )
+            relabel = {label: f'c{n_unknown + i}' for i, label in enumerate(unknown_labels, 1)}
+            n_unknown += len(unknown_labels)
+
+            annotated = re.sub(
+                r'<(/?)(c\d+)>',
+                lambda m: f'<{m.group(1)}{relabel.get(m.group(2), m.group(2))}>',
+                out.text_annotated,
+            )
+            annotated_parts.append(annotated)
+
+        return cls(
+            text_raw=''.join(out.text_raw for out in outputs),
+            text_annotated=''.join(annotated_parts),
+        )
+
+    def to_excerpt(self, max_len: int) -> str:
+        """
+        Annotated text excerpt, containing phrases of all characters.
+        Phrases are selected in turns for each character, until `max_len` is reached,
+        and are kept in the original order.
+        Useful to describe characters to LLM when the whole text is too long.
+        """
+        character2phrase_ixs: dict[str, list[int]] = {}
+        for ix, phrase in enumerate(self.phrases):
+            character2phrase_ixs.setdefault(phrase.character, []).append(ix)
+
+        selected_ixs = set()
+        total_len = 0
+        for turn in range(max(map(len, character2phrase_ixs.values()), default=0)):
+            for phrase_ixs in character2phrase_ixs.values():
+                if turn >= len(phrase_ixs):
+                    continue
+                phrase = self.phrases[phrase_ixs[turn]]
+                phrase_len = len(phrase.text) + 2 * len(phrase.character) + 5
+                # NOTE: first phrase of each character is always included
+                if turn > 0 and total_len + phrase_len > max_len:
+                    continue
+                selected_ixs.add(phrase_ixs[turn])
+                total_len += phrase_len
+
+        return ''.join(
+            f'<{p.character}>{p.text}</{p.character}>'
+            for ix, p in enumerate(self.phrases)
+            if ix in selected_ixs
+        )
+
     def to_pretty_text(self):
         lines = []
         lines.append(f"characters: {self.characters}")
@@ -58,6 +177,7 @@ class SplitTextOutput(BaseModel):
         return res
 
 
+@cached_chain
 def create_split_text_chain(llm_model: GPTModels):
     llm = get_chat_llm(llm_model=llm_model, temperature=0.0)
 
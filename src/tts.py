@@ -1,17 +1,24 @@
+import asyncio
+import base64
+import json
 import typing as t
 from copy import deepcopy
 
 from dotenv import load_dotenv
 from elevenlabs import VoiceSettings
-from elevenlabs.client import AsyncElevenLabs
 
 load_dotenv()
 
-from src.config import ELEVENLABS_API_KEY, logger
+from src.cache import DiskCache
+from src.clients import CLIENTS
+from src.config import TTS_CACHE_DB_FP, TTS_CACHE_MAX_SIZE_MB, logger
+from src.rate_limit import ELEVENLABS_LIMITER
 from src.schemas import SoundEffectsParams, TTSParams, TTSTimestampsResponse
 from src.utils import auto_retry
 
-ELEVEN_CLIENT_ASYNC = AsyncElevenLabs(api_key=ELEVENLABS_API_KEY)
+TTS_CACHE = DiskCache(
+    db_fp=TTS_CACHE_DB_FP, max_size_bytes=TTS_CACHE_MAX_SIZE_MB * 1024 * 1024, name='tts-cache'
+)
 
 
 async def tts_astream(
@@ -30,7 +37,7 @@ async def tts_astream(
         f"request to 11labs TTS endpoint with params {params_all} "
         f'for the following text: "{text}"'
     )
-    async_iter = ELEVEN_CLIENT_ASYNC.text_to_speech.convert(**params_all)
+    async_iter = CLIENTS.elevenlabs.text_to_speech.convert(**params_all)
     async for chunk in async_iter:
         if chunk:
             yield chunk
@@ -42,8 +49,42 @@ async def tts_astream_consumed(voice_id: str, text: str, params: dict | None = N
     return [x async for x in aiterator]
 
 
-@auto_retry
+def _serialize_tts_response(response: TTSTimestampsResponse) -> bytes:
+    """
+    Pack alignments json and raw audio bytes into a single blob.
+    Raw audio takes ~25% less space than its base64 representation.
+    """
+    alignments = response.model_dump(mode='json', exclude={'audio_base64'})
+    # NOTE: json dump never contains raw null byte, so it's safe to use it as a separator
+    return json.dumps(alignments).encode('utf-8') + b'\0' + response.audio_bytes
+
+
+def _deserialize_tts_response(data: bytes) -> TTSTimestampsResponse:
+    alignments_json, audio_bytes = data.split(b'\0', maxsplit=1)
+    alignments = json.loads(alignments_json)
+    audio_base64 = base64.b64encode(audio_bytes).decode('ascii')
+    return TTSTimestampsResponse.model_validate(dict(audio_base64=audio_base64, **alignments))
+
+
 async def tts_w_timestamps(params: TTSParams) -> TTSTimestampsResponse:
+    """
+    Run TTS with timestamps, reusing responses cached on disk.
+    Cache key is a hash of all request params, including texts and contexts.
+    """
+    cache_key = TTS_CACHE.make_key(params.to_dict())
+    # NOTE: cache is read and written in a thread, not to block the event loop on disk I/O
+    cached = await asyncio.to_thread(TTS_CACHE.get, cache_key)
+    if cached is not None:
+        logger.info(f'tts cache hit for the following text: "{params.text}"')
+        return _deserialize_tts_response(cached)
+
+    res = await _tts_w_timestamps_no_cache(params=params)
+    await asyncio.to_thread(TTS_CACHE.set, cache_key, _serialize_tts_response(res))
+    return res
+
+
+@auto_retry
+async def _tts_w_timestamps_no_cache(params: TTSParams) -> TTSTimestampsResponse:
     async def _tts_w_timestamps(params: TTSParams) -> TTSTimestampsResponse:
         # NOTE: we need to use special `to_dict()` method to ensure pydantic model is converted
         # to dict with proper aliases
@@ -56,9 +97,10 @@ async def tts_w_timestamps(params: TTSParams) -> TTSTimestampsResponse:
             f'for the following text: "{text}"'
         )
 
-        response_raw = await ELEVEN_CLIENT_ASYNC.text_to_speech.convert_with_timestamps(
-            **params_dict
-        )
+        async with ELEVENLABS_LIMITER.limit(units=len(text)):
+            response_raw = await CLIENTS.elevenlabs.text_to_speech.convert_with_timestamps(
+                **params_dict
+            )
 
         response_parsed = TTSTimestampsResponse.model_validate(response_raw)
         return response_parsed
@@ -74,7 +116,7 @@ async def sound_generation_astream(params: SoundEffectsParams) -> t.AsyncIterato
         f'for the following text: "{params.text}"'
     )
 
-    async_iter = ELEVEN_CLIENT_ASYNC.text_to_sound_effects.convert(
+    async_iter = CLIENTS.elevenlabs.text_to_sound_effects.convert(
         text=params.text,
         duration_seconds=params.duration_seconds,
         prompt_influence=params.prompt_influence,
@@ -86,5 +128,6 @@ async def sound_generation_astream(params: SoundEffectsParams) -> t.AsyncIterato
 
 @auto_retry
 async def sound_generation_consumed(params: SoundEffectsParams):
-    aiterator = sound_generation_astream(params=params)
-    return [x async for x in aiterator]
+    async with ELEVENLABS_LIMITER.limit():
+        aiterator = sound_generation_astream(params=params)
+        return [x async for x in aiterator]
@@ -0,0 +1,149 @@
+import re
+import typing as t
+from functools import lru_cache
+from itertools import accumulate
+
+# word with surrounding whitespaces. context is trimmed only between such pieces
+WORD_PATTERN = re.compile(r'\s*\S+\s*')
+
+ContextLengthUnit = t.Literal['chars', 'tokens']
+
+
+@lru_cache(maxsize=1)
+def _get_tokenizer():
+    # NOTE: imported lazily, since tokens are counted only if token budget is requested
+    import tiktoken
+
+    return tiktoken.get_encoding('cl100k_base')
+
+
+def count_tokens(text: str) -> int:
+    return len(_get_tokenizer().encode(text, disallowed_special=()))
+
+
+def get_length_func(unit: ContextLengthUnit) -> t.Callable[[str], int]:
+    if unit == 'chars':
+        return len
+    if unit == 'tokens':
+        return count_tokens
+    raise ValueError(f'unknown context length unit: "{unit}"')
+
+
+def _get_chars_prefix(text: str, max_len: int) -> str:
+    """Longest prefix of whole words not exceeding `max_len` characters."""
+    prefix = text[:max_len]
+    if len(text) > max_len and not text[max_len].isspace():
+        # drop the cut word
+        m = re.match(r'.*\s', prefix, flags=re.DOTALL)
+        prefix = m.group() if m else ''
+    return prefix
+
+
+def _get_chars_suffix(text: str, max_len: int) -> str:
+    """Longest suffix of whole words not exceeding `max_len` characters."""
+    if max_len <= 0:
+        return ''
+    suffix = text[-max_len:]
+    if len(text) > max_len and not text[-max_len - 1].isspace():
+        # drop the cut word
+        m = re.search(r'\s', suffix)
+        suffix = suffix[m.start() :] if m else ''
+    return suffix
+
+
+class _WordSplit:
+    """
+    Text split into words, with length of each word. Used to trim text to a budget in tokens,
+    since tokens can't be sliced as characters. Computed once per text.
+    """
+
+    def __init__(self, text: str, length_func: t.Callable[[str], int]):
+        self.words = WORD_PATTERN.findall(text)
+        self.lengths = [length_func(w) for w in self.words]
+
+    def get_prefix(self, max_len: int) -> str:
+        """Longest prefix of whole words not exceeding `max_len`."""
+        total = 0
+        n = 0
+        for length in self.lengths:
+            if total + length > max_len:
+                break
+            total += length
+            n += 1
+        return ''.join(self.words[:n])
+
+    def get_suffix(self, max_len: int) -> str:
+        """Longest suffix of whole words not exceeding `max_len`."""
+        total = 0
+        n = 0
+        for length in reversed(self.lengths):
+            if total + length > max_len:
+                break
+            total += length
+            n += 1
+        return ''.join(self.words[len(self.words) - n :])
+
+
+def get_left_and_right_contexts(
+    texts: list[str],
+    max_len: int,
+    unit: ContextLengthUnit = 'chars',
+) -> list[tuple[str, str]]:
+    """
+    For each text return texts preceding and following it, each not longer than `max_len`.
+
+    Contexts consist of whole neighbour texts closest to the current one.
+    Neighbour which doesn't fit into the remaining budget is trimmed at word boundaries:
+    its ending is added to the left context, its beginning to the right context.
+
+    Runs in linear time: window boundaries are found with two pointers over cumulative
+    lengths, since they only move forward as the current text moves forward.
+    NOTE: length in tokens is a sum of token counts of each text, so it's approximate.
+    """
+    length_func = get_length_func(unit)
+    n = len(texts)
+    # cum_lengths[i] - total length of texts[:i]
+    cum_lengths = list(accumulate((length_func(text) for text in texts), initial=0))
+
+    # NOTE: only texts trimmed on the window boundary are split into words
+    word_splits: dict[int, _WordSplit] = {}
+
+    def _get_word_split(ix: int) -> _WordSplit:
+        if ix not in word_splits:
+            word_splits[ix] = _WordSplit(texts[ix], length_func=length_func)
+        return word_splits[ix]
+
+    def _get_prefix(ix: int, max_len: int) -> str:
+        if unit == 'chars':
+            return _get_chars_prefix(texts[ix], max_len=max_len)
+        return _get_word_split(ix).get_prefix(max_len)
+
+    def _get_suffix(ix: int, max_len: int) -> str:
+        if unit == 'chars':
+            return _get_chars_suffix(texts[ix], max_len=max_len)
+        return _get_word_split(ix).get_suffix(max_len)
+
+    contexts = []
+    # left context of i-th text: texts[left_start:i] with a trimmed texts[left_start - 1]
+    left_start = 0
+    # right context of i-th text: texts[i + 1:right_end] with a trimmed texts[right_end]
+    right_end = 0
+    for i in range(n):
+        while cum_lengths[i] - cum_lengths[left_start] > max_len:
+            left_start += 1
+        right_end = max(right_end, i + 1)
+        while right_end < n and cum_lengths[right_end + 1] - cum_lengths[i + 1] <= max_len:
+            right_end += 1
+
+        left_len = cum_lengths[i] - cum_lengths[left_start]
+        left_text = ''.join(texts[left_start:i])
+        if left_start > 0 and left_len < max_len:
+            left_text = _get_suffix(left_start - 1, max_len=max_len - left_len) + left_text
+
+        right_len = cum_lengths[right_end] - cum_lengths[i + 1]
+        right_text = ''.join(texts[i + 1 : right_end])
+        if right_end < n and right_len < max_len:
+            right_text += _get_prefix(right_end, max_len=max_len - right_len)
+
+        contexts.append((left_text, right_text))
+    return contexts
@@ -8,13 +8,26 @@ from collections.abc import Sized
 from enum import StrEnum
 from pathlib import Path
 
-import pandas as pd
 from httpx import Timeout
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
 from langchain_openai import ChatOpenAI
 from pydub import AudioSegment
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
-from src.config import logger, VOICES_CSV_FP
+from src.audio import AudioBuffer, MixEvent, mix
+from src.cache import DiskCache, LLMDiskCache
+from src.clients import CLIENTS
+from src.config import (
+    LLM_CACHE_DB_FP,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_SIZE_MB,
+    LLM_CACHE_TTL_SEC,
+    logger,
+)
+from src.rate_limit import OPENAI_LIMITER
+from src.voice_catalog import VOICE_CATALOG
 
 
 class GPTModels(StrEnum):
@@ -23,11 +36,63 @@ class GPTModels(StrEnum):
     GPT_4_TURBO_2024_04_09 = "gpt-4-turbo-2024-04-09"
 
 
-def get_chat_llm(llm_model: GPTModels, temperature=0.0):
-    llm = ChatOpenAI(
+LLM_CACHE = LLMDiskCache(
+    DiskCache(
+        db_fp=LLM_CACHE_DB_FP,
+        max_size_bytes=LLM_CACHE_MAX_SIZE_MB * 1024 * 1024,
+        name='llm-cache',
+        ttl_sec=LLM_CACHE_TTL_SEC,
+    )
+)
+
+
+class RateLimitedChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI sending requests through the process-wide `OPENAI_LIMITER`.
+    NOTE: langchain looks up the LLM cache before calling `_agenerate`,
+    so cached responses don't use rate limits and concurrency slots.
+    """
+
+    # expected number of output tokens per input token, used to estimate tokens of the request
+    output_tokens_ratio: float = 1.0
+
+    def _estimate_n_tokens(self, messages: list[BaseMessage]) -> int:
+        # NOTE: ~4 characters per token
+        n_input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        return int(n_input_tokens * (1 + self.output_tokens_ratio))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: t.Any,
+    ) -> ChatResult:
+        async with OPENAI_LIMITER.limit(units=self._estimate_n_tokens(messages)):
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def get_chat_llm(
+    llm_model: GPTModels,
+    temperature=0.0,
+    use_cache: bool = LLM_CACHE_ENABLED,
+    output_tokens_ratio: float = 1.0,
+):
+    """
+    NOTE: responses are cached on disk only if `use_cache` is True.
+    cache makes sense for deterministic (temperature=0) calls only.
+    NOTE: requests are sent via the shared connection pool, see `src.clients`,
+    and are rate limited on cache misses only.
+    `output_tokens_ratio` is the expected size of the output relative to the input.
+    """
+    llm = RateLimitedChatOpenAI(
         model=llm_model,
         temperature=temperature,
         timeout=Timeout(60, connect=4),
+        http_async_client=CLIENTS.openai_http,
+        # NOTE: False disables even the global langchain cache
+        cache=LLM_CACHE if use_cache else False,
+        output_tokens_ratio=output_tokens_ratio,
     )
     return llm
 
@@ -125,24 +190,20 @@ def overlay_multiple_audio(
     starts_sec: list[float],  # list of start positions, in seconds
     out_fp: str,
 ):
-    main_audio = AudioSegment.from_file(main_audio_fp)
-    for fp, cur_start_sec in zip(audios_to_overlay_fps, starts_sec):
-        audio_to_overlay = AudioSegment.from_file(fp)
-        # NOTE: quote from the documentation:
-        # "The result is always the same length as this AudioSegment"
-        # reference: https://github.com/jiaaro/pydub/blob/master/API.markdown#audiosegmentoverlay
-        # NOTE: `position` params is offset time in milliseconds
-        start_ms = int(cur_start_sec * 1000)
-        main_audio = main_audio.overlay(audio_to_overlay, position=start_ms)
-
-    logger.info(f'saving overlayed audio to: "{out_fp}"')
-    main_audio.export(out_fp, format='wav')
+    # NOTE: all clips are mixed over the main audio in a single pass.
+    # result has the same length as the main audio
+    main_audio = AudioBuffer.from_file(main_audio_fp)
+    events = [
+        MixEvent(clip=AudioBuffer.from_file(fp), start_sec=cur_start_sec)
+        for fp, cur_start_sec in zip(audios_to_overlay_fps, starts_sec)
+    ]
+    mixed = mix(main=main_audio, events=events)
+    mixed.write_wav(out_fp)
 
 
 def get_audio_from_voice_id(voice_id: str) -> str:
-    voices_df = pd.read_csv(VOICES_CSV_FP)
-    data = voices_df[voices_df["voice_id"] == voice_id]["preview_url"].values[0]
-    return data
+    # NOTE: voice chosen by user could be absent in the catalog
+    return VOICE_CATALOG.get_preview_url(voice_id) or ""
 
 
 def get_character_color(character: str) -> str:
@@ -0,0 +1,141 @@
+import itertools
+import os
+import threading
+import time
+
+import pandas as pd
+from pydantic import BaseModel
+
+from src.config import (
+    VOICE_CATALOG_RELOAD_CHECK_INTERVAL_SEC,
+    VOICES_CSV_FP,
+    VOICES_EXCLUDED_QUALITY_REVIEWS,
+    logger,
+)
+
+# voice properties available for filtering, in the order of `VoiceCatalog.find()` key
+INDEXED_PROPERTIES = ('gender', 'age_group', 'accent', 'category')
+
+
+class Voice(BaseModel):
+    voice_id: str
+    name: str
+    preview_url: str | None
+    gender: str | None
+    age_group: str | None
+    accent: str | None
+    category: str | None
+    quality_review: str | None
+
+
+def _read_voices(csv_fp: str) -> list[Voice]:
+    df = pd.read_csv(csv_fp, dtype=str, keep_default_na=False)
+    if 'manual_quality_review' not in df.columns:
+        df['manual_quality_review'] = ''
+    df['age'] = df['age'].str.replace(' ', '_').str.replace('-', '_')
+    return [
+        Voice(
+            voice_id=row['voice_id'],
+            name=row['name'],
+            # NOTE: empty values are treated as missing
+            preview_url=row['preview_url'] or None,
+            gender=row['gender'] or None,
+            age_group=row['age'] or None,
+            accent=row['accent'] or None,
+            category=row['category'] or None,
+            quality_review=row['manual_quality_review'] or None,
+        )
+        for row in df.to_dict(orient='records')
+    ]
+
+
+class _CatalogIndex:
+    def __init__(self, voices: list[Voice], excluded_quality_reviews: tuple[str, ...]):
+        # all voices, including excluded by quality review, e.g. to show voice preview
+        self.by_id: dict[str, Voice] = {voice.voice_id: voice for voice in voices}
+        self.available = tuple(
+            voice for voice in voices if voice.quality_review not in excluded_quality_reviews
+        )
+        # (gender, age_group, accent, category) -> available voices.
+        # each voice is added under every key with some of the properties replaced by None,
+        # so that any subset of properties is looked up in O(1)
+        self.by_props: dict[tuple, tuple[Voice, ...]] = {}
+        by_props: dict[tuple, list[Voice]] = {}
+        for voice in self.available:
+            values = tuple(getattr(voice, prop) for prop in INDEXED_PROPERTIES)
+            for mask in itertools.product((True, False), repeat=len(values)):
+                key = tuple(val if keep else None for val, keep in zip(values, mask))
+                by_props.setdefault(key, []).append(voice)
+        self.by_props = {key: tuple(voices) for key, voices in by_props.items()}
+
+
+class VoiceCatalog:
+    """
+    Process-wide catalog of voices available for characters, loaded from csv table.
+
+    Table is parsed once, and parsed again only if the file changes.
+    File modification is checked at most once in `reload_check_interval_sec`.
+    Voices are indexed by voice id and by any subset of their properties,
+    so lookups are O(1) and don't touch pandas.
+    Voices with excluded quality review are not offered as candidates,
+    but can be still looked up by id.
+    """
+
+    def __init__(
+        self,
+        csv_fp: str = VOICES_CSV_FP,
+        excluded_quality_reviews: tuple[str, ...] = VOICES_EXCLUDED_QUALITY_REVIEWS,
+        reload_check_interval_sec: float = VOICE_CATALOG_RELOAD_CHECK_INTERVAL_SEC,
+    ):
+        self.csv_fp = csv_fp
+        self.excluded_quality_reviews = excluded_quality_reviews
+        self.reload_check_interval_sec = reload_check_interval_sec
+        self._lock = threading.Lock()
+        self._index: _CatalogIndex | None = None
+        self._file_stat: tuple[int, int] | None = None
+        self._checked_at = 0.0
+
+    def _get_index(self) -> _CatalogIndex:
+        now = time.monotonic()
+        if self._index is not None and now - self._checked_at < self.reload_check_interval_sec:
+            return self._index
+        with self._lock:
+            self._checked_at = now
+            stat = os.stat(self.csv_fp)
+            file_stat = (stat.st_mtime_ns, stat.st_size)
+            if self._index is None or file_stat != self._file_stat:
+                logger.info(f'loading voice catalog from: "{self.csv_fp}"')
+                index = _CatalogIndex(
+                    _read_voices(self.csv_fp),
+                    excluded_quality_reviews=self.excluded_quality_reviews,
+                )
+                logger.info(
+                    f'voice catalog: {len(index.by_id)} voices, {len(index.available)} available'
+                )
+                self._index, self._file_stat = index, file_stat
+            return self._index
+
+    @property
+    def voices(self) -> tuple[Voice, ...]:
+        """Available voices."""
+        return self._get_index().available
+
+    def get(self, voice_id: str) -> Voice | None:
+        return self._get_index().by_id.get(voice_id)
+
+    def get_preview_url(self, voice_id: str) -> str | None:
+        voice = self.get(voice_id)
+        return voice.preview_url if voice is not None else None
+
+    def find(
+        self,
+        gender: str | None = None,
+        age_group: str | None = None,
+        accent: str | None = None,
+        category: str | None = None,
+    ) -> tuple[Voice, ...]:
+        """Available voices with given properties. `None` matches any value."""
+        return self._get_index().by_props.get((gender, age_group, accent, category), ())
+
+
+VOICE_CATALOG = VoiceCatalog()
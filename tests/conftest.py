@@ -0,0 +1,5 @@
+import os
+
+# NOTE: config requires API keys on import. tests never call the APIs
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ.setdefault('ELEVEN_LABS_API_KEY', 'test')
@@ -0,0 +1,53 @@
+import asyncio
+
+from src.builder import AudiobookBuilder
+from src.character_registry import CharacterRecord, CharacterRegistry
+from src.select_voice_chain import CharacterPropertiesNullable, SelectVoiceChainOutput
+from src.text_split_chain import SplitTextOutput
+
+
+class FakeVoiceMappingChain:
+    def __init__(self, output: SelectVoiceChainOutput):
+        self.output = output
+        self.inputs = []
+
+    async def ainvoke(self, inputs: dict, config=None) -> SelectVoiceChainOutput:
+        self.inputs.append(inputs)
+        return self.output
+
+
+def test_known_character_keeps_registered_voice(tmp_path, monkeypatch):
+    builder = AudiobookBuilder()
+    builder.character_registry = CharacterRegistry(db_fp=str(tmp_path / 'characters.sqlite'))
+    known_voice_id, other_voice_id, new_voice_id = [
+        voice.voice_id for voice in builder.voice_selector.catalog.voices[:3]
+    ]
+    known_props = CharacterPropertiesNullable(gender='female', age_group='old')
+    builder.character_registry.save(
+        series_id='series',
+        character2record={'Alice': CharacterRecord(props=known_props, voice_id=known_voice_id)},
+    )
+
+    # LLM is asked about "Bob" only, but returns "Alice" too, with other properties and voice
+    other_props = CharacterPropertiesNullable(gender='male', age_group='young')
+    chain = FakeVoiceMappingChain(
+        SelectVoiceChainOutput(
+            character2props={'Alice': other_props, 'Bob': other_props},
+            character2voice={'Alice': other_voice_id, 'Bob': new_voice_id},
+        )
+    )
+    monkeypatch.setattr(
+        builder.voice_selector, 'create_voice_mapping_chain', lambda llm_model: chain
+    )
+
+    text_split = SplitTextOutput(
+        text_raw='Hi. Hello.', text_annotated='<Alice>Hi.</Alice><Bob>Hello.</Bob>'
+    )
+    out = asyncio.run(builder._map_characters_to_voices(text_split, series_id='series'))
+
+    assert chain.inputs[0]['characters'] == ['Bob']
+    assert out.character2voice == {'Alice': known_voice_id, 'Bob': new_voice_id}
+    assert out.character2props['Alice'] == known_props
+    registered = builder.character_registry.get('series', ['Alice', 'Bob'])
+    assert registered['Alice'].voice_id == known_voice_id
+    assert registered['Bob'].voice_id == new_voice_id
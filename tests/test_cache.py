@@ -0,0 +1,37 @@
+import sqlite3
+
+from src.cache import DiskCache, get_total_size
+
+
+def test_total_size_is_tracked_on_replace_and_eviction(tmp_path):
+    cache = DiskCache(db_fp=str(tmp_path / 'cache.sqlite'), max_size_bytes=10)
+    cache.set('a', b'1234')
+    cache.set('b', b'1234')
+    # replaced value must not be counted twice
+    cache.set('a', b'123')
+    assert get_total_size(cache._get_conn(), table='entries') == 7
+
+    # least recently used entry is evicted
+    cache.set('c', b'1234')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'123'
+    assert get_total_size(cache._get_conn(), table='entries') == 7
+
+    cache.clear()
+    assert get_total_size(cache._get_conn(), table='entries') == 0
+
+
+def test_total_size_is_initialized_for_existing_db(tmp_path):
+    db_fp = str(tmp_path / 'cache.sqlite')
+    conn = sqlite3.connect(db_fp)
+    conn.execute(
+        'CREATE TABLE entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+        'created_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+    )
+    conn.execute("INSERT INTO entries VALUES ('a', x'0102', 2, 0, 0)")
+    conn.commit()
+    conn.close()
+
+    cache = DiskCache(db_fp=db_fp, max_size_bytes=10)
+    cache.set('b', b'123')
+    assert get_total_size(cache._get_conn(), table='entries') == 5
@@ -0,0 +1,80 @@
+import asyncio
+import os
+
+import pytest
+
+from src.builder import AudiobookBuilder
+from src.jobs import JobParams, JobQueue, JobStatus, JobWorker
+
+
+def test_failed_build_finishes_job_and_publishes_error(tmp_path, monkeypatch):
+    queue = JobQueue(db_fp=str(tmp_path / 'jobs.sqlite'))
+    job_id = queue.submit(JobParams(text='some text', generate_effects=False))
+    worker = JobWorker(queue=queue, max_concurrent_jobs=1)
+
+    async def _failing_run(*args, **kwargs):
+        raise RuntimeError('build failed')
+        yield
+
+    monkeypatch.setattr(worker.builder, 'run', _failing_run)
+
+    job = queue.claim(worker_id=worker.worker_id)
+    assert job is not None and job.id == job_id
+    asyncio.run(worker._run_job(job))
+
+    job = queue.get_job(job_id)
+    assert job.status == JobStatus.FAILED
+    assert job.error == 'build failed'
+
+    events = [data for _, data in queue.get_events(job_id)]
+    assert len(events) == 1
+    final_audio_fp, error_text, html, audio_chunk_fp = events[0]
+    assert final_audio_fp is None and audio_chunk_fp is None
+    assert error_text == 'build failed'
+    assert 'Failed to generate the audiobook' in html
+
+
+async def _run_until_cancelled(worker: JobWorker, job, cancel_job: bool) -> None:
+    task = asyncio.create_task(worker._run_job(job))
+    # let the build start and write its artifacts
+    await asyncio.sleep(0.05)
+    if cancel_job:
+        assert worker.queue.cancel(job.id)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def _make_worker_with_hanging_build(tmp_path, monkeypatch) -> JobWorker:
+    monkeypatch.chdir(tmp_path)
+    queue = JobQueue(db_fp=str(tmp_path / 'jobs.sqlite'))
+    worker = JobWorker(queue=queue, max_concurrent_jobs=1)
+
+    async def _hanging_run(*args, job_id: str, **kwargs):
+        checkpoints_dp = os.path.join(AudiobookBuilder.get_job_dp(job_id), 'checkpoints')
+        os.makedirs(checkpoints_dp, exist_ok=True)
+        await asyncio.sleep(60)
+        yield
+
+    monkeypatch.setattr(worker.builder, 'run', _hanging_run)
+    return worker
+
+
+@pytest.mark.parametrize('cancel_job', [True, False])
+def test_artifacts_are_removed_only_for_cancelled_job(tmp_path, monkeypatch, cancel_job):
+    worker = _make_worker_with_hanging_build(tmp_path, monkeypatch)
+    job_id = worker.queue.submit(JobParams(text='some text', generate_effects=False))
+    job = worker.queue.claim(worker_id=worker.worker_id)
+
+    asyncio.run(_run_until_cancelled(worker, job, cancel_job=cancel_job))
+
+    job_dp = AudiobookBuilder.get_job_dp(job_id)
+    if cancel_job:
+        assert worker.queue.get_job(job_id).status == JobStatus.CANCELLED
+        assert not os.path.exists(job_dp)
+    else:
+        # worker shutdown: job stays running, to be resumed from checkpoints by other worker
+        assert worker.queue.get_job(job_id).status == JobStatus.RUNNING
+        assert os.path.isdir(os.path.join(job_dp, 'checkpoints'))
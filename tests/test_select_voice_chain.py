@@ -0,0 +1,22 @@
+import asyncio
+import gc
+import weakref
+
+from src.select_voice_chain import VoiceSelector
+from src.utils import GPTModels
+
+
+def test_voice_mapping_chain_is_cached_per_selector():
+    async def _get_chains():
+        selector = VoiceSelector()
+        chain = selector.create_voice_mapping_chain(llm_model=GPTModels.GPT_4o)
+        assert selector.create_voice_mapping_chain(llm_model=GPTModels.GPT_4o) is chain
+
+        other_chain = VoiceSelector().create_voice_mapping_chain(llm_model=GPTModels.GPT_4o)
+        assert other_chain is not chain
+        return weakref.ref(selector)
+
+    selector_ref = asyncio.run(_get_chains())
+    gc.collect()
+    # selector isn't kept alive by process-wide caches
+    assert selector_ref() is None
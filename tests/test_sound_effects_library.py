@@ -0,0 +1,19 @@
+from src.cache import get_total_size
+from src.schemas import SoundEffectsParams
+from src.sound_effects_library import SoundEffectsLibrary
+
+
+def test_least_recently_used_clips_are_evicted(tmp_path):
+    library = SoundEffectsLibrary(db_fp=str(tmp_path / 'sound_effects.sqlite'), max_size_bytes=10)
+
+    def _params(text: str) -> SoundEffectsParams:
+        return SoundEffectsParams(text=text, duration_seconds=2.0, prompt_influence=0.5)
+
+    library.add(_params('door creaks'), duration_sec=2.0, audio_bytes=b'1234')
+    library.add(_params('dog barks'), duration_sec=2.0, audio_bytes=b'1234')
+    assert library.find(_params('creaking door')).audio_bytes == b'1234'
+
+    library.add(_params('rain falls'), duration_sec=2.0, audio_bytes=b'1234')
+    assert library.find(_params('dog barking')) is None
+    assert library.find(_params('door creaks')) is not None
+    assert get_total_size(library._get_conn(), table='clips') == 8
@@ -0,0 +1,39 @@
+import numpy as np
+
+from src.alignment_index import AlignmentIndex
+from src.schemas import TTSTimestampsAlignment
+from src.text_split_chain import SplitTextOutput
+
+
+def _get_alignment(text: str, char_duration_sec: float = 0.1) -> TTSTimestampsAlignment:
+    starts = np.arange(len(text)) * char_duration_sec
+    return TTSTimestampsAlignment(text=text, starts=starts, ends=starts + char_duration_sec)
+
+
+def test_whitespace_padded_phrases_are_coalesced_stripped():
+    text_raw = 'Hello.  How are you?  "Fine."'
+    text_split = SplitTextOutput(
+        text_raw=text_raw,
+        text_annotated='<a>Hello. </a><a> How are you?  </a><b>"Fine." </b>',
+    )
+    tts_phrases = text_split.coalesce_phrases(max_len=100)
+
+    # same texts as sent to TTS
+    assert [phrase.text for phrase in tts_phrases] == ['Hello. How are you?', '"Fine."']
+    phrase = tts_phrases[0]
+    assert phrase.text_offsets == [0, 7]
+    assert phrase.text_lengths == [6, 12]
+    assert phrase.get_separator_char_ixs() == [6]
+
+    alignments = [_get_alignment(phrase.text) for phrase in tts_phrases]
+    alignment_index = AlignmentIndex.build(
+        text=text_raw,
+        phrases=text_split.phrases,
+        tts_phrases=tts_phrases,
+        alignments=alignments,
+        durations_sec=[len(phrase.text) * 0.1 for phrase in tts_phrases],
+    )
+    # "How" is the 8th character of the first TTS phrase
+    assert np.isclose(alignment_index.get_start_time(text_raw.index('How')), 0.7)
+    # "Fine" is the 2nd character of the second TTS phrase, starting after the first one
+    assert np.isclose(alignment_index.get_start_time(text_raw.index('Fine')), 1.9 + 0.1)
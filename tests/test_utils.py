@@ -0,0 +1,39 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from langchain_core.caches import InMemoryCache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI
+
+from src import utils
+
+
+def test_llm_cache_hit_is_not_rate_limited(monkeypatch):
+    n_requests = 0
+    limited_units = []
+
+    async def fake_agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        nonlocal n_requests
+        n_requests += 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content='response'))])
+
+    @asynccontextmanager
+    async def fake_limit(units: float = 0):
+        limited_units.append(units)
+        yield
+
+    monkeypatch.setattr(ChatOpenAI, '_agenerate', fake_agenerate)
+    monkeypatch.setattr(utils.OPENAI_LIMITER, 'limit', fake_limit)
+
+    llm = utils.get_chat_llm(llm_model=utils.GPTModels.GPT_4o, use_cache=False)
+    llm.cache = InMemoryCache()
+
+    async def _invoke_twice():
+        for _ in range(2):
+            assert (await llm.ainvoke('x' * 400)).content == 'response'
+
+    asyncio.run(_invoke_twice())
+    assert n_requests == 1
+    # input and expected output tokens
+    assert limited_units == [200]